@@ -6,18 +6,10 @@ typedef int16_t MYINT;
 typedef int16_t MYITE;
 typedef uint16_t MYUINT;
 
-const int scaleForX = -12;
-
 const bool debugMode = false;
 
 const bool logProgramOutput = false;
 
-const int scalesForX[16] = {-12, -12, -12, -12, -12, -12, -12, -12, -12, -12, -12, -12};
-
-const int scaleForY = 0;
-
-const int scalesForY[16] = {0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0};
-
 //#define SATURATE
 //#define FASTAPPROX
 //#define FLOATEXP
\ No newline at end of file
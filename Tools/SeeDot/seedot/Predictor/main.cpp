@@ -3,7 +3,8 @@
 
 #include <iostream>
 #include <fstream>
-#include <sstream>
+#include <cstdio>
+#include <cstdint>
 #include <vector>
 #include <cstring>
 #include <cmath>
@@ -35,57 +36,73 @@ enum ProblemType
 
 bool profilingEnabled = false;
 
-// Split the CSV row into multiple values
-vector<string> readCSVLine(string line)
+// Reader of a dataset file written by the converter: a header of three int32
+// (number of rows, number of columns and the type of the values, 0 for int32
+// and 1 for double) followed by the values in row-major order, all in little
+// endian. The rows are read one at a time and returned as double
+class DatasetReader
 {
-	vector<string> tokens;
+public:
+	int rows, cols;
 
-	stringstream stream(line);
-	string str;
-
-	while (getline(stream, str, ','))
-		tokens.push_back(str);
-
-	return tokens;
-}
-
-vector<string> getFeatures(string line)
-{
-	static int featuresLength = -1;
-
-	vector<string> features = readCSVLine(line);
-
-	if (featuresLength == -1)
-		featuresLength = (int)features.size();
-
-	if ((int)features.size() != featuresLength)
-		throw "Number of row entries in X is inconsistent";
-
-	return features;
-}
+	DatasetReader(string fileName)
+	{
+		file = fopen(fileName.c_str(), "rb");
+		if (file == NULL)
+			throw "Input files doesn't exist";
 
-vector<string> getLabel(string line)
-{
-	static int labelLength = -1;
+		int32_t header[3];
+		if (fread(header, sizeof(int32_t), 3, file) != 3 || header[0] < 0 || header[1] < 0)
+		{
+			fclose(file);
+			throw "Malformed dataset file";
+		}
+		if (header[2] != 0 && header[2] != 1)
+		{
+			fclose(file);
+			throw "Unknown type of values in the dataset file";
+		}
 
-	vector<string> labels = readCSVLine(line);
+		rows = header[0];
+		cols = header[1];
+		type = header[2];
+		values.resize(cols);
+		if (type == 0)
+			intValues.resize(cols);
+	}
 
-	if (labelLength == -1)
-		labelLength = (int)labels.size();
+	~DatasetReader()
+	{
+		fclose(file);
+	}
 
-	if ((int)labels.size() != labelLength)
-		throw "Number of row entries in Y is inconsistent";
+	// Returns the next row, valid until the next call
+	const double *readRow()
+	{
+		if (type == 0)
+		{
+			if (fread(intValues.data(), sizeof(int32_t), cols, file) != (size_t)cols)
+				throw "Malformed dataset file";
+			for (int i = 0; i < cols; i++)
+				values[i] = (double)intValues[i];
+		}
+		else if (fread(values.data(), sizeof(double), cols, file) != (size_t)cols)
+			throw "Malformed dataset file";
+		return values.data();
+	}
 
-	return labels;
-}
+private:
+	FILE *file;
+	int type;
+	vector<double> values;
+	vector<int32_t> intValues;
+};
 
-void populateFixedVector(MYINT **features_int, vector<string> features, int scale)
+void populateFixedVector(MYINT **features_int, const double *features, int features_size, int scale)
 {
-	int features_size = (int)features.size();
-
 	for (int i = 0; i < features_size; i++)
 	{
-		double f = (double)(atof(features.at(i).c_str()));
+		double f = features[i];
 		double f_int = ldexp(f, -scale);
 		features_int[i][0] = (MYINT)(f_int);
 	}
@@ -93,11 +110,10 @@ void populateFixedVector(MYINT **features_int, vector<string> features, int scal
 	return;
 }
 
-void populateFloatVector(float **features_float, vector<string> features)
+void populateFloatVector(float **features_float, const double *features, int features_size)
 {
-	int features_size = (int)features.size();
 	for (int i = 0; i < features_size; i++)
-		features_float[i][0] = (float)(atof(features.at(i).c_str()));
+		features_float[i][0] = (float)(features[i]);
 	return;
 }
 
@@ -174,11 +190,13 @@ int main(int argc, char *argv[])
 	// Reading the dataset
 	string inputDir = "input/";
 
-	ifstream featuresFile(inputDir + "X.csv");
-	ifstream lablesFile(inputDir + "Y.csv");
+	DatasetReader featuresReader(inputDir + "X.bin");
+	DatasetReader labelsReader(inputDir + "Y.bin");
+	int numFeaturesRows = featuresReader.rows, numFeatures = featuresReader.cols;
+	int numLabelsRows = labelsReader.rows, numLabels = labelsReader.cols;
 
-	if (featuresFile.good() == false || lablesFile.good() == false)
-		throw "Input files doesn't exist";
+	if (numLabels < numOutputs)
+		throw "Number of row entries in Y is less than the number of outputs";
 
 	// Create output directory and files
 	string outputDir = "output/" + versionStr;
@@ -207,34 +225,33 @@ int main(int argc, char *argv[])
 
 	MYINT*** features_intV_copy;
 
-	string line1, line2;
 	int counter = 0;
 
 	if(version == Float)
 		profilingEnabled = true;
 
-	while (getline(featuresFile, line1) && getline(lablesFile, line2))
+	while (counter < numFeaturesRows && counter < numLabelsRows)
 	{
 		// Read the feature vector and class ID
-		vector<string> features = getFeatures(line1);
-		vector<string> labelString = getLabel(line2);
+		const double *features = featuresReader.readRow();
+		const double *labelValues = labelsReader.readRow();
 		int32_t* labelInt = new int32_t[numOutputs];
 		float* labelFloat = new float[numOutputs];
 
 		if (problem == Classification) {
 			for (int i = 0; i < numOutputs; i++) {
-				labelInt[i] = atoi(labelString[i].c_str());
+				labelInt[i] = (int32_t)labelValues[i];
 			}
 		} else if (problem == Regression) {
 			for (int i = 0; i < numOutputs; i++) {
-				labelFloat[i] = atof(labelString[i].c_str());
+				labelFloat[i] = (float)labelValues[i];
 			}
 		}
 
 		// Allocate memory to store the feature vector as arrays
 		if (alloc == false)
 		{
-			features_size = (int)features.size();
+			features_size = numFeatures;
 
 			features_int = new MYINT *[features_size];
 			for (int i = 0; i < features_size; i++)
@@ -256,14 +273,14 @@ int main(int argc, char *argv[])
 		// Populate the array using the feature vector
 		if (debugMode || version == Fixed)
 		{
-			populateFixedVector(features_int, features, scaleForX);
+			populateFixedVector(features_int, features, features_size, scaleForX);
 			for (int i = 0; i < switches; i++) {
-				populateFixedVector(features_intV[i], features, scalesForX[i]);
+				populateFixedVector(features_intV[i], features, features_size, scalesForX[i]);
 			}
-			populateFloatVector(features_float, features);
+			populateFloatVector(features_float, features, features_size);
 		}
 		else
-			populateFloatVector(features_float, features);
+			populateFloatVector(features_float, features, features_size);
 
 		// Invoke the predictor function
 		int* fixed_res = NULL;
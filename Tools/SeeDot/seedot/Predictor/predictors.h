@@ -7,4 +7,9 @@ void seedotFixed(MYINT **X, int32_t* res);
 void seedotFloat(float **X, float* res);
 void seedotFixedSwitch(int i, MYINT** X, int32_t* res);
 
-extern const int switches;
\ No newline at end of file
+extern const int switches;
+
+extern const int scaleForX;
+extern const int scalesForX[];
+extern const int scaleForY;
+extern const int scalesForY[];
\ No newline at end of file
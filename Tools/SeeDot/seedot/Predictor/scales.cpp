@@ -0,0 +1,12 @@
+#include <cstdint>
+
+#include "datatypes.h"
+#include "predictors.h"
+
+const int scaleForX = -12;
+
+const int scalesForX[16] = {-12, -12, -12, -12, -12, -12, -12, -12, -12, -12, -12, -12};
+
+const int scaleForY = 0;
+
+const int scalesForY[16] = {0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0};
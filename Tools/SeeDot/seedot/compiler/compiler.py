@@ -3,6 +3,8 @@
 
 import antlr4 as antlr
 import argparse
+import copy
+import hashlib
 import os
 import pickle
 
@@ -31,6 +33,11 @@ import seedot.writer as writer
 
 import seedot.config as config
 
+# Typed ASTs keyed by (input file, hash of its contents, source), filled by
+# Compiler.getTypedAST so that the scale factor search parses and infers
+# types once per model instead of once per compilation
+typedASTCache = {}
+
 class Compiler:
 
     def __init__(self, algo, version, target, inputFile, outputDir, profileLogFile, maxScale, source, outputLogFile, generateAllFiles=True, id=None, printSwitch=-1, substitutions={}, scaleForX=None, variableToBitwidthMap={}, sparseMatrixSizes={}, demotedVarsList=[], demotedVarsOffsets={}):
@@ -88,19 +95,35 @@ class Compiler:
             #	ast = pickle.load(file)
             return ast
 
-    def run(self):
-        ast = self.genAST(self.input)
+    def getTypedAST(self):
+        # Parse the input and perform type inference once per input file,
+        # IRBuilder annotates the AST so every compilation gets its own copy
+        with open(self.input, 'rb') as file:
+            digest = hashlib.sha1(file.read()).hexdigest()
+        key = (os.path.abspath(self.input), digest, self.source)
+
+        if key not in typedASTCache:
+            ast = self.genAST(self.input)
+
+            # Pretty printing AST
+            # printAST.PrintAST().visit(ast)
 
-        # Pretty printing AST
-        # printAST.PrintAST().visit(ast)
+            # Perform type inference
+            type.InferType().visit(ast)
+            typedASTCache[key] = ast
 
-        # Perform type inference
-        type.InferType().visit(ast)
+        return copy.deepcopy(typedASTCache[key])
+
+    def run(self):
+        ast = self.getTypedAST()
 
         irUtil.init()
 
         res, state = self.compile(ast)
 
+        # Kept for simulating the generated code without building it
+        self.ir = (res, state)
+
         if util.forArduino():
             codegen = arduino.Arduino(self.outputDir, *state)
         elif util.forX86():
@@ -59,8 +59,13 @@ class Quantizer:
         self.X, self.Y = readXandY(numOutputs=self.numOutputs)
 
     def writeDataset(self):
-        writeMatAsCSV(self.X, os.path.join(getDatasetOutputDir(), "X.csv"))
-        writeMatAsCSV(self.Y, os.path.join(getDatasetOutputDir(), "Y.csv"))
+        # The Predictor reads the dataset in binary, the Arduino Streamer in CSV
+        if forX86():
+            writeMatAsBinary(self.X, os.path.join(getDatasetOutputDir(), "X.bin"))
+            writeMatAsBinary(self.Y, os.path.join(getDatasetOutputDir(), "Y.bin"))
+        else:
+            writeMatAsCSV(self.X, os.path.join(getDatasetOutputDir(), "X.csv"))
+            writeMatAsCSV(self.Y, os.path.join(getDatasetOutputDir(), "Y.csv"))
 
     def processDataset(self):
         self.readDataset()
@@ -355,6 +355,36 @@ def writeMatToFile(mat, fileName: str, delimiter):
             file.write("\n")
 
 
+def writeMatAsBinary(mat, fileName: str):
+    '''
+    Writes the matrix in the binary format read by the Predictor: a header of
+    three little-endian int32 (number of rows, number of columns and the type
+    of the values, 0 for int32 and 1 for double) followed by the values in
+    row-major order
+    '''
+    m, n = matShape(mat)
+    dataType, _ = getDataType(mat[0][0])
+
+    if dataType == 'MYINT':
+        typeCode, dtype = 0, '<i4'
+    else:
+        typeCode, dtype = 1, '<f8'
+
+    with open(fileName, 'wb') as file:
+        np.array([m, n, typeCode], dtype='<i4').tofile(file)
+        np.array(mat, dtype=dtype).tofile(file)
+
+
+def readMatAsBinary(fileName: str):
+    '''
+    Reads a matrix written by writeMatAsBinary as a numpy array
+    '''
+    with open(fileName, 'rb') as file:
+        m, n, typeCode = np.fromfile(file, dtype='<i4', count=3)
+        dtype = '<i4' if typeCode == 0 else '<f8'
+        return np.fromfile(file, dtype=dtype, count=m * n).reshape(m, n)
+
+
 def writeMatAsArray(mat, name: str, fileName: str, shapeStr=None, bw=None):
     m, n = matShape(mat)
 
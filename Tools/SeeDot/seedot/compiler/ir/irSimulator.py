@@ -0,0 +1,884 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+'''
+IRSimulator evaluates the IR.Prog generated by IRBuilder with NumPy on a whole
+dataset at once. It follows the semantics of the C++ code printed by the X86
+codegen and of the library in the Predictor project (integer division for
+shifts, wrap around and saturation at the bitwidth of every variable, tree
+sum, exp tables) so that the scale factor search can rank the candidate codes
+without building and running the Predictor.
+
+Every variable is a NumPy array of shape (1, size) while its value is the same
+for all the data points and of shape (N, size) once it depends on the input.
+Conditions which depend on the input are evaluated with a mask over the data
+points. Intermediate integer expressions are evaluated with 64 bits.
+'''
+
+import os
+import re
+
+import numpy as np
+
+import seedot.compiler.ir.ir as IR
+
+import seedot.config as config
+import seedot.compiler.type as Type
+import seedot.util as Util
+
+# Arrays parsed from the model and library headers, keyed by (path, mtime)
+headerCache = {}
+
+# Number of elements of the intermediate arrays of the kernels
+chunkSize = 1 << 22
+
+arrayPattern = re.compile(
+    r'const\s+(?:PROGMEM\s+)?(\w+)\s+(\w+)((?:\[\d+\])+)\s*=\s*\{([^}]*)\};')
+scalarPattern = re.compile(
+    r'const\s+(\w+)\s+(\w+)\s*=\s*([-+.\w]+)\s*;')
+
+
+def readHeader(path):
+    '''
+    Returns dict name -> (C type, flat numpy array) of the constants of a
+    model_*.h or library_*.h file, the _temp suffix of the VBW model
+    parameters is removed
+    '''
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    if key not in headerCache:
+        with open(path, 'r') as file:
+            content = file.read()
+
+        arrays = {}
+        for typ, name, _, values in arrayPattern.findall(content):
+            values = values.replace('f', '').replace(',', ' ').split()
+            if name.endswith("_temp"):
+                name = name[:-len("_temp")]
+            if typ == "float":
+                arrays[name] = (typ, np.array(values, dtype=np.float32))
+            else:
+                arrays[name] = (typ, np.array(values, dtype=np.int64))
+        for typ, name, value in scalarPattern.findall(content):
+            if typ == "float":
+                arrays[name] = (typ, np.array([value.rstrip('f')], dtype=np.float32))
+            else:
+                arrays[name] = (typ, np.array([value], dtype=np.int64))
+
+        headerCache[key] = arrays
+    return headerCache[key]
+
+
+def getBitwidth(typ):
+    '''
+    Bitwidth of a C integer type, None for float
+    '''
+    if typ == "float":
+        return None
+    if typ == "MYINT":
+        return config.wordLength
+    if typ == "int":
+        return 32
+    if typ == "MYITE":
+        return 16
+    match = re.match(r'u?int(\d+)_t$', typ)
+    if match is None:
+        raise NotImplementedError("Simulation of type %s is not supported" % typ)
+    return int(match.group(1))
+
+
+def isBatch(value):
+    return isinstance(value, np.ndarray) and value.ndim > 0
+
+
+def isFloat(value):
+    if isinstance(value, np.ndarray):
+        return value.dtype.kind == 'f'
+    return isinstance(value, (float, np.floating))
+
+
+def wrap(value, bitwidth):
+    '''
+    Two's complement wrap around of an integer to bitwidth bits
+    '''
+    if bitwidth >= 64:
+        return value
+    half = 1 << (bitwidth - 1)
+    if isBatch(value):
+        return ((value + half) & ((1 << bitwidth) - 1)) - half
+    return ((int(value) + half) & ((1 << bitwidth) - 1)) - half
+
+
+def castFloat(value, bitwidth):
+    '''
+    C conversion of a float to an integer of bitwidth bits on x86, values
+    outside of int32 become INT_MIN before the truncation to bitwidth
+    '''
+    value = np.trunc(np.asarray(value, dtype=np.float64))
+    invalid = ~((value >= -2.0 ** 31) & (value < 2.0 ** 31))
+    value = np.where(invalid, -2.0 ** 31, value).astype(np.int64)
+    if bitwidth > 32:
+        value = np.where(invalid, np.iinfo(np.int64).min, value)
+    value = wrap(value, min(bitwidth, 32))
+    return value if value.ndim > 0 else int(value)
+
+
+def cdiv(a, b):
+    '''
+    C integer division, rounds towards zero
+    '''
+    if not isBatch(a) and not isBatch(b):
+        a, b = int(a), int(b)
+        if b == 0:
+            raise ZeroDivisionError("Division by zero in the simulated program")
+        q = abs(a) // abs(b)
+        return -q if (a < 0) != (b < 0) else q
+    if np.any(np.asarray(b) == 0):
+        raise ZeroDivisionError("Division by zero in the simulated program")
+    q = np.abs(a) // np.abs(b)
+    return np.where((np.asarray(a) < 0) != (np.asarray(b) < 0), -q, q)
+
+
+def saturate(value, bitwidth):
+    '''
+    Saturate<TypeC>(int32_t) of library_fixed.h
+    '''
+    value = wrap(value, 32)
+    if Util.isSaturate() and bitwidth <= 16:
+        value = np.clip(value, -(1 << (bitwidth - 1)), (1 << (bitwidth - 1)) - 1)
+    return wrap(value, bitwidth)
+
+
+def toFloat(value):
+    if isBatch(value):
+        return value.astype(np.float32)
+    return np.float32(value)
+
+
+class IRSimulator:
+
+    def __init__(self, prog: IR.Prog, expr: IR.Expr, state, version, scaleForX, modelFile, libraryFile=None):
+        '''
+        prog, expr, state: the output of Compiler.compile for the code
+        version: config.Version.fixed or config.Version.floatt
+        scaleForX: scale of the input, used to convert the features to fixed
+            point as populateFixedVector of the Predictor
+        modelFile: model_fixed.h or model_float.h written by the Converter
+        libraryFile: library_fixed.h, only needed for the new table exp
+        '''
+        (self.decls, self.localDecls, _, _, self.cnsts, self.expTables, self.globalVars,
+         self.internalVars, self.floatConstants, _, self.demotedVarsOffsets,
+         self.varsForBitwidth, _, _) = state
+
+        self.prog = prog
+        self.expr = expr
+        self.fixed = version == config.Version.fixed
+        self.vbwEnabled = config.vbwEnabled and self.fixed
+        self.scaleForX = scaleForX
+        self.model = readHeader(modelFile)
+        self.library = readHeader(libraryFile) if libraryFile is not None else {}
+
+        if self.fixed:
+            self.floatExp = Util.useMathExp()
+        else:
+            self.floatExp = Util.useMathExp() or Util.useNewTableExp()
+
+        self.shapes = {}
+        self.types = {}
+        for decl, typ in self.decls.items():
+            self.declare(decl, typ, self.getDeclType(decl))
+
+    # Declarations
+
+    def getDeclType(self, decl):
+        # C type of the variables as printed by X86.printVarDecls and
+        # X86.printModelParamsWithBitwidth
+        if decl in self.globalVars or decl == 'X':
+            if not self.fixed:
+                return self.model[decl][0] if decl in self.model else "float"
+            if self.vbwEnabled:
+                return "int%d_t" % self.varsForBitwidth.get(decl, config.wordLength)
+            return "MYINT"
+        if not self.fixed:
+            return "MYINT" if decl in self.internalVars else "float"
+        if decl in self.internalVars or not self.vbwEnabled:
+            return "MYINT"
+        return "int%d_t" % self.varsForBitwidth.get(decl, config.wordLength)
+
+    def getLocalDeclType(self, decl):
+        # C type of the variables as printed by CodegenBase.printLocalVarDecls
+        if not self.fixed and decl not in self.internalVars:
+            return "float"
+        if self.vbwEnabled and decl in self.varsForBitwidth:
+            return "int%d_t" % self.varsForBitwidth[decl]
+        return "MYINT"
+
+    def declare(self, decl, typ, cType):
+        if Type.isTensor(typ):
+            self.shapes[decl] = list(typ.shape)
+        else:
+            self.shapes[decl] = []
+        self.types[decl] = getBitwidth(cType)
+
+    def declareLocals(self, varDecls):
+        for decl, typ in varDecls.items():
+            if decl not in self.types:
+                self.declare(decl, typ, self.getLocalDeclType(decl))
+
+    # Memory
+
+    def getArray(self, name):
+        if name not in self.mem:
+            if name not in self.types:
+                self.shapes[name] = []
+                self.types[name] = config.wordLength if self.fixed else None
+            size = int(np.prod(self.shapes[name])) if len(self.shapes[name]) > 0 else 1
+            dtype = np.int64 if self.types[name] is not None else np.float32
+            self.mem[name] = np.zeros((1, size), dtype=dtype)
+        return self.mem[name]
+
+    def convert(self, name, value):
+        # Implicit conversion of C when a value is stored in the variable
+        bitwidth = self.types[name]
+        if bitwidth is None:
+            return toFloat(value)
+        if isFloat(value):
+            return castFloat(value, bitwidth)
+        return wrap(value, bitwidth)
+
+    def getOffset(self, var: IR.Var):
+        shape = self.shapes.get(var.idf, [])
+        offset = 0
+        for i, e in enumerate(var.idx):
+            index = self.eval(e)
+            stride = int(np.prod(shape[i + 1:])) if i + 1 < len(shape) else 1
+            offset = offset + index * stride
+        return offset
+
+    def expand(self, name):
+        # Gives one row per data point to a variable which is being assigned
+        # values dependent on the input
+        arr = self.mem[name]
+        if arr.shape[0] == 1:
+            arr = np.repeat(arr, self.N, axis=0)
+            self.mem[name] = arr
+        return arr
+
+    def read(self, var: IR.Var):
+        if not var.idx and var.idf in self.iters:
+            return self.iters[var.idf]
+        arr = self.getArray(var.idf)
+        offset = self.getOffset(var)
+        if isBatch(offset):
+            if arr.shape[0] == 1:
+                return arr[0, offset]
+            return arr[np.arange(self.N), offset]
+        column = arr[:, offset]
+        return column[0] if arr.shape[0] == 1 else column
+
+    def write(self, var: IR.Var, value):
+        arr = self.getArray(var.idf)
+        offset = self.getOffset(var)
+        value = self.convert(var.idf, value)
+        if isBatch(value) or isBatch(offset) or self.mask is not None:
+            arr = self.expand(var.idf)
+        if isBatch(offset):
+            rows = np.arange(self.N)
+            if self.mask is not None:
+                rows, offset = rows[self.mask], offset[self.mask]
+                value = value[self.mask] if isBatch(value) else value
+            arr[rows, offset] = value
+        elif self.mask is not None:
+            arr[self.mask, offset] = value[self.mask] if isBatch(value) else value
+        else:
+            arr[:, offset] = value
+
+    def pointer(self, var: IR.Var):
+        offset = self.getOffset(var)
+        if isBatch(offset):
+            raise NotImplementedError("Pointers with an input dependent offset are not supported")
+        return (var.idf, int(offset))
+
+    def load(self, ptr, count):
+        name, offset = ptr
+        return self.getArray(name)[:, offset:offset + count]
+
+    def store(self, ptr, values):
+        name, offset = ptr
+        arr = self.getArray(name)
+        values = self.convert(name, values)
+        count = values.shape[-1]
+        if values.shape[0] != 1 or self.mask is not None:
+            arr = self.expand(name)
+        if self.mask is not None:
+            values = np.broadcast_to(values, (self.N, count))
+            arr[self.mask, offset:offset + count] = values[self.mask]
+        else:
+            arr[:, offset:offset + count] = values
+
+    # Expressions
+
+    def eval(self, e):
+        if isinstance(e, IR.Int):
+            return int(e.n)
+        elif isinstance(e, IR.Float):
+            # The codegen prints floats with 6 decimals
+            return np.float32(float('%f' % e.n))
+        elif isinstance(e, IR.Var):
+            return self.read(e)
+        elif isinstance(e, IR.Bool):
+            return e.b
+        elif isinstance(e, IR.IntUop):
+            value = self.eval(e.e)
+            return -value if e.op == IR.Op.Op['-'] else ~value
+        elif isinstance(e, IR.IntBop):
+            return self.evalIntBop(e.op.name, self.eval(e.e1), self.eval(e.e2))
+        elif isinstance(e, IR.BoolUop):
+            value = self.eval(e.e)
+            return ~value if isBatch(value) else not value
+        elif isinstance(e, IR.BoolBop):
+            e1, e2 = self.eval(e.e1), self.eval(e.e2)
+            if e.op == IR.Op.Op['&&']:
+                return np.logical_and(e1, e2) if isBatch(e1) or isBatch(e2) else bool(e1 and e2)
+            return np.logical_or(e1, e2) if isBatch(e1) or isBatch(e2) else bool(e1 or e2)
+        elif isinstance(e, IR.BoolCop):
+            e1, e2 = self.eval(e.e1), self.eval(e.e2)
+            res = {
+                '<': lambda a, b: a < b,
+                '<=': lambda a, b: a <= b,
+                '>': lambda a, b: a > b,
+                '>=': lambda a, b: a >= b,
+                '==': lambda a, b: a == b,
+                '!=': lambda a, b: a != b
+            }[e.op.name](e1, e2)
+            return res if isBatch(res) else bool(res)
+        elif isinstance(e, IR.CExpr):
+            cond = self.eval(e.cond)
+            if not isBatch(cond):
+                return self.eval(e.et) if cond else self.eval(e.ef)
+            et, ef = self.eval(e.et), self.eval(e.ef)
+            if isFloat(et) or isFloat(ef):
+                et, ef = toFloat(et), toFloat(ef)
+            return np.where(cond, et, ef)
+        elif isinstance(e, IR.Exp):
+            return np.exp(toFloat(self.eval(e.e)))
+        elif isinstance(e, IR.TypeCast):
+            value = self.eval(e.expr)
+            if e.type == "float":
+                return toFloat(value)
+            bitwidth = getBitwidth(e.type)
+            return castFloat(value, bitwidth) if isFloat(value) else wrap(value, bitwidth)
+        else:
+            raise NotImplementedError("Simulation of %s is not supported" % type(e).__name__)
+
+    def evalIntBop(self, op, e1, e2):
+        if isFloat(e1) or isFloat(e2):
+            e1, e2 = toFloat(e1), toFloat(e2)
+            if op == '+':
+                return e1 + e2
+            elif op == '-':
+                return e1 - e2
+            elif op == '*':
+                return e1 * e2
+            elif op == '/':
+                return e1 / e2
+            raise NotImplementedError("Operator %s on floats is not supported" % op)
+        if op == '+':
+            return e1 + e2
+        elif op == '-':
+            return e1 - e2
+        elif op == '*':
+            return e1 * e2
+        elif op == '/':
+            return cdiv(e1, e2)
+        elif op == '<<':
+            return e1 << e2
+        elif op == '>>':
+            return e1 >> e2
+        elif op == '&':
+            return e1 & e2
+        elif op == '|':
+            return e1 | e2
+        elif op == '^':
+            return e1 ^ e2
+        raise NotImplementedError("Operator %s is not supported" % op)
+
+    # Commands
+
+    def runCmds(self, cmds):
+        for cmd in cmds:
+            self.runCmd(cmd)
+
+    def runMasked(self, cond, cmds):
+        # Runs cmds only for the data points where cond holds
+        prevMask = self.mask
+        mask = cond if prevMask is None else (prevMask & cond)
+        if np.any(mask):
+            self.mask = mask
+            self.runCmds(cmds)
+        self.mask = prevMask
+
+    def runCmd(self, cmd):
+        if isinstance(cmd, IR.Assn):
+            self.write(cmd.var, self.eval(cmd.e))
+        elif isinstance(cmd, IR.If):
+            cond = self.eval(cmd.cond)
+            if isBatch(cond):
+                self.runMasked(cond, cmd.trueCmds)
+                self.runMasked(~cond, cmd.falseCmds)
+            elif cond:
+                self.runCmds(cmd.trueCmds)
+            else:
+                self.runCmds(cmd.falseCmds)
+        elif isinstance(cmd, IR.For):
+            self.declareLocals(cmd.varDecls)
+            idf = cmd.var.idf
+            prev = self.iters.get(idf)
+            self.iters[idf] = int(cmd.st)
+            while True:
+                cond = self.eval(cmd.cond)
+                if isBatch(cond):
+                    raise NotImplementedError("Loops with an input dependent bound are not supported")
+                if not cond:
+                    break
+                self.runCmds(cmd.cmd_l)
+                self.iters[idf] += 1
+            if prev is None:
+                del self.iters[idf]
+            else:
+                self.iters[idf] = prev
+        elif isinstance(cmd, IR.While):
+            prevMask = self.mask
+            while True:
+                cond = self.eval(cmd.expr)
+                if not isBatch(cond):
+                    if not cond:
+                        break
+                    self.runCmds(cmd.cmds)
+                    continue
+                mask = cond if self.mask is None else (self.mask & cond)
+                if not np.any(mask):
+                    break
+                self.mask = mask
+                self.runCmds(cmd.cmds)
+            self.mask = prevMask
+        elif isinstance(cmd, IR.FuncCall):
+            self.declareLocals(cmd.varDecls)
+            self.runFuncCall(cmd)
+        elif isinstance(cmd, IR.Memset):
+            name, offset = self.pointer(cmd.e)
+            arr = self.getArray(name)
+            self.store((name, offset), np.zeros((1, cmd.len), dtype=arr.dtype))
+        elif isinstance(cmd, (IR.Comment, IR.Print, IR.PrintAsFloat)):
+            pass
+        elif isinstance(cmd, IR.Prog):
+            self.runCmds(cmd.cmd_l)
+        else:
+            raise NotImplementedError("Simulation of %s is not supported" % type(cmd).__name__)
+
+    # Function calls
+
+    def getArg(self, arg):
+        # Same rule as CodegenBase.printFuncCall for passing a pointer
+        if isinstance(arg, IR.Var) and (arg.idf in self.decls or arg.idf in self.localDecls):
+            typ = self.decls[arg.idf] if arg.idf in self.decls else self.localDecls[arg.idf]
+            if arg.idf == 'X' or not Type.isTensor(typ) or typ.dim == 0 or typ.dim != len(arg.idx):
+                return self.pointer(arg)
+        elif isinstance(arg, IR.Var) and arg.idf in self.types and not arg.idx and arg.idf not in self.iters:
+            return self.pointer(arg)
+        if isinstance(arg, IR.String):
+            return None
+        return self.eval(arg)
+
+    def runFuncCall(self, cmd: IR.FuncCall):
+        match = re.match(r'^(\w+?)(?:<(.*)>)?$', cmd.name.replace(' ', ''))
+        name, template = match.group(1), match.group(2)
+        types = None
+        if template is not None and template != "0":
+            types = [getBitwidth(t) for t in template.split(',')]
+        args = [self.getArg(arg) for arg in cmd.argList]
+
+        if name in ["Profile2", "Profile4", "checkRange2", "updateRange"]:
+            return
+
+        if self.fixed and types is None and Util.isfastApprox():
+            raise NotImplementedError("Simulation with FASTAPPROX is not supported")
+
+        kernel = getattr(self, "kernel" + name, None)
+        if kernel is None:
+            for prefix in ["MatAdd", "MatSub", "MatMul", "ExpNew", "SigmoidNew", "TanHNew"]:
+                if name.startswith(prefix):
+                    kernel = getattr(self, "kernel" + prefix)
+                    break
+        if kernel is None:
+            raise NotImplementedError("Simulation of function %s is not supported" % name)
+        kernel(name, types, *args)
+
+    def myint(self, value):
+        return wrap(value, config.wordLength)
+
+    def getTemp(self, types, k):
+        # Wraps to TypeTemp of the templated kernels, the non templated ones
+        # compute the intermediate values in int
+        if types is None:
+            return lambda value: value
+        return lambda value: wrap(value, types[k])
+
+    def getOut(self, types, k):
+        return types[k] if types is not None else config.wordLength
+
+    def rows(self, *arrays):
+        return max(arr.shape[0] for arr in arrays)
+
+    def kernelMatAdd(self, name, types, A, B, C, I, J, shrA, shrB, shrC, demote=1):
+        count = I * J
+        if self.fixed:
+            shrA, shrC, demote = self.myint(shrA), self.myint(shrC), self.myint(demote)
+            shrB = wrap(shrB, 32) if name == "MatSub" else self.myint(shrB)
+        a = self.load(A, 1 if name.endswith("BroadCastA") else count)
+        b = self.load(B, 1 if name.endswith("BroadCastB") else count)
+        sub = name.startswith("MatSub")
+        if not self.fixed:
+            self.store(C, a - b if sub else a + b)
+            return
+        temp = self.getTemp(types, 2)
+        a = temp(cdiv(a, shrA))
+        b = temp(cdiv(b, shrB))
+        c = temp(cdiv(a, shrC) - cdiv(b, shrC) if sub else cdiv(a, shrC) + cdiv(b, shrC))
+        self.store(C, saturate(cdiv(c, demote), self.getOut(types, 3)))
+
+    kernelMatSub = kernelMatAdd
+
+    def treeSum(self, tmp, H1, H2, shift, temp):
+        # Tree sum over the last axis as in the MatMul kernels
+        count = tmp.shape[-1]
+        for depth in range(H1 + H2):
+            shr = shift and depth < H1
+            half = count >> 1
+            even, odd = tmp[..., 0:2 * half:2], tmp[..., 1:2 * half:2]
+            if shr:
+                pairs = cdiv(even, 2) + cdiv(odd, 2)
+            else:
+                pairs = even + odd
+            if count & 1:
+                last = tmp[..., 2 * half:2 * half + 1]
+                if shr:
+                    last = cdiv(last, 2)
+                pairs = np.concatenate([pairs, last], axis=-1)
+            tmp = temp(pairs)
+            count = (count + 1) >> 1
+        return tmp[..., 0]
+
+    def kernelMatMul(self, name, types, A, B, C, T, I, K, J, shrA, shrB, H1, H2, demote=1):
+        a = self.load(A, I * K).reshape(-1, I, K)
+        b = self.load(B, K * J).reshape(-1, K, J)
+        R = self.rows(a, b)
+        step = max(1, chunkSize // max(1, I * K * J))
+        res = []
+        for start in range(0, R, step):
+            a_ = a[start:start + step] if a.shape[0] > 1 else a
+            b_ = b[start:start + step] if b.shape[0] > 1 else b
+            # (rows, I, J, K)
+            prod = a_[:, :, None, :] * np.transpose(b_, (0, 2, 1))[:, None, :, :]
+            if not self.fixed:
+                res.append(self.treeSum(prod, H1, H2, False, lambda value: value))
+            elif types is not None:
+                temp = self.getTemp(types, 2)
+                tmp = self.treeSum(temp(prod), H1, H2, True, temp)
+                res.append(saturate(cdiv(cdiv(cdiv(tmp, self.myint(shrA)), self.myint(shrB)), self.myint(demote)), types[3]))
+            else:
+                tmp = saturate(cdiv(prod, self.myint(shrB) * self.myint(shrA)), config.wordLength)
+                res.append(self.treeSum(tmp, H1, H2, True, self.myint))
+        res = np.concatenate(res, axis=0)
+        self.store(C, res.reshape(res.shape[0], I * J))
+
+    def getSparseIndices(self, Aidx, K):
+        # For every non zero value of the sparse matrix its column and row
+        idx = Aidx[0]
+        zeros = np.flatnonzero(idx == 0)
+        if len(zeros) < K:
+            raise NotImplementedError("Malformed sparse matrix")
+        idx = idx[:zeros[K - 1] + 1] if K > 0 else idx[:0]
+        isZero = idx == 0
+        cols = np.cumsum(isZero) - isZero
+        return cols[~isZero], idx[~isZero] - 1
+
+    def kernelSparseMatMul(self, name, types, Aidx, Aval, B, C, K, shrA, shrB, shrC, demote=1):
+        K = wrap(K, 16)
+        name, offset = C
+        size = int(np.prod(self.shapes[name])) - offset
+        cols, rows = self.getSparseIndices(self.load(Aidx, self.getArray(Aidx[0]).shape[1] - Aidx[1]), K)
+        a = self.load(Aval, len(cols))
+        b = self.load(B, K)
+        out = self.load(C, size)
+        R = self.rows(a, b, out)
+        step = max(1, chunkSize // max(1, len(cols)))
+        res = []
+        for start in range(0, R, step):
+            a_ = a[start:start + step] if a.shape[0] > 1 else a
+            b_ = b[start:start + step] if b.shape[0] > 1 else b
+            out_ = out[start:start + step] if out.shape[0] > 1 else out
+            prod = a_ * b_[:, cols]
+            if not self.fixed:
+                terms = prod
+            elif types is not None:
+                prod = wrap(prod, types[3])
+                terms = saturate(cdiv(cdiv(cdiv(cdiv(prod, self.myint(shrA)), self.myint(shrB)), self.myint(shrC)), self.myint(demote)), types[4])
+            else:
+                terms = saturate(cdiv(prod, self.myint(shrC) * self.myint(shrA) * self.myint(shrB)), config.wordLength)
+            acc = np.array(np.broadcast_to(out_, (terms.shape[0], out_.shape[1])).T)
+            np.add.at(acc, rows, terms.T)
+            res.append(acc.T)
+        self.store(C, np.concatenate(res, axis=0))
+
+    def kernelMulCir(self, name, types, A, B, C, I, J, shrA, shrB, demote=1):
+        a = self.load(A, 1 if name == "ScalarMul" else I * J)
+        b = self.load(B, I * J)
+        if not self.fixed:
+            self.store(C, a * b)
+        elif types is not None:
+            prod = wrap(a * b, types[2])
+            self.store(C, saturate(cdiv(cdiv(cdiv(prod, self.myint(shrA)), self.myint(shrB)), wrap(demote, 32)), types[3]))
+        else:
+            self.store(C, saturate(cdiv(a * b, self.myint(shrB) * self.myint(shrA)), config.wordLength))
+
+    kernelScalarMul = kernelMulCir
+
+    def kernelArgMax(self, name, types, A, I, J, index):
+        a = self.load(A, I * J)
+        self.store(index, np.argmax(a, axis=1)[:, None])
+
+    def kernelTranspose(self, name, types, A, B, I, J):
+        a = self.load(A, I * J)
+        self.store(B, a.reshape(-1, J, I).transpose(0, 2, 1).reshape(-1, I * J))
+
+    def kernelReverse2(self, name, types, A, axis, I, J, B):
+        a = self.load(A, I * J).reshape(-1, I, J)
+        self.store(B, np.flip(a, axis=1 + axis).reshape(-1, I * J))
+
+    def kernelRelu2D(self, name, types, A, H, W):
+        a = self.load(A, H * W)
+        self.store(A, np.where(a < 0, 0, a).astype(a.dtype))
+
+    def kernelRelu4D(self, name, types, A, N, H, W, C):
+        self.kernelRelu2D(name, types, A, N * H * W, C)
+
+    def kernelMaxpool(self, name, types, A, B, N, H, W, C, FH, FW, strideH, strideW, HPADL, HPADR, WPADL, WPADR, demote=1):
+        HO, WO = H // strideH, W // strideW
+        a = self.load(A, N * H * W * C).reshape(-1, N, H, W, C)
+        res = None
+        for hs in range(FH):
+            for ws in range(FW):
+                window = a[:, :, hs:hs + strideH * HO:strideH, ws:ws + strideW * WO:strideW, :]
+                res = window if res is None else np.maximum(res, window)
+        res = res.reshape(res.shape[0], N * HO * WO * C)
+        if self.fixed and types is not None:
+            res = wrap(cdiv(res, self.myint(demote)), types[1])
+        self.store(B, res)
+
+    def kernelAddOrSubCir4D(self, name, types, A, B, X, N, H, W, C, shrA, shrB, shrC, add, demote=1):
+        self.addOrSubCir(types, A, B, X, N * H * W, C, shrA, shrB, shrC, add, demote)
+
+    def kernelAddOrSubCir2D(self, name, types, A, B, X, H, W, shrA, shrB, shrC, add, demote=1):
+        self.addOrSubCir(types, A, B, X, H, W, shrA, shrB, shrC, add, demote)
+
+    def addOrSubCir(self, types, A, B, X, H, W, shrA, shrB, shrC, add, demote):
+        a = self.load(A, H * W).reshape(-1, H, W)
+        b = self.load(B, W)[:, None, :]
+        if not self.fixed:
+            res = a + b if add else a - b
+        else:
+            temp = self.getTemp(types, 2)
+            shrC = self.myint(shrC)
+            a = temp(cdiv(a, self.myint(shrA)))
+            b = temp(cdiv(b, self.myint(shrB)))
+            res = temp(cdiv(a, shrC) + cdiv(b, shrC) if add else cdiv(a, shrC) - cdiv(b, shrC))
+            res = saturate(cdiv(res, self.myint(demote)), self.getOut(types, 3))
+        self.store(X, res.reshape(res.shape[0], H * W))
+
+    def kernelExp(self, name, types, A, I, J, shrA, shrB, B, demote=1):
+        a = self.load(A, I * J)
+        if not self.fixed:
+            self.store(B, np.exp(a))
+            return
+        shrB = wrap(shrB, 32) if types is not None else self.myint(shrB)
+        res = np.exp(a.astype(np.float32) / np.float32(self.myint(shrA))) * np.float32(shrB)
+        res = res / np.float32(self.myint(demote))
+        self.store(B, castFloat(res, self.getOut(types, 1)))
+
+    def expBase(self, bitwidth, a, adjust, outBitwidth, used=None):
+        # expBase8 and expBase16 of library_fixed.h
+        # expBase16 indexes the tables out of bounds for a positive input, the
+        # result of the Predictor is undefined so the simulation is refused if
+        # such an entry is used (used: mask of the entries which are not
+        # discarded by the caller)
+        adjust = self.myint(adjust)
+        if bitwidth == 8:
+            val = np.where(a == -128, 127, wrap(-a, 8))
+            val = np.where(val < 0, 127, val)
+            res = self.library["expTable8"][1][val] * adjust
+        else:
+            val = np.where(a == -32768, 32767, wrap(-a, 16))
+            outOfBounds = val < 0
+            if used is not None:
+                outOfBounds = outOfBounds & used
+            if np.any(outOfBounds):
+                raise NotImplementedError("Simulation of expBase16 with a positive input is not supported")
+            val = np.maximum(val, 0)
+            val1 = wrap(np.fmod(val, 128), 16)
+            val2 = wrap(cdiv(val, 128), 16)
+            res = wrap(self.library["expTable16A"][1][val2] * self.library["expTable16B"][1][val1], 32)
+            res = cdiv(res, 16384 * adjust)
+        return wrap(res, outBitwidth)
+
+    def kernelExpNew(self, name, types, A, I, J, adjust, B):
+        bitwidth = int(name[len("ExpNew"):])
+        a = wrap(self.load(A, I * J), bitwidth)
+        self.store(B, self.expBase(bitwidth, a, adjust, types[0]))
+
+    def kernelSigmoid(self, name, types, A, I, J, div, add, sigmoid_limit, scale_in, scale_out, B):
+        a = self.load(A, I * J)
+        if not self.fixed:
+            if self.floatExp:
+                res = np.float32(1) / (np.float32(1) + np.exp(-a))
+            else:
+                res = np.clip((a + np.float32(1)) / np.float32(2), 0, 1).astype(np.float32)
+            self.store(B, res)
+            return
+        bitwidth = self.getOut(types, 0)
+        scale_in, scale_out = self.myint(scale_in), self.myint(scale_out)
+        if self.floatExp:
+            x = a.astype(np.float32) / np.float32(scale_in)
+            y = np.float32(1) / (np.float32(1) + np.exp(-x))
+            self.store(B, castFloat(y * np.float32(scale_out), bitwidth))
+            return
+        scale_diff = wrap(cdiv(scale_out, scale_in), bitwidth)
+        sigmoid_limit = self.myint(sigmoid_limit)
+        x = wrap(cdiv(a, self.myint(div)) + self.myint(add), bitwidth)
+        y = np.where(x >= sigmoid_limit, sigmoid_limit, np.where(x <= 0, 0, x))
+        self.store(B, wrap(y * scale_diff, bitwidth))
+
+    def kernelSigmoidNew(self, name, types, A, I, J, B):
+        bitwidth = int(name[len("SigmoidNew"):])
+        a = wrap(self.load(A, I * J), bitwidth)
+        if bitwidth == 8:
+            b = self.expBase(8, a, 1, 8)
+            neg = wrap(cdiv(64 * b, b + 64), 8)
+            pos = wrap(cdiv(4096, 64 + self.expBase(8, wrap(-a, 8), 1, 8)), 8)
+        else:
+            b = self.expBase(16, a, 1, 16, a <= 0)
+            neg = wrap(cdiv(16384 * b, b + 16384), 16)
+            pos = wrap(cdiv(267943936, 16384 + self.expBase(16, wrap(-a, 16), 1, 16, a > 0)), 16)
+        self.store(B, np.where(a <= 0, neg, pos))
+
+    def kernelTanH(self, name, types, A, I, J, scale_in, scale_out, B):
+        a = self.load(A, I * J)
+        if not self.fixed:
+            res = np.tanh(a) if self.floatExp else np.clip(a, -1, 1).astype(np.float32)
+            self.store(B, res)
+            return
+        bitwidth = self.getOut(types, 0)
+        scale_in, scale_out = wrap(scale_in, bitwidth), wrap(scale_out, bitwidth)
+        if self.floatExp:
+            x = a.astype(np.float32) / np.float32(scale_in)
+            y = np.tanh(x)
+            self.store(B, castFloat(y * np.float32(scale_out), bitwidth))
+            return
+        y = np.clip(a, -scale_in, scale_in)
+        scale_diff = wrap(cdiv(scale_out, scale_in), bitwidth)
+        self.store(B, wrap(y * scale_diff, bitwidth))
+
+    def kernelTanHNew(self, name, types, A, I, J, B):
+        bitwidth = int(name[len("TanHNew"):])
+        a = wrap(self.load(A, I * J), bitwidth)
+        one = 64 if bitwidth == 8 else 16384
+        bNeg = self.expBase(bitwidth, wrap(2 * a, bitwidth), 1, bitwidth, a <= 0)
+        bPos = self.expBase(bitwidth, wrap(-2 * a, bitwidth), 1, bitwidth, a > 0)
+        neg = wrap(cdiv(one * (bNeg - one), bNeg + one), bitwidth)
+        pos = wrap(cdiv(one * (one - bPos), bPos + one), bitwidth)
+        self.store(B, np.where(a <= 0, neg, pos))
+
+    def kernelAdjustScaleShr(self, name, types, A, *args):
+        if not self.fixed:
+            return
+        size, scale = int(np.prod(args[:-1])), self.myint(args[-1])
+        a = self.load(A, size)
+        self.store(A, cdiv(a, scale))
+
+    def kernelAdjustScaleShl(self, name, types, A, *args):
+        if not self.fixed:
+            return
+        size, scale = int(np.prod(args[:-1])), self.myint(args[-1])
+        a = self.load(A, size)
+        self.store(A, a * scale)
+
+    def kernelAdjustScaleShlSaturate(self, name, types, A, *args):
+        size, scale, limit = int(np.prod(args[:-2])), self.myint(args[-2]), self.myint(args[-1])
+        a = self.load(A, size)
+        a = np.where((a < limit) & (a > -limit), a, np.where(a > 0, limit, -limit))
+        self.store(A, a * scale)
+
+    # Execution
+
+    def initModel(self):
+        for var in self.globalVars:
+            if var == 'X' or var + "idx" in self.globalVars and var + "val" in self.globalVars:
+                continue
+            if var not in self.model:
+                raise NotImplementedError("Model parameter %s not found" % var)
+            typ, values = self.model[var]
+            if typ != "float":
+                values = wrap(values, getBitwidth(typ))
+            values = values[None, :]
+            if self.vbwEnabled:
+                # Same conversion as X86.printModelParamsWithBitwidth
+                bw = self.varsForBitwidth[var]
+                offset = self.demotedVarsOffsets.get(var, 0) if bw != config.wordLength else 0
+                divide = int(round(np.ldexp(1, config.wordLength - bw + offset))) if var[-3:] != "idx" else 1
+                values = cdiv(values, divide)
+            self.mem[var] = np.array(self.convert(var, values))
+
+        for var, num in self.cnsts.items():
+            if not self.fixed and var in self.floatConstants:
+                self.write(IR.Var(var), np.float32(float('%f' % self.floatConstants[var])))
+            else:
+                self.write(IR.Var(var), int(num))
+
+        for exp, [table, [tableVarA, tableVarB]] in self.expTables.items():
+            for row, var in zip(table, [tableVarA, tableVarB]):
+                self.mem[var.idf] = wrap(np.array(row, dtype=np.int64), config.wordLength)[None, :]
+                self.types[var.idf] = config.wordLength
+                self.shapes[var.idf] = [len(row)]
+
+    def initInput(self, X):
+        # Same conversion as populateFixedVector and populateFloatVector of
+        # the Predictor
+        if self.fixed:
+            values = castFloat(np.ldexp(X, -self.scaleForX), config.wordLength)
+        else:
+            values = X.astype(np.float32)
+        self.mem['X'] = np.array(self.convert('X', values))
+
+    def run(self, X):
+        '''
+        Returns the output of the program, one row per row of the features X,
+        as the res array of seedotFixed (int32) or seedotFloat (float)
+        '''
+        X = np.asarray(X, dtype=np.float64)
+        self.N = X.shape[0]
+        self.mem = {}
+        self.iters = {}
+        self.mask = None
+
+        self.initModel()
+        self.initInput(X)
+        self.runCmd(self.prog)
+
+        typ = self.decls[self.expr.idf]
+        if Type.isInt(typ) or (Type.isTensor(typ) and typ.dim == 0):
+            res = self.eval(self.expr)
+            res = np.broadcast_to(np.asarray(res), (self.N,))[:, None]
+        else:
+            res = np.broadcast_to(self.getArray(self.expr.idf), (self.N, self.mem[self.expr.idf].shape[1]))
+        if self.fixed:
+            return wrap(castFloat(res, 32) if isFloat(res) else np.array(res, dtype=np.int64), 32)
+        return res.astype(np.float32)
@@ -29,6 +29,22 @@ higherOffsetBias = True
 
 fixedPointVbwIteration = False
 
+# Evaluate the candidate codes of the scale factor search with the IR
+# simulator instead of building the Predictor. Rounds with a code the
+# simulator does not reproduce exactly (convolutions, FASTAPPROX, loops with
+# input dependent bounds, the new table exp with a positive input, ...) raise
+# NotImplementedError and are built and run as before. checkSimulator
+# compares both on a model
+simulateSearch = True
+
+# Also build and run the Predictor when the simulator is used, and report the
+# codes for which the simulated statistics differ from the Predictor
+checkSimulator = False
+
+# Number of copies of the Predictor project built and run in parallel for the
+# codes of the scale factor search, None uses one per core
+predictorWorkers = None
+
 class MaximisingMetric:
     accuracy = "acc"
     disagreements = "disagree"
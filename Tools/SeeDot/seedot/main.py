@@ -15,7 +15,8 @@ from seedot.compiler.converter.converter import Converter
 
 import seedot.config as config
 from seedot.compiler.compiler import Compiler
-from seedot.predictor import Predictor
+from seedot.predictor import Predictor, ParallelPredictor
+from seedot.simulator import Simulator
 import seedot.util as Util
 
 
@@ -41,6 +42,8 @@ class Main:
         self.allScales = {} #Eventually populated with scale assignments in final code
         self.demotedVarsList = [] #Populated in VBW mode after exploration completed
         self.demotedVarsOffsets = {} #Populated in VBW mode after exploration completed
+        self.programs = {} #IR of the codes in the Predictor for simulation, populated in compile
+        self.simulatorMismatches = [] #(code id, simulated stats, Predictor stats), populated when config.checkSimulator is set
 
     def setup(self):
         curr_dir = os.path.dirname(os.path.realpath(__file__))
@@ -109,6 +112,12 @@ class Main:
             self.scalesForX[id] = obj.scaleForX
             self.scalesForY[id] = obj.scaleForY
 
+        if target == config.Target.x86:
+            if generateAllFiles:
+                self.programs[version] = {}
+            (prog, expr), state = obj.ir
+            self.programs[version]["default" if id is None else str(id)] = (prog, expr, state, obj.scaleForX, obj.scaleForY)
+
         print("completed")
         return True
 
@@ -158,14 +167,38 @@ class Main:
         curDir = os.getcwd()
         os.chdir(os.path.join(config.tempdir, "Predictor"))
 
-        obj = Predictor(self.algo, version, datasetType,
-                        outputDir, self.scaleForX, self.scalesForX, self.scaleForY, self.scalesForY, self.problemType, self.numOutputs)
+        if version == config.Version.fixed and config.predictorWorkers != 1:
+            numWorkers = config.predictorWorkers if config.predictorWorkers is not None else os.cpu_count()
+            obj = ParallelPredictor(self.algo, version, datasetType,
+                            outputDir, self.scaleForX, self.scalesForX, self.scaleForY, self.scalesForY, self.problemType, self.numOutputs, ".", numWorkers)
+        else:
+            obj = Predictor(self.algo, version, datasetType,
+                            outputDir, self.scaleForX, self.scalesForX, self.scaleForY, self.scalesForY, self.problemType, self.numOutputs)
         execMap = obj.run()
 
         os.chdir(curDir)
 
         return execMap
 
+    # Evaluate the generated codes on the dataset with the IR simulator
+    # Returns None if some code can not be simulated, in which case the
+    # Predictor project has to be built and run instead
+    def simulate(self, version, datasetType):
+        if version not in self.programs or config.Version.floatt not in self.programs:
+            return None
+
+        print("Simulation...", end='')
+        try:
+            obj = Simulator(version, datasetType, os.path.join(config.tempdir, "Predictor"), self.programs[version],
+                            self.programs[config.Version.floatt]["default"], self.problemType, self.numOutputs)
+            execMap = obj.run()
+        except (NotImplementedError, ZeroDivisionError) as e:
+            print("not possible (%s), falling back to the Predictor" % str(e))
+            return None
+
+        print("success")
+        return execMap
+
     # Compile and run the generated code once for a given scaling factor
     def partialCompile(self, version, target, scale, generateAllFiles, id, printSwitch, variableToBitwidthMap=None, demotedVarsList=[], demotedVarsOffsets={}):
         if config.ddsEnabled:
@@ -178,7 +211,19 @@ class Main:
             return True
 
     def runAll(self, version, datasetType, codeIdToScaleFactorMap, demotedVarsToOffsetToCodeId=None, doNotSort=False):
-        execMap = self.predict(version, datasetType)
+        execMap = None
+        if config.simulateSearch and version == config.Version.fixed and datasetType == config.DatasetType.training:
+            execMap = self.simulate(version, datasetType)
+            if execMap is not None and config.checkSimulator:
+                simulatedMap = execMap
+                execMap = self.predict(version, datasetType)
+                if execMap is not None:
+                    for codeId, stats in execMap.items():
+                        if simulatedMap.get(codeId) != stats:
+                            self.simulatorMismatches.append((codeId, simulatedMap.get(codeId), stats))
+                            print("Simulator mismatch for code %s: simulated %s, Predictor %s" % (codeId, str(simulatedMap.get(codeId)), str(stats)))
+        if execMap == None:
+            execMap = self.predict(version, datasetType)
         if execMap == None:
             return False, True
 
@@ -1,8 +1,15 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT license.
 
+from concurrent.futures import ThreadPoolExecutor
+from distutils.dir_util import copy_tree
+from distutils.file_util import copy_file
+import hashlib
 import os
+import re
+import shutil
 import subprocess
+import tempfile
 
 import seedot.config as config
 import seedot.util as Util
@@ -13,10 +20,13 @@ import seedot.util as Util
 
 class Predictor:
 
-    def __init__(self, algo, version, datasetType, outputDir, scaleForX, scalesForX, scaleForY, scalesForY, problemType, numOutputs):
+    def __init__(self, algo, version, datasetType, outputDir, scaleForX, scalesForX, scaleForY, scalesForY, problemType, numOutputs, predictorDir="."):
         self.algo, self.version, self.datasetType = algo, version, datasetType
 
-        self.outputDir = outputDir
+        # Directory of the Predictor project, outputDir is relative to it
+        self.predictorDir = predictorDir
+
+        self.outputDir = os.path.join(predictorDir, outputDir)
         os.makedirs(self.outputDir, exist_ok=True)
 
         self.scaleForX = scaleForX
@@ -28,9 +38,10 @@ class Predictor:
         self.numOutputs = numOutputs
 
         self.genHeaderFile()
+        self.genScalesFile()
 
     def genHeaderFile(self):
-        with open("datatypes.h", 'w') as file:
+        with open(os.path.join(self.predictorDir, "datatypes.h"), 'w') as file:
             file.write("#pragma once\n\n")
 
             if config.wordLength == 8:
@@ -46,20 +57,6 @@ class Predictor:
             file.write("typedef int16_t MYITE;\n")
             file.write("typedef uint16_t MYUINT;\n\n")
 
-            file.write("const int scaleForX = %d;\n\n" % (self.scaleForX))
-            if len(self.scalesForX) > 0:
-                assert len(self.scalesForX) == max(list(self.scalesForX.keys())), "Malformed array scalesForX"
-                file.write("const int scalesForX[%d] = {%s};\n" % (len(self.scalesForX), ', '.join([str(self.scalesForX[i+1]) for i in range(len(self.scalesForX))])))
-            else:
-                file.write("const int scalesForX[1] = {100}; //junk, needed for compilation\n")
-
-            file.write("const int scaleForY = %d;\n\n" % (self.scaleForY))
-            if len(self.scalesForY) > 0:
-                assert len(self.scalesForY) == max(list(self.scalesForY.keys())), "Malformed array scalesForY"
-                file.write("const int scalesForY[%d] = {%s};\n" % (len(self.scalesForY), ', '.join([str(self.scalesForY[i+1]) for i in range(len(self.scalesForY))])))
-            else:
-                file.write("const int scalesForY[1] = {100}; //junk, needed for compilation\n")
-
             if Util.debugMode():
                 file.write("const bool debugMode = true;\n")
             else:
@@ -82,6 +79,28 @@ class Predictor:
             else:
                 file.write("//#define FLOATEXP\n")
 
+    # The scales change with every code, they are kept out of datatypes.h so
+    # that the rest of the Predictor does not have to be rebuilt for them
+    def genScalesFile(self):
+        with open(os.path.join(self.predictorDir, "scales.cpp"), 'w') as file:
+            file.write("#include <cstdint>\n\n")
+            file.write("#include \"datatypes.h\"\n")
+            file.write("#include \"predictors.h\"\n\n")
+
+            file.write("const int scaleForX = %d;\n\n" % (self.scaleForX))
+            if len(self.scalesForX) > 0:
+                assert len(self.scalesForX) == max(list(self.scalesForX.keys())), "Malformed array scalesForX"
+                file.write("const int scalesForX[%d] = {%s};\n" % (len(self.scalesForX), ', '.join([str(self.scalesForX[i+1]) for i in range(len(self.scalesForX))])))
+            else:
+                file.write("const int scalesForX[1] = {100}; //junk, needed for compilation\n")
+
+            file.write("const int scaleForY = %d;\n\n" % (self.scaleForY))
+            if len(self.scalesForY) > 0:
+                assert len(self.scalesForY) == max(list(self.scalesForY.keys())), "Malformed array scalesForY"
+                file.write("const int scalesForY[%d] = {%s};\n" % (len(self.scalesForY), ', '.join([str(self.scalesForY[i+1]) for i in range(len(self.scalesForY))])))
+            else:
+                file.write("const int scalesForY[1] = {100}; //junk, needed for compilation\n")
+
     def buildForWindows(self):
         '''
         Builds using the Predictor.vcxproj project file and creates the executable
@@ -95,7 +114,7 @@ class Predictor:
 
         logFile = os.path.join(self.outputDir, "msbuild.txt")
         with open(logFile, 'w') as file:
-            process = subprocess.call(args, stdout=file, stderr=subprocess.STDOUT)
+            process = subprocess.call(args, stdout=file, stderr=subprocess.STDOUT, cwd=self.predictorDir)
 
         if process == 1:
             print("FAILED!!\n")
@@ -104,21 +123,94 @@ class Predictor:
             print("success")
             return True
 
+    # Compiler and flags set in the Makefile
+    def readMakefile(self):
+        variables = {}
+        with open(os.path.join(self.predictorDir, "Makefile"), 'r') as file:
+            for line in file:
+                match = re.match(r'^(\w+)\s*=(.*)$', line.strip())
+                if match is not None:
+                    variables[match.group(1)] = match.group(2).strip()
+        return variables["CC"], variables["CFLAGS"].split()
+
+    # The source file and the local headers it includes
+    def getSourceFiles(self, fileName, files=None):
+        files = [] if files is None else files
+        path = os.path.join(self.predictorDir, fileName)
+        if fileName in files or not os.path.isfile(path):
+            return files
+
+        files.append(fileName)
+        with open(path, 'r') as file:
+            for include in re.findall(r'^\s*#include\s+"([^"]+)"', file.read(), re.MULTILINE):
+                self.getSourceFiles(include, files)
+        return files
+
+    def hashSources(self, args, fileNames):
+        digest = hashlib.sha1(' '.join(args).encode())
+        for fileName in fileNames:
+            digest.update(fileName.encode())
+            with open(os.path.join(self.predictorDir, fileName), 'rb') as file:
+                digest.update(file.read())
+        return digest.hexdigest()
+
+    # Runs args and moves its output from a temporary file to target, so that
+    # the workers of ParallelPredictor can share the cache
+    def buildCached(self, args, target, logFile):
+        fd, tempFile = tempfile.mkstemp(dir=os.path.dirname(target))
+        os.close(fd)
+        args = [arg if arg != target else tempFile for arg in args]
+
+        process = subprocess.call(args, stdout=logFile, stderr=subprocess.STDOUT, cwd=self.predictorDir)
+        if process != 0:
+            os.remove(tempFile)
+            return False
+
+        os.replace(tempFile, target)
+        return True
+
     def buildForLinux(self):
+        '''
+        Builds the same objects as the Makefile but keeps them in a cache
+        shared by all the Predictor directories, keyed by the hash of the
+        compiler flags and of the sources with their headers. The library,
+        main and profile objects are compiled once per word length and flags
+        and a generated file only when its contents change
+        '''
         print("Build...", end='')
 
-        args = ["make"]
+        compiler, flags = self.readMakefile()
+        cacheDir = os.path.join(os.path.dirname(os.path.abspath(self.predictorDir)), "PredictorCache")
+        os.makedirs(cacheDir, exist_ok=True)
 
         logFile = os.path.join(self.outputDir, "build.txt")
         with open(logFile, 'w') as file:
-            process = subprocess.call(args, stdout=file, stderr=subprocess.STDOUT)
-
-        if process == 1:
-            print("FAILED!!\n")
-            return False
-        else:
-            print("success")
-            return True
+            objFiles = []
+            for source in sorted(f for f in os.listdir(self.predictorDir) if f.endswith(".cpp")):
+                args = [compiler, "-c"] + flags
+                key = self.hashSources(args, self.getSourceFiles(source))
+                objFile = os.path.join(cacheDir, "%s-%s.o" % (os.path.splitext(source)[0], key))
+                if not os.path.isfile(objFile):
+                    file.write("Compiling %s\n" % (source))
+                    file.flush()
+                    if not self.buildCached([compiler, "-c", "-o", objFile] + flags + [source], objFile, file):
+                        print("FAILED!!\n")
+                        return False
+                objFiles.append(objFile)
+
+            key = hashlib.sha1(' '.join([compiler] + flags + objFiles).encode()).hexdigest()
+            exeFile = os.path.join(cacheDir, "Predictor-%s" % (key))
+            if not os.path.isfile(exeFile):
+                file.write("Linking\n")
+                file.flush()
+                if not self.buildCached([compiler, "-o", exeFile] + objFiles + flags, exeFile, file):
+                    print("FAILED!!\n")
+                    return False
+
+        shutil.copy2(exeFile, os.path.join(self.predictorDir, "Predictor"))
+
+        print("success")
+        return True
 
     def build(self):
         if Util.windows():
@@ -137,7 +229,7 @@ class Predictor:
 
         logFile = os.path.join(self.outputDir, "exec.txt")
         with open(logFile, 'w') as file:
-            process = subprocess.call(args, stdout=file, stderr=subprocess.STDOUT)
+            process = subprocess.call(args, stdout=file, stderr=subprocess.STDOUT, cwd=self.predictorDir)
 
         if process == 1:
             print("FAILED!!\n")
@@ -155,7 +247,7 @@ class Predictor:
 
         logFile = os.path.join(self.outputDir, "exec.txt")
         with open(logFile, 'w') as file:
-            process = subprocess.call(args, stdout=file, stderr=subprocess.STDOUT)
+            process = subprocess.call(args, stdout=file, stderr=subprocess.STDOUT, cwd=self.predictorDir)
 
         if process == 1:
             print("FAILED!!\n")
@@ -173,7 +265,7 @@ class Predictor:
 
     # Read statistics of execution (currently only accuracy)
     def readStatsFile(self):
-        statsFile = os.path.join(
+        statsFile = os.path.join(self.predictorDir,
             "output", self.version, "stats-" + self.datasetType + ".txt")
 
         with open(statsFile, 'r') as file:
@@ -198,3 +290,130 @@ class Predictor:
         execMap = self.execute()
 
         return execMap
+
+
+# Runs the codes of the scale factor search, compiled into one
+# seedot_fixed.cpp as seedotFixed1, seedotFixed2, ..., in several copies of
+# the Predictor project at the same time. Each copy builds and runs a subset
+# of the codes and the statistics are merged into one map keyed by code id
+class ParallelPredictor:
+
+    def __init__(self, algo, version, datasetType, outputDir, scaleForX, scalesForX, scaleForY, scalesForY, problemType, numOutputs, predictorDir, numWorkers):
+        self.algo, self.version, self.datasetType = algo, version, datasetType
+        self.outputDir = outputDir
+        self.scaleForX = scaleForX
+        self.scalesForX = scalesForX
+        self.scaleForY = scaleForY
+        self.scalesForY = scalesForY
+        self.problemType = problemType
+        self.numOutputs = numOutputs
+        self.predictorDir = predictorDir
+        self.numWorkers = numWorkers
+
+    # Splits seedot_fixed.cpp into the part shared by all the workers (includes,
+    # exp tables and seedotFixed) and the text of each numbered code
+    def readCodes(self):
+        with open(os.path.join(self.predictorDir, "seedot_fixed.cpp"), 'r') as file:
+            content = file.read()
+
+        starts = [(m.start(), int(m.group(1))) for m in re.finditer(r'^void seedotFixed(\d+)\(', content, re.MULTILINE)]
+        if len(starts) == 0:
+            return content, {}
+
+        end = re.search(r'^const int switches = ', content[starts[-1][0]:], re.MULTILINE)
+        end = starts[-1][0] + end.start() if end is not None else len(content)
+
+        codes = {}
+        for i, (start, codeId) in enumerate(starts):
+            codeEnd = starts[i + 1][0] if i + 1 < len(starts) else end
+            codes[codeId] = content[start:codeEnd]
+        return content[:starts[0][0]], codes
+
+    def partition(self, codeIds):
+        numWorkers = min(self.numWorkers, len(codeIds))
+        size, rem = divmod(len(codeIds), numWorkers)
+        parts = []
+        start = 0
+        for i in range(numWorkers):
+            end = start + size + (1 if i < rem else 0)
+            parts.append(codeIds[start:end])
+            start = end
+        return parts
+
+    # Copies the Predictor project to the directory of the worker and writes
+    # its seedot_fixed.cpp, the codes are renumbered from 1. The dataset is
+    # not copied, input is a link to the input directory of the project
+    def setupWorker(self, workerDir, logDir, shared, codes, codeIds):
+        os.makedirs(workerDir, exist_ok=True)
+        for name in os.listdir(self.predictorDir):
+            if name == "input":
+                continue
+            src, dst = os.path.join(self.predictorDir, name), os.path.join(workerDir, name)
+            if os.path.isdir(src):
+                copy_tree(src, dst, update=1)
+            else:
+                copy_file(src, dst, update=1)
+
+        os.makedirs(os.path.join(workerDir, self.outputDir), exist_ok=True)
+
+        inputDir = os.path.join(workerDir, "input")
+        if not os.path.islink(inputDir):
+            if os.path.isdir(inputDir):
+                shutil.rmtree(inputDir)
+            try:
+                os.symlink(os.path.abspath(os.path.join(self.predictorDir, "input")), inputDir, target_is_directory=True)
+            except OSError:
+                # Symbolic links need extra privileges on Windows
+                copy_tree(os.path.join(self.predictorDir, "input"), inputDir, update=1)
+
+        with open(os.path.join(workerDir, "seedot_fixed.cpp"), 'w') as file:
+            file.write(shared)
+            for i, codeId in enumerate(codeIds):
+                file.write(re.sub(r'^void seedotFixed\d+\(', 'void seedotFixed%d(' % (i + 1), codes[codeId], count=1))
+
+            file.write("const int switches = %d;\n" % (len(codeIds)))
+            file.write('void seedotFixedSwitch(int i, MYINT **X_temp, int32_t* res) {\n')
+            file.write('\tswitch(i) {\n')
+            for i in range(len(codeIds)):
+                file.write('\t\tcase %d: seedotFixed%d(X_temp, res); return;\n' % (i, i + 1))
+            file.write('\t\tdefault: res[0] = -1; return;\n')
+            file.write('\t}\n')
+            file.write('}\n')
+
+        # logDir is absolute, the build and execution logs of every worker
+        # are kept apart in the output directory of the project
+        return Predictor(self.algo, self.version, self.datasetType, logDir, self.scaleForX,
+                         {i + 1: self.scalesForX[codeId] for i, codeId in enumerate(codeIds)},
+                         self.scaleForY,
+                         {i + 1: self.scalesForY[codeId] for i, codeId in enumerate(codeIds)},
+                         self.problemType, self.numOutputs, workerDir)
+
+    def run(self):
+        shared, codes = self.readCodes()
+        codeIds = sorted(codes.keys())
+
+        if len(codeIds) < 2 or self.numWorkers < 2:
+            obj = Predictor(self.algo, self.version, self.datasetType, self.outputDir, self.scaleForX, self.scalesForX,
+                            self.scaleForY, self.scalesForY, self.problemType, self.numOutputs, self.predictorDir)
+            return obj.run()
+
+        parts = self.partition(codeIds)
+        workers = []
+        for i, part in enumerate(parts):
+            workerDir = os.path.join(os.path.dirname(os.path.abspath(self.predictorDir)), "PredictorWorker%d" % (i))
+            logDir = os.path.abspath(os.path.join(self.predictorDir, self.outputDir, "worker%d" % (i)))
+            workers.append(self.setupWorker(workerDir, logDir, shared, codes, part))
+
+        # The build and the execution are separate processes, threads are
+        # enough to run the workers in parallel
+        with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+            results = list(executor.map(lambda worker: worker.run(), workers))
+
+        execMap = {}
+        for part, result in zip(parts, results):
+            if result == None:
+                return None
+            execMap.setdefault("default", result["default"])
+            for i, codeId in enumerate(part):
+                execMap[str(codeId)] = result[str(i + 1)]
+        return execMap
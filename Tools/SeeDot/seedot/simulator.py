@@ -0,0 +1,89 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+import os
+
+import numpy as np
+
+import seedot.config as config
+from seedot.compiler.converter.util import readMatAsBinary
+from seedot.compiler.ir.irSimulator import IRSimulator
+
+# Drop-in replacement of Predictor for the fixed-point scale factor search
+# The generated codes are evaluated from their IR with numpy instead of being
+# built and run, and the statistics are computed as in Predictor/main.cpp
+
+
+class Simulator:
+
+    def __init__(self, version, datasetType, predictorDir, programs, floatProgram, problemType, numOutputs):
+        '''
+        programs: dict code id ("default", "1", ...) -> (prog, expr, state,
+            scaleForX, scaleForY) of the codes compiled into the Predictor
+        floatProgram: the same tuple for the floating-point code, the
+            reference for the disagreements
+        '''
+        self.version, self.datasetType = version, datasetType
+        self.predictorDir = predictorDir
+        self.programs = programs
+        self.floatProgram = floatProgram
+        self.problemType = problemType
+        self.numOutputs = numOutputs
+
+    def readDataset(self):
+        inputDir = os.path.join(self.predictorDir, "input")
+
+        X = readMatAsBinary(os.path.join(inputDir, "X.bin")).astype(np.float64)
+        Y = readMatAsBinary(os.path.join(inputDir, "Y.bin"))
+        if self.problemType == config.ProblemType.classification:
+            Y = Y.astype(np.int32)
+        else:
+            Y = Y.astype(np.float32)
+
+        N = min(len(X), len(Y))
+        return X[:N], Y[:N, :self.numOutputs]
+
+    def simulate(self, program, version, X):
+        prog, expr, state, scaleForX, _ = program
+        if version == config.Version.fixed:
+            modelFile = os.path.join(self.predictorDir, "model_fixed.h")
+        else:
+            modelFile = os.path.join(self.predictorDir, "model_float.h")
+        libraryFile = os.path.join(self.predictorDir, "library_fixed.h")
+        simulator = IRSimulator(prog, expr, state, version, scaleForX, modelFile, libraryFile)
+        return simulator.run(X)[:, :self.numOutputs]
+
+    def getStats(self, res, floatRes, Y, scaleForY):
+        if self.problemType == config.ProblemType.classification:
+            res = res.astype(np.float32)
+            disagree = res != floatRes
+            accuracy = np.float32(np.sum(res == Y)) / Y.size * np.float32(100)
+            disagreements = np.float32(np.sum(disagree)) / self.numOutputs
+            reducedDisagreements = np.float32(np.sum(disagree & (floatRes == Y))) / self.numOutputs
+            return (round(float(accuracy), 3), round(float(disagreements), 3), round(float(reducedDisagreements), 3))
+        else:
+            if self.version == config.Version.fixed:
+                res = (res.astype(np.float32) / np.float32(np.ldexp(1.0, -scaleForY))).astype(np.float32)
+            epsilon = np.float32(0.00001)
+            errors = np.sort((100.0 * np.abs(res - Y) / (epsilon + np.abs(Y))).astype(np.float32), axis=None)
+            ferrors = np.sort((100.0 * np.abs(res - floatRes) / (epsilon + np.abs(floatRes))).astype(np.float32), axis=None)
+            index = max(int(0.95 * errors.size - 1), 0)
+            return (round(float(errors[index]), 3), round(float(ferrors[index]), 3), 0.0)
+
+    def run(self):
+        '''
+        Returns the map of code id to statistics, the same as
+        Predictor.readStatsFile
+        '''
+        X, Y = self.readDataset()
+
+        floatRes = self.simulate(self.floatProgram, config.Version.floatt, X)
+
+        execMap = {}
+        for key, program in self.programs.items():
+            if self.version == config.Version.floatt:
+                res = floatRes
+            else:
+                res = self.simulate(program, config.Version.fixed, X)
+            execMap[key] = self.getStats(res, floatRes, Y, program[4])
+        return execMap
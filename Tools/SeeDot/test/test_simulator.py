@@ -0,0 +1,87 @@
+'''
+
+Checks that the IR simulator used by the scale factor search reports the same
+statistics as the Predictor project.
+
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import seedot.main as main
+import seedot.config as config
+import seedot.util as Util
+
+protonn = '''let X   = (%d, 1)   in [0.000000, 1.000000] in
+let W  = (%d, %d)    in [%f, %f] in
+let B  = (%d, %d, 1) in [%f, %f] in
+let Z  = (%d, %d, 1) in [%f, %f] in
+let g2 = 0.3 in
+
+let WX = W |*| X in
+let res = $(i = [0:%d])
+(
+	let del = WX - B[i] in
+	Z[i] * exp(-g2 * (del^T * del))
+) in
+argmax(res)
+'''
+
+class TestSimulator(unittest.TestCase):
+
+	def setUp(self):
+		self.curDir = os.getcwd()
+		self.baseDir = tempfile.mkdtemp()
+		os.chdir(self.baseDir)
+		os.makedirs("model")
+
+		self.saved = (config.simulateSearch, config.checkSimulator, Util.Config.exp)
+		config.tempdir = "temp"
+		config.outdir = os.path.join(config.tempdir, "arduino")
+		os.makedirs(config.outdir)
+		config.simulateSearch = True
+		config.checkSimulator = True
+
+	def tearDown(self):
+		config.simulateSearch, config.checkSimulator, Util.Config.exp = self.saved
+		os.chdir(self.curDir)
+		shutil.rmtree(self.baseDir)
+
+	# Small ProtoNN with random parameters, d features, D projected features,
+	# p prototypes and c classes
+	def write_protonn(self, rng, d=20, D=4, p=5, c=3):
+		W = rng.uniform(-1, 1, (D, d))
+		W[np.abs(W) < 0.5] = 0
+		B = rng.uniform(-1, 1, (p, D))
+		Z = rng.uniform(-1, 1, (p, c))
+		with open(os.path.join("model", "input.sd"), "w") as file:
+			file.write(protonn % (d, D, d, W.min(), W.max(), p, D, B.min(), B.max(), p, c, Z.min(), Z.max(), p))
+		for name, param in [("W", W), ("B", B), ("Z", Z)]:
+			np.save(os.path.join("model", name + ".npy"), param)
+
+		for name, n in [("train", 400), ("test", 100)]:
+			X = rng.uniform(0, 1, (n, d))
+			Y = rng.randint(0, c, (n, 1))
+			np.save(name + ".npy", np.hstack([Y, X]))
+
+	def check_protonn(self, exp, seed):
+		Util.Config.exp = exp
+		self.write_protonn(np.random.RandomState(seed))
+		obj = main.Main(config.Algo.protonn, config.Version.fixed, config.Target.x86, "train.npy", "test.npy",
+			"model", None, config.MaximisingMetric.accuracy, "protonn", 1, config.Source.seedot)
+		obj.run()
+		self.assertEqual(obj.simulatorMismatches, [])
+
+	def test_protonn_math_exp(self):
+		self.check_protonn("math", 0)
+
+	def test_protonn_new_table_exp(self):
+		for seed in range(2):
+			self.check_protonn("new table", seed)
+
+if __name__ == '__main__':
+	unittest.main()
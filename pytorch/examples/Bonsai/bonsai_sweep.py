@@ -0,0 +1,25 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+import helpermethods
+import numpy as np
+from pytorch_edgeml.sweep import getSweepArgs, sweepFromArgs, trainBonsai
+
+
+def main():
+    args = getSweepArgs('Hyperparameter sweep of Bonsai, the grid takes ' +
+                        'the config keys of sweep.trainBonsai')
+
+    (dataDimension, numClasses, Xtrain, Ytrain, Xtest, Ytest,
+     mean, std) = helpermethods.preProcessData(args.data_dir)
+    data = {"Xtrain": Xtrain.astype(np.float32),
+            "Ytrain": Ytrain.astype(np.float32),
+            "Xtest": Xtest.astype(np.float32),
+            "Ytest": Ytest.astype(np.float32)}
+
+    base = {"outDir": args.data_dir + "/BonsaiSweep"}
+    sweepFromArgs(trainBonsai, args, data, base)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+import helpermethods
+import os
+import time
+import numpy as np
+from pytorch_edgeml.quantizedFastModel import QuantizedFastModel
+
+
+def main():
+    args = helpermethods.getQuantEvalArgs()
+    modelDir = args.model_dir
+
+    model = QuantizedFastModel(os.path.join(modelDir, 'QuantizedModel'),
+                               args.max_val,
+                               gate_non_linearity=args.gate_nl,
+                               update_non_linearity=args.update_nl)
+
+    test = np.load(os.path.join(args.data_dir, 'test.npy'))
+    Xtest = test[:, 1:]
+    Ytest = test[:, 0].astype('int64')
+    Ytest = Ytest - min(Ytest)
+
+    mean = np.load(os.path.join(modelDir, 'mean.npy'))
+    std = np.load(os.path.join(modelDir, 'std.npy'))
+    Xtest = (Xtest - mean) / std
+
+    start = time.time()
+    accuracy = model.accuracy(Xtest, Ytest)
+    print("Quantized " + model.cellType + " Test Accuracy: " +
+          str(accuracy) + " (%d samples in %.2f s)" %
+          (Xtest.shape[0], time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -30,6 +30,8 @@ def main():
     batchSize = args.batch_size
     decayStep = args.decay_step
     decayRate = args.decay_rate
+    precision = args.precision
+    qatMaxValue = args.qat_max_val
 
     wRank = args.wRank
     uRank = args.uRank
@@ -55,11 +57,13 @@ def main():
         FastCell = FastGRNNCell(inputDims, hiddenDims,
                                 gate_non_linearity=gate_non_linearity,
                                 update_non_linearity=update_non_linearity,
-                                wRank=wRank, uRank=uRank)
+                                wRank=wRank, uRank=uRank,
+                                qatMaxValue=qatMaxValue)
     elif cell == "FastRNN":
         FastCell = FastRNNCell(inputDims, hiddenDims,
                                update_non_linearity=update_non_linearity,
-                               wRank=wRank, uRank=uRank)
+                               wRank=wRank, uRank=uRank,
+                               qatMaxValue=qatMaxValue)
     elif cell == "UGRNN":
         FastCell = UGRNNLRCell(inputDims, hiddenDims,
                                update_non_linearity=update_non_linearity,
@@ -77,7 +81,7 @@ def main():
 
     FastCellTrainer = FastTrainer(FastCell, numClasses, sW=sW, sU=sU,
                                   learningRate=learningRate, outFile=outFile,
-                                  device=device)
+                                  device=device, precision=precision)
 
     FastCellTrainer.train(batchSize, totalEpochs,
                           torch.from_numpy(Xtrain.astype(np.float32)),
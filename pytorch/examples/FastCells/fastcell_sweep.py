@@ -0,0 +1,26 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+import helpermethods
+import numpy as np
+from pytorch_edgeml.sweep import getSweepArgs, sweepFromArgs, trainFastCell
+
+
+def main():
+    args = getSweepArgs('Hyperparameter sweep of FastCells, the grid takes ' +
+                        'the config keys of sweep.trainFastCell ' +
+                        '(inputDims is required)')
+
+    (dataDimension, numClasses, Xtrain, Ytrain, Xtest, Ytest,
+     mean, std) = helpermethods.preProcessData(args.data_dir)
+    data = {"Xtrain": Xtrain.astype(np.float32),
+            "Ytrain": Ytrain.astype(np.float32),
+            "Xtest": Xtest.astype(np.float32),
+            "Ytest": Ytest.astype(np.float32)}
+
+    base = {"outDir": args.data_dir + "/FastCellSweep"}
+    sweepFromArgs(trainFastCell, args, data, base)
+
+
+if __name__ == '__main__':
+    main()
@@ -145,6 +145,17 @@ def getArgs():
                         help='Output file for dumping the program output, ' +
                         '(default: stdout)')
 
+    parser.add_argument('-p', '--precision', type=str, default=None,
+                        choices=['bf16', 'fp16'],
+                        help='Mixed precision (autocast) training mode ' +
+                        '(default: fp32)')
+
+    parser.add_argument('-qat', '--qat-max-val', type=checkIntPos,
+                        default=None,
+                        help='Quantization aware training of FastGRNN and ' +
+                        'FastRNN for this max quantized value, use the same ' +
+                        'as -m of quantizeFastModels.py (default: off)')
+
     return parser.parse_args()
 
 
@@ -195,6 +206,31 @@ def createTimeStampDir(dataDir, cell):
     return None
 
 
+def getQuantEvalArgs():
+    '''
+    Function to parse arguments for integer inference of Quantized Models
+    '''
+    parser = argparse.ArgumentParser(
+        description='Arguments for evaluating the quantized Fast models ' +
+        'with integer arithmetic. Works only for piece-wise linear ' +
+        'non-linearities, like relu, quantTanh, quantSigm')
+    parser.add_argument('-dir', '--model-dir', required=True,
+                        help='model directory passed to ' +
+                        'quantizeFastModels.py (contains QuantizedModel)')
+    parser.add_argument('-data', '--data-dir', required=True,
+                        help='Data directory containing test.npy')
+    parser.add_argument('-m', '--max-val', type=checkIntNneg, default=127,
+                        help='max value used for quantizeFastModels.py')
+    parser.add_argument('-unl', '--update-nl', type=str, default="quantTanh",
+                        help='Update non linearity. Choose from ' +
+                        '[quantTanh, quantSigm, quantSigm4, relu]')
+    parser.add_argument('-gnl', '--gate-nl', type=str, default="quantSigm",
+                        help='Gate non linearity (FastGRNN). Choose from ' +
+                        '[quantTanh, quantSigm, quantSigm4, relu]')
+
+    return parser.parse_args()
+
+
 def preProcessData(dataDir):
     '''
     Function to pre-process input data
@@ -0,0 +1,32 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+import numpy as np
+import helpermethods as helper
+from pytorch_edgeml.sweep import getSweepArgs, sweepFromArgs, trainProtoNN
+
+
+def main():
+    args = getSweepArgs('Hyperparameter sweep of ProtoNN, the grid takes ' +
+                        'the config keys of sweep.trainProtoNN ' +
+                        '(gamma is required)')
+
+    train = np.load(args.data_dir + '/train.npy')
+    test = np.load(args.data_dir + '/test.npy')
+    x_train, y_train = train[:, 1:], train[:, 0]
+    x_test, y_test = test[:, 1:], test[:, 0]
+    minval = min(min(y_train), min(y_test))
+    numClasses = max(y_train) - min(y_train) + 1
+    numClasses = int(max(numClasses, max(y_test) - min(y_test) + 1))
+    data = {"Xtrain": x_train.astype(np.float32),
+            "Ytrain": helper.to_onehot(y_train, numClasses,
+                                       minlabel=minval).astype(np.float32),
+            "Xtest": x_test.astype(np.float32),
+            "Ytest": helper.to_onehot(y_test, numClasses,
+                                      minlabel=minval).astype(np.float32)}
+
+    sweepFromArgs(trainProtoNN, args, data)
+
+
+if __name__ == '__main__':
+    main()
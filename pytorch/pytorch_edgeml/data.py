@@ -0,0 +1,217 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+import threading
+import queue
+import numpy as np
+import torch
+
+
+def toTensor(A):
+    '''
+    Returns A as a float tensor, numpy arrays are converted once (without a
+    copy when already float32) and tensors are returned as is
+    '''
+    if torch.is_tensor(A):
+        return A
+    return torch.from_numpy(np.ascontiguousarray(A, dtype=np.float32))
+
+
+def isMemmap(A):
+    '''
+    True if A is a memory mapped array (eg. np.load(..., mmap_mode='r'))
+    '''
+    return isinstance(A, np.memmap)
+
+
+def chunkedShuffle(numSamples, chunkSize):
+    '''
+    Returns a permutation of range(numSamples) which shuffles the order of
+    the contiguous chunks of chunkSize samples and then the samples within
+    every chunk. Consecutive batches read from a few chunks only, which
+    keeps the reads of memory mapped data local.
+    '''
+    assert chunkSize >= 1, 'Chunk size should be positive integer'
+    starts = np.arange(0, numSamples, chunkSize)
+    np.random.shuffle(starts)
+    return np.concatenate([np.random.permutation(
+        np.arange(start, min(start + chunkSize, numSamples)))
+        for start in starts]).astype(np.int64)
+
+
+class BatchLoader:
+    '''
+    Shared batching layer for the trainers.
+
+    X, Y: Numpy arrays or tensors, converted to tensors once. Memory mapped
+        arrays (np.load(..., mmap_mode='r')) are not loaded, only the rows
+        of every batch are read and converted
+    batchSize: Batch size
+    shuffle: Reshuffle the samples (with np.random) on every pass
+    chunkSize: If given, shuffling is done with chunkedShuffle (shuffle
+        chunks of chunkSize samples, then within the chunks)
+    dropLast: Drop the last incomplete batch
+    balanced: Split into ceil(N / batchSize) batches of nearly equal size
+        (like np.array_split) instead of fixed size batches
+    axis: Sample axis of X (eg. 1 for time major [timeSteps, N, d] data),
+        the sample axis of Y is always 0
+    device: Device the batches are moved to. For cuda devices the data is
+        pinned so that the copies are asynchronous
+    prefetch: Number of batches prepared ahead by a background thread,
+        0 disables the thread
+
+    Iterating yields (batchX, batchY) already on device.
+    '''
+
+    def __init__(self, X, Y, batchSize, shuffle=False, dropLast=False,
+                 balanced=False, axis=0, device=None, prefetch=2,
+                 chunkSize=None):
+        assert batchSize >= 1, 'Batch size should be positive integer'
+        self.lazy = isMemmap(X) or isMemmap(Y)
+        self.X = X if isMemmap(X) else toTensor(X)
+        self.Y = Y if isMemmap(Y) else toTensor(Y)
+        self.axis = axis
+        self.numSamples = self.X.shape[axis]
+        assert self.Y.shape[0] == self.numSamples, \
+            "X and Y should have the same number of samples"
+        self.batchSize = batchSize
+        self.shuffle = shuffle
+        self.chunkSize = chunkSize
+        self.dropLast = dropLast
+        self.balanced = balanced
+        self.prefetch = prefetch
+        self.device = torch.device("cpu") if device is None \
+            else torch.device(device)
+        self.pinMemory = (self.device.type == "cuda" and
+                          torch.cuda.is_available())
+        if self.pinMemory and not self.lazy:
+            self.X = self.X.pin_memory()
+            self.Y = self.Y.pin_memory()
+
+    def __len__(self):
+        if self.dropLast and not self.balanced:
+            return self.numSamples // self.batchSize
+        return int(np.ceil(self.numSamples / self.batchSize))
+
+    def getBatchIndices(self):
+        '''
+        Returns the list of batches for one pass, as slices for sequential
+        batches or index arrays when shuffled
+        '''
+        if self.balanced:
+            bounds = [len(b) for b in
+                      np.array_split(np.arange(self.numSamples), len(self))]
+            bounds = np.cumsum([0] + bounds)
+        else:
+            bounds = [j * self.batchSize for j in range(len(self))]
+            bounds.append(min(len(self) * self.batchSize, self.numSamples))
+        if self.shuffle:
+            if self.chunkSize is not None:
+                order = chunkedShuffle(self.numSamples, self.chunkSize)
+            else:
+                order = list(range(self.numSamples))
+                np.random.shuffle(order)
+                order = np.array(order, dtype=np.int64)
+            return [order[bounds[j]:bounds[j + 1]] for j in range(len(self))]
+        return [slice(int(bounds[j]), int(bounds[j + 1]))
+                for j in range(len(self))]
+
+    def getBatch(self, index):
+        '''
+        Returns the batch for a slice (a view, no copy along axis 0) or an
+        index array
+        '''
+        if self.lazy:
+            return self.readBatch(index)
+        if isinstance(index, slice):
+            length = index.stop - index.start
+            batchX = self.X.narrow(self.axis, index.start, length).contiguous()
+            batchY = self.Y.narrow(0, index.start, length)
+        else:
+            index = torch.from_numpy(index)
+            batchX = self.X.index_select(self.axis, index)
+            batchY = self.Y.index_select(0, index)
+            if self.pinMemory:
+                batchX, batchY = batchX.pin_memory(), batchY.pin_memory()
+        return (batchX.to(self.device, non_blocking=self.pinMemory),
+                batchY.to(self.device, non_blocking=self.pinMemory))
+
+    def readBatch(self, index):
+        '''
+        Reads the batch from memory mapped X and/or Y. Shuffled indices are
+        read in sorted order, the order within a batch does not matter
+        '''
+        if not isinstance(index, slice):
+            index = np.sort(index)
+        batch = []
+        for A, axis in ((self.X, self.axis), (self.Y, 0)):
+            if isMemmap(A):
+                # A slice of a memmap is a view of (read only) mapped memory,
+                # the batch is copied out of it
+                A = torch.from_numpy(np.array(
+                    A[(slice(None),) * axis + (index,)], dtype=np.float32))
+            else:
+                A = toTensor(A.cpu().numpy()[(slice(None),) * axis + (index,)])
+            if self.pinMemory:
+                A = A.pin_memory()
+            batch.append(A.to(self.device, non_blocking=self.pinMemory))
+        return tuple(batch)
+
+    def __iter__(self):
+        batches = self.getBatchIndices()
+        if self.prefetch <= 0:
+            for index in batches:
+                yield self.getBatch(index)
+            return
+
+        batchQueue = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+
+        def put(item):
+            # Gives up once the consumer stopped, returns False then
+            while not stop.is_set():
+                try:
+                    batchQueue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def producer():
+            try:
+                for index in batches:
+                    if not put(self.getBatch(index)):
+                        return
+            except Exception as e:
+                put(e)
+                return
+            put(None)
+
+        thread = threading.Thread(target=producer, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batchQueue.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+
+
+def getTorchDataLoader(X, Y, batchSize, shuffle=False, numWorkers=0,
+                       device=None):
+    '''
+    torch.utils.data.DataLoader over the same data, for multi process
+    loading. The data is converted to tensors once and pinned when device
+    is a cuda device.
+    '''
+    pinMemory = (device is not None and torch.device(device).type == "cuda"
+                 and torch.cuda.is_available())
+    dataset = torch.utils.data.TensorDataset(toTensor(X), toTensor(Y))
+    return torch.utils.data.DataLoader(dataset, batch_size=batchSize,
+                                       shuffle=shuffle,
+                                       num_workers=numWorkers,
+                                       pin_memory=pinMemory)
@@ -6,6 +6,28 @@ import torch.nn as nn
 import numpy as np
 
 
+def getNodeProb(TX, sigmaI, treeDepth):
+    '''
+    Returns the probability of reaching every node [totalNodes, batchSize]
+    given the branching scores TX = T * X_ [internalNodes, batchSize]
+    Node i has children 2i + 1 (taken w.p. (1 + tanh(sigmaI * T_i X_)) / 2)
+    and 2i + 2 (taken w.p. (1 - tanh(sigmaI * T_i X_)) / 2)
+    '''
+    batchSize = TX.shape[1]
+    levelProb = torch.ones([1, batchSize], dtype=TX.dtype, device=TX.device)
+    branch = torch.tanh(sigmaI * TX)
+    nodeProb = [levelProb]
+    for level in range(treeDepth):
+        parents = slice(2**level - 1, 2**(level + 1) - 1)
+        branch_ = branch[parents]
+        leftProb = levelProb * (1 + branch_) / 2.0
+        rightProb = levelProb * (1 - branch_) / 2.0
+        levelProb = torch.stack([leftProb, rightProb], dim=1).view(
+            -1, batchSize)
+        nodeProb.append(levelProb)
+    return torch.cat(nodeProb, dim=0)
+
+
 class Bonsai(nn.Module):
 
     def __init__(self, numClasses, dataDimension, projectionDimension,
@@ -26,7 +48,8 @@ class Bonsai(nn.Module):
         sigma - tanh non-linearity
         sigmaI - Indicator function for node probabilities
         sigmaI - has to be set to infinity(1e9 for practice)
-        while doing testing/inference
+        while doing testing/inference, hardPathForward evaluates
+        this limit directly
         numClasses will be reset to 1 in binary case
         '''
 
@@ -96,35 +119,82 @@ class Bonsai(nn.Module):
 
         X is [batchSize, self.dataDimension]
         sigmaI is constant
+
+        All node predictors and branching functions are evaluated with
+        three matmuls (W, V and T against X_) and the path probabilities
+        are built level by level with tensor ops
         '''
         X_ = torch.matmul(self.Z, torch.t(X)) / self.projectionDimension
-        W_ = self.W[0:(self.numClasses)]
-        V_ = self.V[0:(self.numClasses)]
-        self.__nodeProb = []
-        self.__nodeProb.append(1)
-        score_ = self.__nodeProb[0] * (torch.matmul(W_, X_) *
-                                       torch.tanh(self.sigma *
-                                                  torch.matmul(V_, X_)))
-        for i in range(1, self.totalNodes):
-            W_ = self.W[i * self.numClasses:((i + 1) * self.numClasses)]
-            V_ = self.V[i * self.numClasses:((i + 1) * self.numClasses)]
-
-            T_ = torch.reshape(self.T[int(np.ceil(i / 2.0) - 1.0)],
-                               [-1, self.projectionDimension])
-            prob = (1 + ((-1)**(i + 1)) *
-                    torch.tanh(sigmaI * torch.matmul(T_, X_)))
-
-            prob = prob / 2.0
-            prob = self.__nodeProb[int(np.ceil(i / 2.0) - 1.0)] * prob
-            self.__nodeProb.append(prob)
-            score_ += self.__nodeProb[i] * (torch.matmul(W_, X_) *
-                                            torch.tanh(self.sigma *
-                                                       torch.matmul(V_, X_)))
+        batchSize = X_.shape[1]
+
+        # [totalNodes, numClasses, batchSize]
+        WX = torch.matmul(self.W, X_).view(
+            self.totalNodes, self.numClasses, batchSize)
+        VX = torch.matmul(self.V, X_).view(
+            self.totalNodes, self.numClasses, batchSize)
+        nodeScores = WX * torch.tanh(self.sigma * VX)
+
+        nodeProb = getNodeProb(torch.matmul(self.T, X_), sigmaI,
+                               self.treeDepth)
+
+        score_ = torch.sum(nodeProb.unsqueeze(1) * nodeScores, dim=0)
 
         self.score = score_
         self.X_ = X_
         return torch.t(self.score), self.X_
 
+    def getPathNodes(self, leaf):
+        '''
+        Returns the node indices on the root to leaf path (root first)
+        '''
+        path = [leaf]
+        while path[-1] > 0:
+            path.append((path[-1] - 1) // 2)
+        return path[::-1]
+
+    def hardPathForward(self, X):
+        '''
+        Hard routing inference, equivalent to forward with sigmaI -> infinity
+        Every sample follows a single root to leaf path using
+        sign(T_i X_) (left child 2i + 1 if positive, else right child 2i + 2)
+        and only the depth + 1 node predictors on that path are evaluated.
+        Samples sharing a path are grouped and scored with one matmul
+        per group.
+
+        X is [batchSize, self.dataDimension]
+        Returns the scores [batchSize, numClasses] and X_
+        '''
+        X_ = torch.matmul(self.Z, torch.t(X)) / self.projectionDimension
+        batchSize = X_.shape[1]
+        Xt_ = torch.t(X_)
+
+        nodeIdx = torch.zeros([batchSize], dtype=torch.long,
+                              device=X_.device)
+        for level in range(self.treeDepth):
+            TX = torch.sum(self.T[nodeIdx] * Xt_, dim=1)
+            nodeIdx = 2 * nodeIdx + 2 - (TX > 0).long()
+
+        # [totalNodes, numClasses, projectionDimension]
+        W_ = self.W.view(self.totalNodes, self.numClasses,
+                         self.projectionDimension)
+        V_ = self.V.view(self.totalNodes, self.numClasses,
+                         self.projectionDimension)
+        score_ = torch.zeros([batchSize, self.numClasses], dtype=X_.dtype,
+                             device=X_.device)
+        for leaf in torch.unique(nodeIdx).tolist():
+            samples = (nodeIdx == leaf).nonzero().view(-1)
+            path = torch.tensor(self.getPathNodes(leaf), device=X_.device)
+            Xleaf_ = X_[:, samples]
+            WX = torch.matmul(W_[path].view(-1, self.projectionDimension),
+                              Xleaf_)
+            VX = torch.matmul(V_[path].view(-1, self.projectionDimension),
+                              Xleaf_)
+            leafScore = (WX * torch.tanh(self.sigma * VX)).view(
+                len(path), self.numClasses, -1).sum(dim=0)
+            score_[samples] = torch.t(leafScore)
+
+        return score_, X_
+
     def assertInit(self):
         errRank = "All Parameters must has only two dimensions shape = [a, b]"
         assert len(self.W.shape) == len(self.Z.shape), errRank
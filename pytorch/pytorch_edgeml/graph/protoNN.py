@@ -32,6 +32,7 @@ class ProtoNN(nn.Module):
 
         self.W, self.B, self.Z = None, None, None
         self.gamma = gamma
+        self.protoIndex = None
 
         self.__validInit = False
         self.__initWBZ(W, B, Z)
@@ -93,33 +94,150 @@ class ProtoNN(nn.Module):
         '''
         return self.W, self.B, self.Z, self.gamma
 
-    def forward(self, X):
+    def getL2Distances(self, WX):
+        '''
+        Squared L2 distances [-1, numPrototypes] between the projected data
+        WX [-1, projectionDimension] and the prototypes B, computed as
+        ||WX||^2 + ||B||^2 - 2 WX.B with a single matmul instead of
+        materializing the [-1, projectionDimension, numPrototypes] difference
+        '''
+        B = self.B
+        WXNorm = torch.sum(WX * WX, dim=1, keepdim=True)
+        BNorm = torch.sum(B * B, dim=0, keepdim=True)
+        l2sim = WXNorm + BNorm - 2.0 * torch.matmul(WX, B)
+        # Rounding can make distances of coincident points slightly negative
+        return torch.clamp(l2sim, min=0.0)
+
+    def forward(self, X, batchChunkSize=None):
         '''
         This method is responsible for construction of the forward computation
         graph. The end point of the computation graph, or in other words the
         output operator for the forward computation is returned.
 
         X: Input of shape [-1, inputDimension]
+        batchChunkSize: If not None, X is processed in chunks of at most
+            batchChunkSize rows to bound the peak memory
         returns: The forward computation outputs, self.protoNNOut
         '''
         assert self.__validInit is True, "Initialization failed!"
 
+        if batchChunkSize is not None and X.shape[0] > batchChunkSize:
+            l2sims, ys = [], []
+            for i in range(0, X.shape[0], batchChunkSize):
+                ys.append(self.forward(X[i:i + batchChunkSize]))
+                l2sims.append(self.l2sim)
+            self.l2sim = torch.cat(l2sims, dim=0)
+            return torch.cat(ys, dim=0)
+
         W, B, Z, gamma = self.W, self.B, self.Z, self.gamma
         WX = torch.matmul(X, W)
-        dim = [-1, WX.shape[1], 1]
-        WX = torch.reshape(WX, dim)
-        dim = [1, B.shape[0], -1]
-        B_ = torch.reshape(B, dim)
-        l2sim = B_ - WX
-        l2sim = torch.pow(l2sim, 2)
-        l2sim = torch.sum(l2sim, dim=1, keepdim=True)
-        self.l2sim = l2sim
+        l2sim = self.getL2Distances(WX)
+        self.l2sim = torch.unsqueeze(l2sim, 1)
         gammal2sim = (-1 * gamma * gamma) * l2sim
         M = torch.exp(gammal2sim)
-        dim = [1] + list(Z.shape)
-        Z_ = torch.reshape(Z, dim)
-        y = Z_ * M
-        y = torch.sum(y, dim=2)
+        y = torch.matmul(M, torch.t(Z))
         return y
 
+    def buildPrototypeIndex(self, numClusters, numIters=10):
+        '''
+        Builds the approximate nearest prototype index used by topKForward.
+        The prototypes (columns of B) are clustered into numClusters groups
+        with k-means. A query is then only compared against the prototypes
+        of the clusters with the closest centroids.
+
+        numClusters: Number of clusters, at most numPrototypes
+        numIters: Number of k-means (Lloyd) iterations
+        '''
+        _, _, m, _, _ = self.getHyperParams()
+        assert 1 <= numClusters <= m, "numClusters should be in [1, m]"
+        with torch.no_grad():
+            points = torch.t(self.B.data)
+            perm = torch.randperm(m, device=points.device)[:numClusters]
+            centroids = points[perm].clone()
+            for _ in range(numIters):
+                dist = torch.cdist(points, centroids)
+                assignment = torch.argmin(dist, dim=1)
+                for c in range(numClusters):
+                    members = points[assignment == c]
+                    if len(members) > 0:
+                        centroids[c] = torch.mean(members, dim=0)
+            assignment = torch.argmin(torch.cdist(points, centroids), dim=1)
+            counts = torch.bincount(assignment, minlength=numClusters)
+            maxSize = int(torch.max(counts))
+            # Clusters padded to maxSize, valid marks the real members
+            members = torch.zeros([numClusters, maxSize], dtype=torch.long,
+                                  device=points.device)
+            valid = torch.zeros([numClusters, maxSize], dtype=torch.bool,
+                                device=points.device)
+            for c in range(numClusters):
+                idx = (assignment == c).nonzero().view(-1)
+                members[c, :len(idx)] = idx
+                valid[c, :len(idx)] = True
+        self.protoIndex = (centroids, members, valid)
+        return self.protoIndex
+
+    def topKForward(self, X, k, numProbes=None, batchChunkSize=None):
+        '''
+        Inference using only the k nearest prototypes of every data point,
+        the RBF similarity of the other prototypes is taken to be 0.
+
+        X: Input of shape [-1, inputDimension]
+        k: Number of prototypes used per data point
+        numProbes: If None the k nearest prototypes are exact (partial sort
+            of all the distances). Otherwise they are searched only within
+            the numProbes clusters of the index built by
+            buildPrototypeIndex whose centroids are closest. Larger k and
+            numProbes trade latency for agreement with forward.
+        batchChunkSize: Process X in chunks of at most batchChunkSize rows
+        returns: Scores of shape [-1, numOutputLabels]
+        '''
+        assert self.__validInit is True, "Initialization failed!"
+        _, _, m, _, gamma = self.getHyperParams()
+        assert 1 <= k <= m, "k should be in [1, numPrototypes]"
+        if batchChunkSize is not None and X.shape[0] > batchChunkSize:
+            return torch.cat([self.topKForward(X[i:i + batchChunkSize], k,
+                                               numProbes)
+                              for i in range(0, X.shape[0], batchChunkSize)],
+                             dim=0)
+
+        with torch.no_grad():
+            WX = torch.matmul(X, self.W)
+            if numProbes is None:
+                l2sim = self.getL2Distances(WX)
+                l2sim, protoIdx = torch.topk(l2sim, k, dim=1, largest=False)
+            else:
+                assert self.protoIndex is not None, \
+                    "Call buildPrototypeIndex before using numProbes"
+                centroids, members, valid = self.protoIndex
+                numProbes = min(numProbes, len(centroids))
+                _, probes = torch.topk(torch.cdist(WX, centroids), numProbes,
+                                       dim=1, largest=False)
+                # Candidate prototypes [-1, numProbes * maxSize]
+                candidates = members[probes].view(len(WX), -1)
+                candValid = valid[probes].view(len(WX), -1)
+                candB = torch.t(self.B)[candidates]
+                l2sim = torch.sum((candB - WX.unsqueeze(1)) ** 2, dim=2)
+                l2sim = l2sim.masked_fill(~candValid, float('inf'))
+                k = min(k, l2sim.shape[1])
+                l2sim, pos = torch.topk(l2sim, k, dim=1, largest=False)
+                protoIdx = torch.gather(candidates, 1, pos)
+            M = torch.exp((-1 * gamma * gamma) * l2sim)
+            # Z columns of the selected prototypes [-1, k, numOutputLabels]
+            Z_ = torch.t(self.Z)[protoIdx]
+            y = torch.sum(M.unsqueeze(2) * Z_, dim=1)
+        return y
 
+    def topKAgreement(self, X, k, numProbes=None, batchChunkSize=None):
+        '''
+        Compares topKForward against the dense forward on X.
+        Returns the fraction of data points with the same predicted label
+        and the maximum absolute difference in scores.
+        '''
+        with torch.no_grad():
+            dense = self.forward(X, batchChunkSize=batchChunkSize)
+            sparse = self.topKForward(X, k, numProbes=numProbes,
+                                      batchChunkSize=batchChunkSize)
+            agreement = torch.mean((torch.argmax(dense, dim=1) ==
+                                    torch.argmax(sparse, dim=1)).double())
+            maxDiff = torch.max(torch.abs(dense - sparse))
+        return agreement.item(), maxDiff.item()
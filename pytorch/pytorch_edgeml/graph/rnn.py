@@ -4,6 +4,8 @@
 import torch
 import torch.nn as nn
 import numpy as np
+import warnings
+from typing import List
 
 def gen_non_linearity(A, non_linearity):
     '''
@@ -35,6 +37,131 @@ def gen_non_linearity(A, non_linearity):
         return non_linearity(A)
 
 
+def _fused_non_linearity(A, non_linearity: str):
+    '''
+    TorchScript compatible version of gen_non_linearity restricted to the
+    string valued non-linearities
+    '''
+    if non_linearity == "tanh":
+        return torch.tanh(A)
+    elif non_linearity == "sigmoid":
+        return torch.sigmoid(A)
+    elif non_linearity == "relu":
+        return torch.relu(A)
+    elif non_linearity == "quantTanh":
+        return torch.clamp(A, -1.0, 1.0)
+    elif non_linearity == "quantSigm":
+        return torch.clamp((A + 1.0) / 2.0, 0.0, 1.0)
+    elif non_linearity == "quantSigm4":
+        return torch.clamp((A + 2.0) / 4.0, 0.0, 1.0)
+    else:
+        raise ValueError("Unsupported non_linearity for fused execution")
+
+
+def _fused_low_rank_matmul(A, matrices: List[torch.Tensor]):
+    '''
+    Computes A * M_1 * ... * M_k for the (possibly low rank) factors of U
+    '''
+    for M in matrices:
+        A = torch.matmul(A, M)
+    return A
+
+
+def _fastgrnn_fused_unroll(wComp, h, U: List[torch.Tensor], bias_gate,
+                           bias_update, zeta, nu, gate_non_linearity: str,
+                           update_non_linearity: str):
+    '''
+    Unrolls the FastGRNN recurrence over a time major wComp
+    [timeSteps, batchSize, hiddenSize] holding the precomputed Wx_t terms
+    '''
+    zeta_ = torch.sigmoid(zeta)
+    nu_ = torch.sigmoid(nu)
+    hiddenStates = []
+    for t in range(wComp.shape[0]):
+        pre_comp = wComp[t] + _fused_low_rank_matmul(h, U)
+        z = _fused_non_linearity(pre_comp + bias_gate, gate_non_linearity)
+        c = _fused_non_linearity(pre_comp + bias_update,
+                                 update_non_linearity)
+        h = z * h + (zeta_ * (1.0 - z) + nu_) * c
+        hiddenStates.append(h)
+    return torch.stack(hiddenStates)
+
+
+def _fastrnn_fused_unroll(wComp, h, U: List[torch.Tensor], bias_update,
+                          alpha, beta, update_non_linearity: str):
+    '''
+    Unrolls the FastRNN recurrence over a time major wComp
+    [timeSteps, batchSize, hiddenSize] holding the precomputed Wx_t terms
+    '''
+    alpha_ = torch.sigmoid(alpha)
+    beta_ = torch.sigmoid(beta)
+    hiddenStates = []
+    for t in range(wComp.shape[0]):
+        pre_comp = wComp[t] + _fused_low_rank_matmul(h, U)
+        c = _fused_non_linearity(pre_comp + bias_update,
+                                 update_non_linearity)
+        h = beta_ * h + alpha_ * c
+        hiddenStates.append(h)
+    return torch.stack(hiddenStates)
+
+
+# Piecewise linear replacements used by quantization aware training
+QUANT_NON_LINEARITY = {"tanh": "quantTanh", "sigmoid": "quantSigm"}
+
+
+def fake_quantize(A, scale, maxValue=None):
+    '''
+    Fake quantization with the rounding and clipping of quantizeFastModels:
+    round(scale * A), clipped to [-(maxValue + 1), maxValue] unless maxValue
+    is None, scaled back to float. Gradients pass straight through
+    '''
+    quantA = torch.round(A * scale)
+    if maxValue is not None:
+        quantA = torch.clamp(quantA, -(maxValue + 1), maxValue)
+    return A + (quantA / scale - A).detach()
+
+
+def get_param_scale(params, maxValue):
+    '''
+    Scale factor quantizeFastModels uses for the W, U and bias matrices,
+    round((2 * maxValue + 1) / (2 * max|param|)) over all of params
+    '''
+    limit = torch.max(torch.stack([torch.max(torch.abs(param.detach()))
+                                   for param in params]))
+    return torch.round((2.0 * maxValue + 1.0) /
+                       (2.0 * torch.clamp(limit, min=1e-8)))
+
+
+_SCRIPTED_FUNCTIONS = {}
+
+
+def _is_autocast_enabled():
+    try:
+        return any(torch.is_autocast_enabled(deviceType)
+                   for deviceType in ("cpu", "cuda"))
+    except TypeError:
+        return torch.is_autocast_enabled() or torch.is_autocast_cpu_enabled()
+
+
+def get_fused_function(fn):
+    '''
+    Returns the torch.jit.script compiled version of fn, compiled lazily
+    on first use and cached. Falls back to the eager python function if
+    TorchScript is unavailable or autocast is enabled (the scripted
+    gradients do not follow the autocast dtypes).
+    '''
+    if _is_autocast_enabled():
+        return fn
+    if fn not in _SCRIPTED_FUNCTIONS:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                _SCRIPTED_FUNCTIONS[fn] = torch.jit.script(fn)
+        except Exception:
+            _SCRIPTED_FUNCTIONS[fn] = fn
+    return _SCRIPTED_FUNCTIONS[fn]
+
+
 class BaseRNN(nn.Module):
     '''
     Generic equivalent of static_rnn in tf
@@ -42,15 +169,73 @@ class BaseRNN(nn.Module):
     We assume data to be batch_first by default ie.,
     [batchSize, timeSteps, inputDims] else
     [timeSteps, batchSize, inputDims]
+
+    Cells exposing computeWComp and forwardWithWComp get their input
+    projection Wx_t computed for all the timesteps in one matmul, only the
+    recurrent part is evaluated step by step. Cells exposing quantizedParams
+    get their parameters prepared once per unroll and passed to every step.
+
+    fused = True additionally runs the recurrence in a TorchScript compiled
+    loop. Only applicable to cells exposing fusedUnroll (FastGRNNCell and
+    FastRNNCell with string non-linearities), others use the python loop
     '''
 
-    def __init__(self, RNNCell, batch_first=True):
+    def __init__(self, RNNCell, batch_first=True, fused=False):
         super(BaseRNN, self).__init__()
         self.RNNCell = RNNCell
         self.batch_first = batch_first
+        self.fused = fused
+
+    def isFused(self):
+        '''
+        Returns True if the fused unroll will be used for this cell
+        '''
+        return (self.fused is True and
+                hasattr(self.RNNCell, "fusedUnroll") and
+                self.RNNCell.supportsFused)
+
+    def fusedForward(self, input, hiddenState=None):
+        '''
+        Fused unroll: one batched matmul for the input projection of all
+        timesteps followed by the compiled recurrence
+        '''
+        params = self.RNNCell.quantizedParams()
+        wComp = self.RNNCell.computeWComp(input, params)
+        if self.batch_first is True:
+            wComp = wComp.transpose(0, 1)
+        if hiddenState is None:
+            hiddenState = torch.zeros([wComp.shape[1],
+                                       self.RNNCell.output_size],
+                                      dtype=wComp.dtype, device=wComp.device)
+        hiddenStates = self.RNNCell.fusedUnroll(wComp, hiddenState, params)
+        if self.batch_first is True:
+            hiddenStates = hiddenStates.transpose(0, 1)
+        return hiddenStates
 
     def forward(self, input, hiddenState=None,
                 cellState=None):
+        if self.isFused():
+            return self.fusedForward(input, hiddenState)
+        # Hoist the input projection of all timesteps into one matmul
+        # when the cell supports it, only the recurrence runs per step
+        timeAxis = 1 if self.batch_first is True else 0
+        if hasattr(self.RNNCell, "quantizedParams"):
+            # The (fake quantized) parameters are prepared once per unroll
+            params = self.RNNCell.quantizedParams()
+            stepInput = torch.unbind(
+                self.RNNCell.computeWComp(input, params), dim=timeAxis)
+
+            def stepFunction(wComp, state):
+                return self.RNNCell.forwardWithWComp(wComp, state, params)
+        elif hasattr(self.RNNCell, "computeWComp"):
+            # unbind keeps the backward pass to a single stack instead of
+            # a full size gradient per sliced timestep
+            stepInput = torch.unbind(self.RNNCell.computeWComp(input),
+                                     dim=timeAxis)
+            stepFunction = self.RNNCell.forwardWithWComp
+        else:
+            stepInput = torch.unbind(input, dim=timeAxis)
+            stepFunction = self.RNNCell
         if self.batch_first is True:
             self.device = input.device
             hiddenStates = torch.zeros(
@@ -67,14 +252,14 @@ class BaseRNN(nn.Module):
                     cellState = torch.zeros(
                         [input.shape[0], self.RNNCell.output_size]).to(self.device)
                 for i in range(0, input.shape[1]):
-                    hiddenState, cellState = self.RNNCell(
-                        input[:, i, :], (hiddenState, cellState))
+                    hiddenState, cellState = stepFunction(
+                        stepInput[i], (hiddenState, cellState))
                     hiddenStates[:, i, :] = hiddenState
                     cellStates[:, i, :] = cellState
                 return hiddenStates, cellStates
             else:
                 for i in range(0, input.shape[1]):
-                    hiddenState = self.RNNCell(input[:, i, :], hiddenState)
+                    hiddenState = stepFunction(stepInput[i], hiddenState)
                     hiddenStates[:, i, :] = hiddenState
                 return hiddenStates
         else:
@@ -93,14 +278,14 @@ class BaseRNN(nn.Module):
                     cellState = torch.zeros(
                         [input.shape[1], self.RNNCell.output_size]).to(self.device)
                 for i in range(0, input.shape[0]):
-                    hiddenState, cellState = self.RNNCell(
-                        input[i, :, :], (hiddenState, cellState))
+                    hiddenState, cellState = stepFunction(
+                        stepInput[i], (hiddenState, cellState))
                     hiddenStates[i, :, :] = hiddenState
                     cellStates[i, :, :] = cellState
                 return hiddenStates, cellStates
             else:
                 for i in range(0, input.shape[0]):
-                    hiddenState = self.RNNCell(input[i, :, :], hiddenState)
+                    hiddenState = stepFunction(stepInput[i], hiddenState)
                     hiddenStates[i, :, :] = hiddenState
                 return hiddenStates
 
@@ -120,6 +305,9 @@ class FastGRNNCell(nn.Module):
     uRank = rank of U matrix (creates two matrices if not None)
     zetaInit = init for zeta, the scale param
     nuInit = init for nu, the translation param
+    qatMaxValue = enables quantization aware training for this max
+    quantized value (eg. 127 for int8), see setQAT
+    scalarScaleFactor = scale of the quantized sigmoid(zeta), sigmoid(nu)
 
     FastGRNN architecture and compression techniques are found in
     FastGRNN(LINK) paper
@@ -136,7 +324,8 @@ class FastGRNNCell(nn.Module):
 
     def __init__(self, input_size, hidden_size, gate_non_linearity="sigmoid",
                  update_non_linearity="tanh", wRank=None, uRank=None,
-                 zetaInit=1.0, nuInit=-4.0, name="FastGRNN"):
+                 zetaInit=1.0, nuInit=-4.0, name="FastGRNN",
+                 qatMaxValue=None, scalarScaleFactor=1000):
         super(FastGRNNCell, self).__init__()
 
         self._input_size = input_size
@@ -172,6 +361,10 @@ class FastGRNNCell(nn.Module):
         self.zeta = nn.Parameter(self._zetaInit * torch.ones([1, 1]))
         self.nu = nn.Parameter(self._nuInit * torch.ones([1, 1]))
 
+        self._floatNonLinearities = (gate_non_linearity, update_non_linearity)
+        self._qatMaxValue = None
+        self.setQAT(qatMaxValue, scalarScaleFactor)
+
     @property
     def state_size(self):
         return self._hidden_size
@@ -212,27 +405,118 @@ class FastGRNNCell(nn.Module):
     def cellType(self):
         return "FastGRNN"
 
-    def forward(self, input, state):
+    @property
+    def qatMaxValue(self):
+        return self._qatMaxValue
+
+    @property
+    def supportsFused(self):
+        return (isinstance(self._gate_non_linearity, str) and
+                isinstance(self._update_non_linearity, str) and
+                self._qatMaxValue is None)
+
+    def setQAT(self, maxValue=127, scalarScaleFactor=1000):
+        '''
+        Enables quantization aware training, maxValue None disables it
+        W, U and the biases are fake quantized with the shared scale of
+        quantizeFastModels, sigmoid(zeta) and sigmoid(nu) with
+        scalarScaleFactor. tanh/sigmoid are replaced by quantTanh/quantSigm
+        whose outputs (in [-1, 1]) are fake quantized with scale maxValue
+        '''
+        self._qatMaxValue = maxValue
+        self._scalarScaleFactor = scalarScaleFactor
+        gate, update = self._floatNonLinearities
+        if maxValue is not None:
+            gate = QUANT_NON_LINEARITY.get(gate, gate)
+            update = QUANT_NON_LINEARITY.get(update, update)
+        self._gate_non_linearity = gate
+        self._update_non_linearity = update
+
+    def quantizedParams(self):
+        '''
+        Returns the W matrices, U matrices, biases (bias_gate, bias_update)
+        and scalars (sigmoid(zeta), sigmoid(nu)) used by the forward pass,
+        fake quantized when QAT is enabled. Computed once per unroll and
+        passed to computeWComp and forwardWithWComp
+        '''
         if self._wRank is None:
-            wComp = torch.matmul(input, self.W)
+            wMatrices = [self.W]
         else:
-            wComp = torch.matmul(
-                torch.matmul(input, self.W1), self.W2)
-
+            wMatrices = [self.W1, self.W2]
         if self._uRank is None:
-            uComp = torch.matmul(state, self.U)
+            uMatrices = [self.U]
         else:
-            uComp = torch.matmul(
-                torch.matmul(state, self.U1), self.U2)
+            uMatrices = [self.U1, self.U2]
+        biases = [self.bias_gate, self.bias_update]
+        if self._qatMaxValue is not None:
+            scale = get_param_scale(self.getVars()[:-2], self._qatMaxValue)
+            wMatrices, uMatrices, biases = [
+                [fake_quantize(A, scale, self._qatMaxValue) for A in group]
+                for group in (wMatrices, uMatrices, biases)]
+        return wMatrices, uMatrices, biases, self.getScalars()
+
+    def activation(self, A, non_linearity):
+        A = gen_non_linearity(A, non_linearity)
+        if (self._qatMaxValue is not None and
+                non_linearity in ["quantTanh", "quantSigm", "quantSigm4"]):
+            A = fake_quantize(A, self._qatMaxValue, self._qatMaxValue)
+        return A
+
+    def getScalars(self):
+        '''
+        Returns sigmoid(zeta), sigmoid(nu), fake quantized under QAT
+        '''
+        zeta_ = torch.sigmoid(self.zeta)
+        nu_ = torch.sigmoid(self.nu)
+        if self._qatMaxValue is None:
+            return zeta_, nu_
+        return (fake_quantize(zeta_, self._scalarScaleFactor),
+                fake_quantize(nu_, self._scalarScaleFactor))
+
+    def computeWComp(self, input, params=None):
+        '''
+        Input contribution Wx_t, input can be [..., input_size]
+        params = output of quantizedParams, computed if None
+        '''
+        if params is None:
+            params = self.quantizedParams()
+        return _fused_low_rank_matmul(input, params[0])
+
+    def fusedUnroll(self, wComp, state, params=None):
+        '''
+        Runs the recurrence over a time major precomputed
+        wComp [timeSteps, batchSize, hidden_size]
+        params = output of quantizedParams, computed if None
+        '''
+        if params is None:
+            params = self.quantizedParams()
+        _, uMatrices, (bias_gate, bias_update), _ = params
+        unroll = get_fused_function(_fastgrnn_fused_unroll)
+        return unroll(wComp, state, uMatrices, bias_gate, bias_update,
+                      self.zeta, self.nu, self._gate_non_linearity,
+                      self._update_non_linearity)
+
+    def forward(self, input, state):
+        params = self.quantizedParams()
+        return self.forwardWithWComp(self.computeWComp(input, params), state,
+                                     params)
+
+    def forwardWithWComp(self, wComp, state, params=None):
+        '''
+        Single step of the cell given the precomputed wComp = Wx_t
+        params = output of quantizedParams, computed if None
+        '''
+        if params is None:
+            params = self.quantizedParams()
+        _, uMatrices, (bias_gate, bias_update), (zeta_, nu_) = params
+        uComp = _fused_low_rank_matmul(state, uMatrices)
 
         pre_comp = wComp + uComp
 
-        z = gen_non_linearity(pre_comp + self.bias_gate,
-                              self._gate_non_linearity)
-        c = gen_non_linearity(pre_comp + self.bias_update,
-                              self._update_non_linearity)
-        new_h = z * state + (torch.sigmoid(self.zeta) *
-                             (1.0 - z) + torch.sigmoid(self.nu)) * c
+        z = self.activation(pre_comp + bias_gate, self._gate_non_linearity)
+        c = self.activation(pre_comp + bias_update,
+                            self._update_non_linearity)
+        new_h = z * state + (zeta_ * (1.0 - z) + nu_) * c
 
         return new_h
 
@@ -267,6 +551,9 @@ class FastRNNCell(nn.Module):
     uRank = rank of U matrix (creates two matrices if not None)
     alphaInit = init for alpha, the update scalar
     betaInit = init for beta, the weight for previous state
+    qatMaxValue = enables quantization aware training for this max
+    quantized value (eg. 127 for int8), see setQAT
+    scalarScaleFactor = scale of the quantized sigmoid(alpha), sigmoid(beta)
 
     FastRNN architecture and compression techniques are found in
     FastGRNN(LINK) paper
@@ -282,7 +569,8 @@ class FastRNNCell(nn.Module):
 
     def __init__(self, input_size, hidden_size,
                  update_non_linearity="tanh", wRank=None, uRank=None,
-                 alphaInit=-3.0, betaInit=3.0, name="FastRNN"):
+                 alphaInit=-3.0, betaInit=3.0, name="FastRNN",
+                 qatMaxValue=None, scalarScaleFactor=1000):
         super(FastRNNCell, self).__init__()
 
         self._input_size = input_size
@@ -316,6 +604,10 @@ class FastRNNCell(nn.Module):
         self.alpha = nn.Parameter(self._alphaInit * torch.ones([1, 1]))
         self.beta = nn.Parameter(self._betaInit * torch.ones([1, 1]))
 
+        self._floatNonLinearity = update_non_linearity
+        self._qatMaxValue = None
+        self.setQAT(qatMaxValue, scalarScaleFactor)
+
     @property
     def state_size(self):
         return self._hidden_size
@@ -352,25 +644,113 @@ class FastRNNCell(nn.Module):
     def cellType(self):
         return "FastRNN"
 
-    def forward(self, input, state):
+    @property
+    def qatMaxValue(self):
+        return self._qatMaxValue
+
+    @property
+    def supportsFused(self):
+        return (isinstance(self._update_non_linearity, str) and
+                self._qatMaxValue is None)
+
+    def setQAT(self, maxValue=127, scalarScaleFactor=1000):
+        '''
+        Enables quantization aware training, maxValue None disables it
+        W, U and the bias are fake quantized with the shared scale of
+        quantizeFastModels, sigmoid(alpha) and sigmoid(beta) with
+        scalarScaleFactor. tanh/sigmoid are replaced by quantTanh/quantSigm
+        whose outputs (in [-1, 1]) are fake quantized with scale maxValue
+        '''
+        self._qatMaxValue = maxValue
+        self._scalarScaleFactor = scalarScaleFactor
+        update = self._floatNonLinearity
+        if maxValue is not None:
+            update = QUANT_NON_LINEARITY.get(update, update)
+        self._update_non_linearity = update
+
+    def quantizedParams(self):
+        '''
+        Returns the W matrices, U matrices, biases (bias_update) and scalars
+        (sigmoid(alpha), sigmoid(beta)) used by the forward pass, fake
+        quantized when QAT is enabled. Computed once per unroll and passed
+        to computeWComp and forwardWithWComp
+        '''
         if self._wRank is None:
-            wComp = torch.matmul(input, self.W)
+            wMatrices = [self.W]
         else:
-            wComp = torch.matmul(
-                torch.matmul(input, self.W1), self.W2)
-
+            wMatrices = [self.W1, self.W2]
         if self._uRank is None:
-            uComp = torch.matmul(state, self.U)
+            uMatrices = [self.U]
         else:
-            uComp = torch.matmul(
-                torch.matmul(state, self.U1), self.U2)
+            uMatrices = [self.U1, self.U2]
+        biases = [self.bias_update]
+        if self._qatMaxValue is not None:
+            scale = get_param_scale(self.getVars()[:-2], self._qatMaxValue)
+            wMatrices, uMatrices, biases = [
+                [fake_quantize(A, scale, self._qatMaxValue) for A in group]
+                for group in (wMatrices, uMatrices, biases)]
+        return wMatrices, uMatrices, biases, self.getScalars()
+
+    def activation(self, A, non_linearity):
+        A = gen_non_linearity(A, non_linearity)
+        if (self._qatMaxValue is not None and
+                non_linearity in ["quantTanh", "quantSigm", "quantSigm4"]):
+            A = fake_quantize(A, self._qatMaxValue, self._qatMaxValue)
+        return A
+
+    def getScalars(self):
+        '''
+        Returns sigmoid(alpha), sigmoid(beta), fake quantized under QAT
+        '''
+        alpha_ = torch.sigmoid(self.alpha)
+        beta_ = torch.sigmoid(self.beta)
+        if self._qatMaxValue is None:
+            return alpha_, beta_
+        return (fake_quantize(alpha_, self._scalarScaleFactor),
+                fake_quantize(beta_, self._scalarScaleFactor))
+
+    def computeWComp(self, input, params=None):
+        '''
+        Input contribution Wx_t, input can be [..., input_size]
+        params = output of quantizedParams, computed if None
+        '''
+        if params is None:
+            params = self.quantizedParams()
+        return _fused_low_rank_matmul(input, params[0])
+
+    def fusedUnroll(self, wComp, state, params=None):
+        '''
+        Runs the recurrence over a time major precomputed
+        wComp [timeSteps, batchSize, hidden_size]
+        params = output of quantizedParams, computed if None
+        '''
+        if params is None:
+            params = self.quantizedParams()
+        _, uMatrices, (bias_update,), _ = params
+        unroll = get_fused_function(_fastrnn_fused_unroll)
+        return unroll(wComp, state, uMatrices, bias_update,
+                      self.alpha, self.beta, self._update_non_linearity)
+
+    def forward(self, input, state):
+        params = self.quantizedParams()
+        return self.forwardWithWComp(self.computeWComp(input, params), state,
+                                     params)
+
+    def forwardWithWComp(self, wComp, state, params=None):
+        '''
+        Single step of the cell given the precomputed wComp = Wx_t
+        params = output of quantizedParams, computed if None
+        '''
+        if params is None:
+            params = self.quantizedParams()
+        _, uMatrices, (bias_update,), (alpha_, beta_) = params
+        uComp = _fused_low_rank_matmul(state, uMatrices)
 
         pre_comp = wComp + uComp
 
-        c = gen_non_linearity(pre_comp + self.bias_update,
-                              self._update_non_linearity)
-        new_h = torch.sigmoid(self.beta) * state + \
-            torch.sigmoid(self.alpha) * c
+        c = self.activation(pre_comp + bias_update,
+                            self._update_non_linearity)
+        new_h = beta_ * state + alpha_ * c
 
         return new_h
 
@@ -520,23 +900,28 @@ class LSTMLRCell(nn.Module):
     def cellType(self):
         return "LSTMLR"
 
+    def computeWComp(self, input):
+        '''
+        Input contribution of all four gates concatenated along the last
+        axis, [..., 4 * hidden_size], computed with a single matmul
+        '''
+        WCat = torch.cat([self.W1, self.W2, self.W3, self.W4], dim=1)
+        if self._wRank is None:
+            wComp = torch.matmul(input, WCat)
+        else:
+            wComp = torch.matmul(torch.matmul(input, self.W), WCat)
+        return wComp
+
     def forward(self, input, hiddenStates):
+        return self.forwardWithWComp(self.computeWComp(input), hiddenStates)
+
+    def forwardWithWComp(self, wComp, hiddenStates):
+        '''
+        Single step of the cell given the precomputed wComp from computeWComp
+        '''
         (h, c) = hiddenStates
 
-        if self._wRank is None:
-            wComp1 = torch.matmul(input, self.W1)
-            wComp2 = torch.matmul(input, self.W2)
-            wComp3 = torch.matmul(input, self.W3)
-            wComp4 = torch.matmul(input, self.W4)
-        else:
-            wComp1 = torch.matmul(
-                torch.matmul(input, self.W), self.W1)
-            wComp2 = torch.matmul(
-                torch.matmul(input, self.W), self.W2)
-            wComp3 = torch.matmul(
-                torch.matmul(input, self.W), self.W3)
-            wComp4 = torch.matmul(
-                torch.matmul(input, self.W), self.W4)
+        wComp1, wComp2, wComp3, wComp4 = torch.chunk(wComp, 4, dim=-1)
 
         if self._uRank is None:
             uComp1 = torch.matmul(h, self.U1)
@@ -707,18 +1092,26 @@ class GRULRCell(nn.Module):
     def cellType(self):
         return "GRULR"
 
-    def forward(self, input, state):
+    def computeWComp(self, input):
+        '''
+        Input contribution of all three gates concatenated along the last
+        axis, [..., 3 * hidden_size], computed with a single matmul
+        '''
+        WCat = torch.cat([self.W1, self.W2, self.W3], dim=1)
         if self._wRank is None:
-            wComp1 = torch.matmul(input, self.W1)
-            wComp2 = torch.matmul(input, self.W2)
-            wComp3 = torch.matmul(input, self.W3)
+            wComp = torch.matmul(input, WCat)
         else:
-            wComp1 = torch.matmul(
-                torch.matmul(input, self.W), self.W1)
-            wComp2 = torch.matmul(
-                torch.matmul(input, self.W), self.W2)
-            wComp3 = torch.matmul(
-                torch.matmul(input, self.W), self.W3)
+            wComp = torch.matmul(torch.matmul(input, self.W), WCat)
+        return wComp
+
+    def forward(self, input, state):
+        return self.forwardWithWComp(self.computeWComp(input), state)
+
+    def forwardWithWComp(self, wComp, state):
+        '''
+        Single step of the cell given the precomputed wComp from computeWComp
+        '''
+        wComp1, wComp2, wComp3 = torch.chunk(wComp, 3, dim=-1)
 
         if self._uRank is None:
             uComp1 = torch.matmul(state, self.U1)
@@ -877,15 +1270,26 @@ class UGRNNLRCell(nn.Module):
     def cellType(self):
         return "UGRNNLR"
 
-    def forward(self, input, state):
+    def computeWComp(self, input):
+        '''
+        Input contribution of both gates concatenated along the last
+        axis, [..., 2 * hidden_size], computed with a single matmul
+        '''
+        WCat = torch.cat([self.W1, self.W2], dim=1)
         if self._wRank is None:
-            wComp1 = torch.matmul(input, self.W1)
-            wComp2 = torch.matmul(input, self.W2)
+            wComp = torch.matmul(input, WCat)
         else:
-            wComp1 = torch.matmul(
-                torch.matmul(input, self.W), self.W1)
-            wComp2 = torch.matmul(
-                torch.matmul(input, self.W), self.W2)
+            wComp = torch.matmul(torch.matmul(input, self.W), WCat)
+        return wComp
+
+    def forward(self, input, state):
+        return self.forwardWithWComp(self.computeWComp(input), state)
+
+    def forwardWithWComp(self, wComp, state):
+        '''
+        Single step of the cell given the precomputed wComp from computeWComp
+        '''
+        wComp1, wComp2 = torch.chunk(wComp, 2, dim=-1)
 
         if self._uRank is None:
             uComp1 = torch.matmul(state, self.U1)
@@ -1001,7 +1405,8 @@ class FastRNN(nn.Module):
 
     def __init__(self, input_size, hidden_size,
                  update_non_linearity="tanh", wRank=None, uRank=None,
-                 alphaInit=-3.0, betaInit=3.0, batch_first=True):
+                 alphaInit=-3.0, betaInit=3.0, batch_first=True,
+                 fused=False):
         super(FastRNN, self).__init__()
         self._input_size = input_size
         self._hidden_size = hidden_size
@@ -1014,7 +1419,8 @@ class FastRNN(nn.Module):
                                 update_non_linearity=update_non_linearity,
                                 wRank=wRank, uRank=uRank,
                                 alphaInit=alphaInit, betaInit=betaInit)
-        self.unrollRNN = BaseRNN(self.cell, batch_first=self.batch_first)
+        self.unrollRNN = BaseRNN(self.cell, batch_first=self.batch_first,
+                                 fused=fused)
 
     def forward(self, input, hiddenState=None, cellState=None):
         return self.unrollRNN(input, hiddenState, cellState)
@@ -1025,7 +1431,8 @@ class FastGRNN(nn.Module):
 
     def __init__(self, input_size, hidden_size, gate_non_linearity="sigmoid",
                  update_non_linearity="tanh", wRank=None, uRank=None,
-                 zetaInit=1.0, nuInit=-4.0, batch_first=True):
+                 zetaInit=1.0, nuInit=-4.0, batch_first=True,
+                 fused=False):
         super(FastGRNN, self).__init__()
         self._input_size = input_size
         self._hidden_size = hidden_size
@@ -1040,12 +1447,154 @@ class FastGRNN(nn.Module):
                                  update_non_linearity=update_non_linearity,
                                  wRank=wRank, uRank=uRank,
                                  zetaInit=zetaInit, nuInit=nuInit)
-        self.unrollRNN = BaseRNN(self.cell, batch_first=self.batch_first)
+        self.unrollRNN = BaseRNN(self.cell, batch_first=self.batch_first,
+                                 fused=fused)
 
     def forward(self, input, hiddenState=None, cellState=None):
         return self.unrollRNN(input, hiddenState, cellState)
 
 
+def _inplace_non_linearity(A, non_linearity):
+    '''
+    In place counterpart of gen_non_linearity used by the streaming
+    inference path to avoid allocating intermediate tensors
+    '''
+    if non_linearity == "tanh":
+        return A.tanh_()
+    elif non_linearity == "sigmoid":
+        return A.sigmoid_()
+    elif non_linearity == "relu":
+        return A.relu_()
+    elif non_linearity == "quantTanh":
+        return A.clamp_(-1.0, 1.0)
+    elif non_linearity == "quantSigm":
+        return A.add_(1.0).div_(2.0).clamp_(0.0, 1.0)
+    elif non_linearity == "quantSigm4":
+        return A.add_(2.0).div_(4.0).clamp_(0.0, 1.0)
+    else:
+        return A.copy_(gen_non_linearity(A, non_linearity))
+
+
+class StreamingRNN(nn.Module):
+    '''
+    Stateful single step inference wrapper for FastGRNNCell and FastRNNCell
+    Used for on-line inference where frames arrive one at a time and the
+    hidden state has to be kept between calls
+
+    RNNCell = trained FastGRNNCell or FastRNNCell
+    numStreams = # of independent streams evaluated together, every call
+    to forward takes one frame per stream [numStreams, inputDims]
+
+    The hidden state and all the intermediate buffers are preallocated, so
+    a step is one cell evaluation without any tensor allocation (for the
+    string valued non-linearities). The scalars sigmoid(zeta), sigmoid(nu)
+    (resp. sigmoid(alpha), sigmoid(beta)) are cached, call reset() after
+    updating the cell parameters. Cells with QAT enabled are stepped through
+    forwardWithWComp with their cached fake quantized parameters, which
+    allocates the intermediate tensors.
+    '''
+
+    def __init__(self, RNNCell, numStreams=1):
+        super(StreamingRNN, self).__init__()
+        supportedCells = ["FastGRNN", "FastRNN"]
+        assert RNNCell.cellType in supportedCells, \
+            'Currently supported cells: %r' % supportedCells
+        assert numStreams >= 1, "numStreams should be >= 1"
+        self.RNNCell = RNNCell
+        self.numStreams = numStreams
+
+        device = RNNCell.bias_update.device
+        hiddenSize = RNNCell.output_size
+        self.register_buffer("hiddenState",
+                             torch.zeros([numStreams, hiddenSize],
+                                         device=device))
+        self.register_buffer("_preComp", torch.zeros([numStreams, hiddenSize],
+                                                     device=device))
+        self.register_buffer("_uComp", torch.zeros([numStreams, hiddenSize],
+                                                   device=device))
+        self.register_buffer("_gate", torch.zeros([numStreams, hiddenSize],
+                                                  device=device))
+        self.register_buffer("_update", torch.zeros([numStreams, hiddenSize],
+                                                    device=device))
+        if RNNCell.wRank is not None:
+            self.register_buffer("_wLowRank",
+                                 torch.zeros([numStreams, RNNCell.wRank],
+                                             device=device))
+        if RNNCell.uRank is not None:
+            self.register_buffer("_uLowRank",
+                                 torch.zeros([numStreams, RNNCell.uRank],
+                                             device=device))
+        self.reset()
+
+    def reset(self, streamIds=None):
+        '''
+        Zeros the hidden state of all the streams or only of streamIds
+        and refreshes the cached cell scalars
+        '''
+        with torch.no_grad():
+            if streamIds is None:
+                self.hiddenState.zero_()
+            else:
+                self.hiddenState[streamIds] = 0.0
+            self._qatParams = None
+            if self.RNNCell.qatMaxValue is not None:
+                self._qatParams = self.RNNCell.quantizedParams()
+            if self.RNNCell.cellType == "FastGRNN":
+                self._scalarA = torch.sigmoid(self.RNNCell.zeta).item()
+                self._scalarB = torch.sigmoid(self.RNNCell.nu).item()
+            else:
+                self._scalarA = torch.sigmoid(self.RNNCell.alpha).item()
+                self._scalarB = torch.sigmoid(self.RNNCell.beta).item()
+
+    def _matmulInto(self, A, matrices, lowRankBuffer, out):
+        if len(matrices) == 1:
+            return torch.matmul(A, matrices[0], out=out)
+        torch.matmul(A, matrices[0], out=lowRankBuffer)
+        return torch.matmul(lowRankBuffer, matrices[1], out=out)
+
+    def forward(self, input):
+        '''
+        input is [numStreams, inputDims], one frame per stream
+        Returns the hiddenState buffer [numStreams, hiddenDims], it is
+        overwritten by the next call (clone it to keep it)
+        '''
+        cell = self.RNNCell
+        h = self.hiddenState
+        with torch.no_grad():
+            if self._qatParams is not None:
+                wComp = cell.computeWComp(input, self._qatParams)
+                return h.copy_(cell.forwardWithWComp(wComp, h,
+                                                     self._qatParams))
+            if cell.wRank is None:
+                wMatrices = [cell.W]
+            else:
+                wMatrices = [cell.W1, cell.W2]
+            self._matmulInto(input, wMatrices,
+                             getattr(self, "_wLowRank", None), self._preComp)
+            if cell.uRank is None:
+                uMatrices = [cell.U]
+            else:
+                uMatrices = [cell.U1, cell.U2]
+            self._matmulInto(h, uMatrices,
+                             getattr(self, "_uLowRank", None), self._uComp)
+            self._preComp.add_(self._uComp)
+
+            c = torch.add(self._preComp, cell.bias_update, out=self._update)
+            _inplace_non_linearity(c, cell.update_non_linearity)
+
+            if cell.cellType == "FastGRNN":
+                z = torch.add(self._preComp, cell.bias_gate, out=self._gate)
+                _inplace_non_linearity(z, cell.gate_non_linearity)
+                # h = z * h + (sigmoid(zeta) * (1 - z) + sigmoid(nu)) * c
+                h.mul_(z)
+                z.mul_(-self._scalarA).add_(self._scalarA + self._scalarB)
+                h.addcmul_(z, c)
+            else:
+                # h = sigmoid(beta) * h + sigmoid(alpha) * c
+                h.mul_(self._scalarB).add_(c, alpha=self._scalarA)
+        return h
+
+
 class SRNN2(nn.Module):
 
     def __init__(self, inputDim, outputDim, hiddenDim0, hiddenDim1, cellType,
@@ -1160,3 +1709,108 @@ class SRNN2(nn.Module):
         hidd1 = torch.squeeze(hidd1[-1])
         out = torch.matmul(hidd1, self.W) + self.B
         return out
+
+
+class SlidingSRNN2(nn.Module):
+
+    def __init__(self, srnn2, brickSize, numBricks):
+        '''
+        Incremental inference for SRNN2 over a sliding window that hops by
+        one brick at a time.
+
+        srnn2: Trained SRNN2 instance.
+        brickSize: The brick size used with srnn2.
+        numBricks: Number of bricks in a window, ie. the window spans
+            numBricks * brickSize timesteps.
+
+        The lower layer summary (last rnn0 hidden state) of every brick in
+        the window is kept in a ring buffer. Each hop only evaluates rnn0 on
+        the newest brick and rnn1 on the numBricks cached summaries instead
+        of rebricking and recomputing the entire window. Dropout is not
+        applied (inference only).
+        '''
+        super(SlidingSRNN2, self).__init__()
+        assert brickSize >= 1, "brickSize should be >= 1"
+        assert numBricks >= 1, "numBricks should be >= 1"
+        self.srnn2 = srnn2
+        self.brickSize = brickSize
+        self.numBricks = numBricks
+        self.reset()
+
+    def reset(self):
+        '''
+        Empties the brick cache, the next window is built from scratch
+        '''
+        self.brickCache = None
+        self.cacheHead = 0
+        self.numCached = 0
+
+    def _lastHiddenState(self, rnn, x):
+        if self.srnn2.cellType == 'LSTM':
+            hidd, _ = rnn(x)
+        else:
+            hidd = rnn(x)
+        return hidd[-1]
+
+    def _brickSummaries(self, x_bricks):
+        '''
+        x_bricks: [brickSize, N, featureDim] -> [N, hiddenDim0]
+        '''
+        return self._lastHiddenState(self.srnn2.rnn0, x_bricks)
+
+    def _pushSummaries(self, summaries):
+        '''
+        summaries: [k, batchSize, hiddenDim0] oldest first
+        '''
+        if self.brickCache is None or \
+                self.brickCache.shape[1] != summaries.shape[1]:
+            self.brickCache = torch.zeros(
+                [self.numBricks, summaries.shape[1], summaries.shape[2]],
+                dtype=summaries.dtype, device=summaries.device)
+            self.cacheHead = 0
+            self.numCached = 0
+        for i in range(summaries.shape[0]):
+            self.brickCache[self.cacheHead] = summaries[i]
+            self.cacheHead = (self.cacheHead + 1) % self.numBricks
+            self.numCached = min(self.numCached + 1, self.numBricks)
+
+    def _upperLayer(self):
+        # Oldest brick is at cacheHead once the ring buffer is full
+        inp1 = torch.roll(self.brickCache, -self.cacheHead, dims=0)
+        hidd1 = self._lastHiddenState(self.srnn2.rnn1, inp1)
+        return torch.matmul(hidd1, self.srnn2.W) + self.srnn2.B
+
+    def prime(self, x):
+        '''
+        Fills the cache from a full window x [numBricks * brickSize,
+        batchSize, featureDim] with all its bricks batched through rnn0
+        and returns the output for that window
+        '''
+        assert x.ndimension() == 3
+        assert x.shape[0] == self.numBricks * self.brickSize, \
+            "x should span numBricks * brickSize timesteps"
+        self.reset()
+        with torch.no_grad():
+            batchSize = x.shape[1]
+            x_bricks = x.view(self.numBricks, self.brickSize, batchSize, -1)
+            x_bricks = x_bricks.permute(1, 0, 2, 3).reshape(
+                self.brickSize, self.numBricks * batchSize, -1)
+            summaries = self._brickSummaries(x_bricks)
+            self._pushSummaries(summaries.view(self.numBricks, batchSize, -1))
+            return self._upperLayer()
+
+    def forward(self, xBrick):
+        '''
+        xBrick: Newest brick [brickSize, batchSize, featureDim]
+        Returns the output for the window ending with xBrick, or None until
+        numBricks bricks have been pushed.
+        '''
+        assert xBrick.ndimension() == 3
+        assert xBrick.shape[0] == self.brickSize, \
+            "xBrick should be [brickSize, batchSize, featureDim]"
+        with torch.no_grad():
+            summary = self._brickSummaries(xBrick)
+            self._pushSummaries(summary.unsqueeze(0))
+            if self.numCached < self.numBricks:
+                return None
+            return self._upperLayer()
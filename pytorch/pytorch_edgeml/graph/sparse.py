@@ -0,0 +1,228 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+import sys
+import time
+import torch
+import torch.nn as nn
+import pytorch_edgeml.utils as utils
+from pytorch_edgeml.graph.rnn import gen_non_linearity
+from pytorch_edgeml.graph.bonsai import getNodeProb
+
+
+def sparseMatmul(A, matricesT):
+    '''
+    Computes A * M_1 * ... * M_k given the sparse transposes M_i^T
+    A is [..., M_1.shape[0]]
+    '''
+    shape = A.shape
+    At = A.reshape(-1, shape[-1]).t()
+    for Mt in matricesT:
+        At = torch.sparse.mm(Mt, At)
+    return At.t().reshape(list(shape[:-1]) + [At.shape[0]])
+
+
+class SparseModel(nn.Module):
+    '''
+    Base class of the inference only sparse copies of trained models
+    Keeps track of the dense and sparse storage sizes of the converted
+    matrices
+    '''
+
+    def __init__(self):
+        super(SparseModel, self).__init__()
+        self.denseSize = 0
+        self.sparseSize = 0
+        self.totalnnZ = 0
+
+    def addSparse(self, name, A, transpose=False):
+        '''
+        Registers the sparse version of A (or of A^T) as buffer name
+        '''
+        A = A.detach()
+        if transpose:
+            A = A.t()
+        nnZ, size = utils.sparseSize(A)
+        self.totalnnZ += nnZ
+        self.sparseSize += size
+        self.denseSize += A.numel() * 4
+        self.register_buffer(name, utils.toSparse(A.contiguous()))
+
+    def addDense(self, name, A):
+        '''
+        Registers a copy of A as buffer name (stored dense in both formats)
+        '''
+        A = A.detach().clone()
+        self.sparseSize += A.numel() * 4
+        self.denseSize += A.numel() * 4
+        self.register_buffer(name, A)
+
+    def getModelSize(self):
+        '''
+        Returns # of non-zeros of the sparse matrices, dense size and sparse
+        size in bytes
+        '''
+        return self.totalnnZ, self.denseSize, self.sparseSize
+
+
+class SparseFastCell(SparseModel):
+    '''
+    Inference only copy of a trained FastGRNNCell or FastRNNCell with the
+    W and U matrices (or their low rank factors) stored sparse
+    Can be unrolled with BaseRNN like the dense cell
+    '''
+
+    def __init__(self, cell):
+        super(SparseFastCell, self).__init__()
+        supportedCells = ["FastGRNN", "FastRNN"]
+        assert cell.cellType in supportedCells, \
+            'Currently supported cells: %r' % supportedCells
+        self._cellType = cell.cellType
+        self._input_size = cell.input_size
+        self._hidden_size = cell.output_size
+        self._update_non_linearity = cell.update_non_linearity
+
+        Vars = cell.getVars()
+        numW, numU = cell.num_weight_matrices
+        self._WNames = ["W%d" % i for i in range(numW)]
+        self._UNames = ["U%d" % i for i in range(numU)]
+        for i in range(numW):
+            self.addSparse(self._WNames[i], Vars[i], transpose=True)
+        for i in range(numU):
+            self.addSparse(self._UNames[i], Vars[numW + i], transpose=True)
+
+        self.addDense("bias_update", cell.bias_update)
+        if self._cellType == "FastGRNN":
+            self._gate_non_linearity = cell.gate_non_linearity
+            self.addDense("bias_gate", cell.bias_gate)
+            self._scalarA = torch.sigmoid(cell.zeta).item()
+            self._scalarB = torch.sigmoid(cell.nu).item()
+        else:
+            self._scalarA = torch.sigmoid(cell.alpha).item()
+            self._scalarB = torch.sigmoid(cell.beta).item()
+
+    @property
+    def state_size(self):
+        return self._hidden_size
+
+    @property
+    def input_size(self):
+        return self._input_size
+
+    @property
+    def output_size(self):
+        return self._hidden_size
+
+    @property
+    def cellType(self):
+        return self._cellType
+
+    def computeWComp(self, input):
+        WMatrices = [getattr(self, name) for name in self._WNames]
+        return sparseMatmul(input, WMatrices)
+
+    def forwardWithWComp(self, wComp, state):
+        UMatrices = [getattr(self, name) for name in self._UNames]
+        pre_comp = wComp + sparseMatmul(state, UMatrices)
+        c = gen_non_linearity(pre_comp + self.bias_update,
+                              self._update_non_linearity)
+        if self._cellType == "FastGRNN":
+            z = gen_non_linearity(pre_comp + self.bias_gate,
+                                  self._gate_non_linearity)
+            return z * state + (self._scalarA * (1.0 - z) +
+                                self._scalarB) * c
+        return self._scalarB * state + self._scalarA * c
+
+    def forward(self, input, state):
+        return self.forwardWithWComp(self.computeWComp(input), state)
+
+
+class SparseBonsai(SparseModel):
+    '''
+    Inference only copy of a trained Bonsai with Z, W, V and T stored
+    sparse. forward matches Bonsai.forward
+    '''
+
+    def __init__(self, bonsaiObj):
+        super(SparseBonsai, self).__init__()
+        self.numClasses = bonsaiObj.numClasses
+        self.projectionDimension = bonsaiObj.projectionDimension
+        self.treeDepth = bonsaiObj.treeDepth
+        self.totalNodes = bonsaiObj.totalNodes
+        self.sigma = bonsaiObj.sigma
+        self.addSparse("Z", bonsaiObj.Z)
+        self.addSparse("W", bonsaiObj.W)
+        self.addSparse("V", bonsaiObj.V)
+        self.addSparse("T", bonsaiObj.T)
+
+    def forward(self, X, sigmaI=1e9):
+        X_ = torch.sparse.mm(self.Z, torch.t(X)) / self.projectionDimension
+        batchSize = X_.shape[1]
+        WX = torch.sparse.mm(self.W, X_).view(
+            self.totalNodes, self.numClasses, batchSize)
+        VX = torch.sparse.mm(self.V, X_).view(
+            self.totalNodes, self.numClasses, batchSize)
+        nodeScores = WX * torch.tanh(self.sigma * VX)
+        nodeProb = getNodeProb(torch.sparse.mm(self.T, X_), sigmaI,
+                               self.treeDepth)
+        score_ = torch.sum(nodeProb.unsqueeze(1) * nodeScores, dim=0)
+        return torch.t(score_), X_
+
+
+class SparseProtoNN(SparseModel):
+    '''
+    Inference only copy of a trained ProtoNN with W, B and Z stored sparse
+    forward matches ProtoNN.forward
+    '''
+
+    def __init__(self, protoNNObj):
+        super(SparseProtoNN, self).__init__()
+        W, B, Z, gamma = protoNNObj.getModelMatrices()
+        self.gamma = gamma
+        self.addSparse("Wt", W, transpose=True)
+        self.addSparse("Bt", B, transpose=True)
+        self.addSparse("Z", Z)
+        # ||B||^2 of every prototype [numPrototypes, 1]
+        self.register_buffer("BNorm", torch.sum(B.detach() * B.detach(),
+                                                dim=0).view(-1, 1))
+
+    def forward(self, X):
+        # Computed transposed, [projectionDimension, -1]
+        WXt = torch.sparse.mm(self.Wt, torch.t(X))
+        WXNorm = torch.sum(WXt * WXt, dim=0, keepdim=True)
+        l2sim = self.BNorm + WXNorm - 2.0 * torch.sparse.mm(self.Bt, WXt)
+        l2sim = torch.clamp(l2sim, min=0.0)
+        M = torch.exp((-1 * self.gamma * self.gamma) * l2sim)
+        return torch.t(torch.sparse.mm(self.Z, M))
+
+
+def sparseReport(denseFn, sparseModel, X, sparseFn=None, numRuns=10,
+                 outFile=sys.stdout):
+    '''
+    Compares dense and sparse execution on CPU
+    denseFn: Callable running the dense model on X
+    sparseModel: The SparseModel, called on X unless sparseFn is given
+        (eg. BaseRNN(sparseCell) for a SparseFastCell)
+    Prints and returns (denseSize, sparseSize, denseTime, sparseTime,
+    maxAbsDiff), sizes in bytes and times in seconds per call
+    '''
+    def timeIt(fn):
+        fn(X)
+        start = time.time()
+        for _ in range(numRuns):
+            out = fn(X)
+        return (time.time() - start) / numRuns, out
+
+    with torch.no_grad():
+        denseTime, denseOut = timeIt(denseFn)
+        sparseTime, sparseOut = timeIt(sparseModel if sparseFn is None
+                                       else sparseFn)
+    if isinstance(denseOut, tuple):
+        denseOut, sparseOut = denseOut[0], sparseOut[0]
+    maxAbsDiff = torch.max(torch.abs(denseOut - sparseOut)).item()
+    nnZ, denseSize, sparseSize = sparseModel.getModelSize()
+    print("Non-Zeros: %d Dense Size: %.3f KB Sparse Size: %.3f KB" %
+          (nnZ, denseSize / 1024.0, sparseSize / 1024.0), file=outFile)
+    print("Dense Time: %.6f s Sparse Time: %.6f s Max Abs Diff: %g" %
+          (denseTime, sparseTime, maxAbsDiff), file=outFile)
+    return denseSize, sparseSize, denseTime, sparseTime, maxAbsDiff
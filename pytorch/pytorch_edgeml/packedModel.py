@@ -0,0 +1,213 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+import json
+import os
+import struct
+import numpy as np
+
+# Single file model format of the trainers
+#
+#     magic (8 bytes) | version (uint32) | header length (uint32) |
+#     header (utf-8 json) | blobs
+#
+# The json header has the model type, its hyperparameters (cell type, ranks,
+# non-linearities, sparsity, ...) and for every tensor its name, shape,
+# storage format ('dense' or 'csr', float32 or quantized) and the offsets of
+# its blobs. Blobs are contiguous and aligned to ALIGNMENT bytes so the
+# dense tensors are returned as views of a memory map of the file, without
+# any copy.
+
+MAGIC = b"EDGEMLPK"
+VERSION = 1
+ALIGNMENT = 16
+QUANT_DTYPES = {"int8": np.int8, "int16": np.int16}
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _indexDtype(maxValue):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if maxValue <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _toNumpy(A):
+    if hasattr(A, "detach"):
+        A = A.detach().cpu().numpy()
+    return np.asarray(A)
+
+
+def _quantize(A, quantize):
+    # Symmetric per tensor quantization, A ~ q / scale
+    maxInt = np.iinfo(QUANT_DTYPES[quantize]).max
+    maxAbs = float(np.max(np.abs(A))) if A.size > 0 else 0.0
+    scale = maxInt / maxAbs if maxAbs > 0 else 1.0
+    q = np.clip(np.round(A * scale), -maxInt, maxInt)
+    return q.astype(QUANT_DTYPES[quantize]), scale
+
+
+def savePackedModel(path, modelType, tensors, hyperParams=None,
+                    sparsity=None, quantize=None):
+    '''
+    Writes the tensors (dict name -> numpy array or torch tensor, in order)
+    into the single file path
+
+    modelType: eg. FastGRNN, FastRNN, Bonsai, ProtoNN
+    hyperParams: json serializable dict stored in the header
+    sparsity: dict name -> sparsity the tensor was trained with, 2D tensors
+        with sparsity < 0.5 (as counted by utils.countnnZ) are stored in
+        CSR with the smallest unsigned index type that fits
+    quantize: None (float32), 'int8' or 'int16', symmetric per tensor
+        quantization of the values, the scale is kept in the header
+    '''
+    assert quantize is None or quantize in QUANT_DTYPES, \
+        "quantize should be None, 'int8' or 'int16'"
+    sparsity = sparsity or {}
+    entries = []
+    blobs = []
+    offset = 0
+
+    def addBlob(A):
+        nonlocal offset
+        A = np.ascontiguousarray(A)
+        blob = {"offset": offset, "dtype": A.dtype.str, "size": int(A.size)}
+        blobs.append((offset, A))
+        offset = _align(offset + A.nbytes)
+        return blob
+
+    for name, A in tensors.items():
+        A = _toNumpy(A).astype(np.float32)
+        entry = {"name": name, "shape": list(A.shape), "format": "dense"}
+        s = sparsity.get(name, 1.0)
+        if A.ndim == 2 and s < 0.5:
+            rows, cols = np.nonzero(A)
+            values = A[rows, cols]
+            indptr = np.searchsorted(rows, np.arange(A.shape[0] + 1))
+            entry["format"] = "csr"
+            entry["indices"] = addBlob(
+                cols.astype(_indexDtype(max(A.shape[1] - 1, 0))))
+            entry["indptr"] = addBlob(
+                indptr.astype(_indexDtype(len(values))))
+        else:
+            values = A.reshape(-1)
+        if quantize is not None:
+            values, entry["scale"] = _quantize(values, quantize)
+        entry["values"] = addBlob(values)
+        entries.append(entry)
+
+    header = json.dumps({"modelType": modelType,
+                         "hyperParams": hyperParams or {},
+                         "tensors": entries}).encode("utf-8")
+    prefix = MAGIC + struct.pack("<II", VERSION, len(header)) + header
+    dataStart = _align(len(prefix))
+    with open(path, "wb") as f:
+        f.write(prefix)
+        for blobOffset, A in blobs:
+            f.seek(dataStart + blobOffset)
+            f.write(A.tobytes())
+        f.truncate(dataStart + offset)
+
+
+class PackedModel:
+    '''
+    Memory mapped reader of the files of savePackedModel
+
+    model = PackedModel(path)
+    model.modelType, model.hyperParams, model.names
+    model[name] returns the float32 tensor, dense float32 tensors are read
+    only views of the memory map, sparse ones are densified and quantized
+    ones dequantized. model.raw(name) gives the stored (values, indices,
+    indptr, scale) without conversion
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        magic = bytes(self._buffer[:len(MAGIC)])
+        assert magic == MAGIC, path + " is not a packed EdgeML model"
+        version, headerLength = struct.unpack(
+            "<II", bytes(self._buffer[len(MAGIC):len(MAGIC) + 8]))
+        assert version <= VERSION, \
+            "Unsupported packed model version %d" % version
+        headerStart = len(MAGIC) + 8
+        header = json.loads(bytes(
+            self._buffer[headerStart:headerStart + headerLength]).decode(
+                "utf-8"))
+        self._dataStart = _align(headerStart + headerLength)
+        self.modelType = header["modelType"]
+        self.hyperParams = header["hyperParams"]
+        self._entries = {entry["name"]: entry for entry in header["tensors"]}
+        self.names = [entry["name"] for entry in header["tensors"]]
+
+    def _blob(self, blob):
+        return np.frombuffer(self._buffer, dtype=np.dtype(blob["dtype"]),
+                             count=blob["size"],
+                             offset=self._dataStart + blob["offset"])
+
+    def raw(self, name):
+        '''
+        (values, indices, indptr, scale) of the tensor as stored, indices
+        and indptr are None for dense tensors, scale is None for float ones
+        '''
+        entry = self._entries[name]
+        indices, indptr = None, None
+        if entry["format"] == "csr":
+            indices = self._blob(entry["indices"])
+            indptr = self._blob(entry["indptr"])
+        return (self._blob(entry["values"]), indices, indptr,
+                entry.get("scale"))
+
+    def __getitem__(self, name):
+        entry = self._entries[name]
+        values, indices, indptr, scale = self.raw(name)
+        if scale is not None:
+            values = (values / np.float32(scale)).astype(np.float32)
+        if entry["format"] == "dense":
+            return values.reshape(entry["shape"])
+        A = np.zeros(entry["shape"], dtype=np.float32)
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        A[rows, indices] = values
+        return A
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def toDict(self):
+        '''
+        Dict name -> float32 numpy array of all the tensors
+        '''
+        return {name: self[name] for name in self.names}
+
+    def toNpy(self, outDir):
+        '''
+        Writes every tensor as outDir/<name>.npy, the layout of the
+        saveParams of the trainers
+        '''
+        os.makedirs(outDir, exist_ok=True)
+        for name in self.names:
+            np.save(os.path.join(outDir, name + ".npy"), self[name])
+
+    def toSeeDot(self, outDir):
+        '''
+        Writes every tensor as a tab separated text file outDir/<name>, the
+        model input of SeeDot. Bonsai W and V are restructured for SeeDot
+        and Sigma is added
+        '''
+        import pytorch_edgeml.utils as utils
+
+        os.makedirs(outDir, exist_ok=True)
+        for name in self.names:
+            A = self[name]
+            if self.modelType == "Bonsai" and name in ["W", "V"]:
+                A = utils.restructreMatrixBonsaiSeeDot(
+                    A, self.hyperParams["numClasses"],
+                    self.hyperParams["totalNodes"])
+            np.savetxt(os.path.join(outDir, name), np.atleast_2d(A),
+                       delimiter="\t")
+        if self.modelType == "Bonsai":
+            np.savetxt(os.path.join(outDir, "Sigma"),
+                       np.array([self.hyperParams["sigma"]]), delimiter="\t")
@@ -0,0 +1,163 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+import os
+import numpy as np
+
+
+def roundDiv(A, d):
+    '''
+    Integer division of A by the positive integer d, rounded to nearest
+    '''
+    return np.floor_divide(2 * A + d, 2 * d)
+
+
+def quant_non_linearity(A, scale, maxValue, non_linearity):
+    '''
+    Integer version of the piecewise linear non-linearities of rnn.py
+    A holds the pre-activations at scale * maxValue, the output is at
+    scale maxValue (so in [-maxValue, maxValue] for quantTanh)
+    '''
+    if non_linearity == "quantTanh":
+        return np.clip(roundDiv(A, scale), -maxValue, maxValue)
+    elif non_linearity == "quantSigm":
+        return np.clip(roundDiv(A + scale * maxValue, 2 * scale),
+                       0, maxValue)
+    elif non_linearity == "quantSigm4":
+        return np.clip(roundDiv(A + 2 * scale * maxValue, 4 * scale),
+                       0, maxValue)
+    elif non_linearity == "relu":
+        return np.maximum(roundDiv(A, scale), 0)
+    raise ValueError("Integer inference supports only " +
+                     "['quantTanh', 'quantSigm', 'quantSigm4', 'relu']")
+
+
+class QuantizedFastModel:
+    '''
+    NumPy integer inference of the FastGRNN/FastRNN (+ FC classifier)
+    produced by quantizeFastModels.py, vectorized over the batch
+
+    quantModelDir = the QuantizedModel directory of quantizeFastModels
+    maxValue = -m used for quantizeFastModels (127 for int8)
+    gate_non_linearity, update_non_linearity = piecewise linear
+    non-linearities the model was trained with (see setQAT of the cells)
+
+    Integer scheme (all arithmetic in int64):
+    weights and biases are at paramScaleFactor P, the quantized
+    sigmoid(zeta), sigmoid(nu) (resp. alpha, beta) at scalarScaleFactor S
+    and the inputs, hidden state and non-linearity outputs at maxValue m
+    (1.0 <-> m, the fake quantization of the QAT cells).
+    Wx_t + Uh_{t-1} + B is accumulated at P * m, low rank intermediates are
+    rescaled back to m. The classifier output is at
+    classifierScaleFactor * m.
+    '''
+
+    def __init__(self, quantModelDir, maxValue=127,
+                 gate_non_linearity="quantSigm",
+                 update_non_linearity="quantTanh"):
+        def load(name):
+            path = os.path.join(quantModelDir, name + ".npy")
+            if not os.path.isfile(path):
+                return None
+            return np.load(path)
+
+        self.maxValue = int(maxValue)
+        self.paramScale = int(load("paramScaleFactor"))
+        self.scalarScale = int(load("scalarScaleFactor"))
+        self.classifierScale = float(load("classifierScaleFactor"))
+        self.gate_non_linearity = gate_non_linearity
+        self.update_non_linearity = update_non_linearity
+
+        if load("qzeta") is not None:
+            self.cellType = "FastGRNN"
+            self.biasGate = load("qBg").astype(np.int64).reshape(1, -1)
+            self.biasUpdate = load("qBh").astype(np.int64).reshape(1, -1)
+            self.scalarA = int(load("qzeta").reshape(-1)[0])
+            self.scalarB = int(load("qnu").reshape(-1)[0])
+        else:
+            assert load("qalpha") is not None, \
+                "No quantized FastGRNN or FastRNN in " + quantModelDir
+            self.cellType = "FastRNN"
+            self.biasUpdate = load("qB").astype(np.int64).reshape(1, -1)
+            self.scalarA = int(load("qalpha").reshape(-1)[0])
+            self.scalarB = int(load("qbeta").reshape(-1)[0])
+
+        def loadMatrices(prefix):
+            if load("q" + prefix) is not None:
+                return [load("q" + prefix).astype(np.int64)]
+            return [load("q" + prefix + "1").astype(np.int64),
+                    load("q" + prefix + "2").astype(np.int64)]
+
+        self.WMatrices = loadMatrices("W")
+        self.UMatrices = loadMatrices("U")
+        self.FC = load("qFC").astype(np.int64)
+        self.FCbias = load("qFCbias").astype(np.int64).reshape(1, -1)
+        self.inputDims = self.WMatrices[0].shape[0]
+        self.hiddenDims = self.UMatrices[-1].shape[1]
+
+    def quantizeInput(self, X):
+        '''
+        Float (normalized) input to integers at scale maxValue
+        '''
+        return np.round(np.asarray(X, dtype=np.float64) *
+                        self.maxValue).astype(np.int64)
+
+    def _matmul(self, A, matrices):
+        # A at m, every product is rescaled from P * m back to m except the
+        # last one which stays at P * m
+        for M in matrices[:-1]:
+            A = roundDiv(np.matmul(A, M), self.paramScale)
+        return np.matmul(A, matrices[-1])
+
+    def hiddenState(self, X):
+        '''
+        Final integer hidden state (at scale maxValue) for the batch X
+        [batchSize, timeSteps * inputDims] or [batchSize, timeSteps, inputDims]
+        '''
+        X = self.quantizeInput(X)
+        X = X.reshape(X.shape[0], -1, self.inputDims)
+        P, m, S = self.paramScale, self.maxValue, self.scalarScale
+        # Input projections of all the timesteps at once
+        wComp = self._matmul(X, self.WMatrices)
+        h = np.zeros([X.shape[0], self.hiddenDims], dtype=np.int64)
+        for t in range(X.shape[1]):
+            preComp = wComp[:, t] + self._matmul(h, self.UMatrices)
+            c = quant_non_linearity(preComp + self.biasUpdate * m, P, m,
+                                    self.update_non_linearity)
+            if self.cellType == "FastGRNN":
+                z = quant_non_linearity(preComp + self.biasGate * m, P, m,
+                                        self.gate_non_linearity)
+                # h = z * h + (zeta * (1 - z) + nu) * c at S * m^2
+                h = roundDiv(z * h * S + (self.scalarA * (m - z) +
+                                          self.scalarB * m) * c, S * m)
+            else:
+                # h = beta * h + alpha * c at S * m
+                h = roundDiv(self.scalarB * h + self.scalarA * c, S)
+        return h
+
+    def logits(self, X):
+        '''
+        Integer logits at scale classifierScaleFactor * maxValue
+        '''
+        h = self.hiddenState(X)
+        return np.matmul(h, self.FC) + self.FCbias * self.maxValue
+
+    def predict(self, X):
+        '''
+        Predicted classes for the batch X
+        '''
+        return np.argmax(self.logits(X), axis=1)
+
+    def accuracy(self, X, Y, batchSize=10000):
+        '''
+        Accuracy over X, Y (one hot [-1, numClasses] or class ids), in
+        batches of batchSize
+        '''
+        Y = np.asarray(Y)
+        if Y.ndim == 2:
+            Y = np.argmax(Y, axis=1)
+        numCorrect = 0
+        for i in range(0, X.shape[0], batchSize):
+            numCorrect += np.sum(self.predict(X[i:i + batchSize]) ==
+                                 Y[i:i + batchSize])
+        return numCorrect / float(X.shape[0])
@@ -0,0 +1,629 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+import torch
+import pytorch_edgeml.utils as utils
+
+
+def parseGrid(gridArgs):
+    '''
+    Parses ["hiddenSize=16,32", "sW=0.2,0.5"] into
+    {"hiddenSize": [16, 32], "sW": [0.2, 0.5]}, values are int, float, None
+    or strings
+    '''
+    def parseValue(value):
+        if value == "None":
+            return None
+        for cast in (int, float):
+            try:
+                return cast(value)
+            except ValueError:
+                pass
+        return value
+
+    grid = {}
+    for arg in gridArgs:
+        assert "=" in arg, "Expected name=v1,v2,... got " + arg
+        name, values = arg.split("=", 1)
+        grid[name] = [parseValue(v) for v in values.split(",")]
+    return grid
+
+
+def getSweepArgs(description):
+    '''
+    Common arguments of the sweep scripts of the examples
+    '''
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-dir', '--data-dir', required=True,
+                        help='Data directory containing train.npy and ' +
+                        'test.npy')
+    parser.add_argument('-g', '--grid', nargs='+', required=True,
+                        help='Hyperparameters to sweep as name=v1,v2,... ' +
+                        '(eg. -g hiddenSize=16,32 sW=0.2,0.5)')
+    parser.add_argument('-e', '--epochs', type=int, default=None,
+                        help='Epochs of every run (default: trainFn default)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='# of worker processes (default: # of cpus / ' +
+                        'threads per worker)')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='torch threads per worker (default: 1)')
+    parser.add_argument('-k', '--kill-margin', type=float, default=None,
+                        help='Stop runs whose accuracy is lower by this ' +
+                        'margin than a finished run with a smaller or ' +
+                        'equal model at the same epoch (default: off)')
+    parser.add_argument('-o', '--results-file', default='sweepResults.csv',
+                        help='csv file for the results table')
+    parser.add_argument('-sh', '--halving-epochs', type=int, default=None,
+                        help='Run a successive halving Pareto search ' +
+                        'starting with this many epochs per config, up to ' +
+                        '--epochs (default: off, plain grid sweep)')
+    parser.add_argument('-eta', '--eta', type=int, default=3,
+                        help='Successive halving keeps 1/eta of the ' +
+                        'configs and multiplies the epochs by eta per ' +
+                        'rung (default: 3)')
+    parser.add_argument('-n', '--num-configs', type=int, default=None,
+                        help='Randomly sample this many configs of the ' +
+                        'grid (default: all)')
+    parser.add_argument('-ta', '--target-accuracy', type=float, default=None,
+                        help='Report the smallest model of the Pareto ' +
+                        'front reaching this accuracy')
+    return parser.parse_args()
+
+
+def gridConfigs(grid, base=None):
+    '''
+    All the configs (dicts) of the cartesian product of grid, on top of the
+    base config
+    '''
+    names = list(grid.keys())
+    configs = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        config = dict(base or {})
+        config.update(zip(names, values))
+        configs.append(config)
+    return configs
+
+
+def sampleConfigs(configs, numConfigs, seed=42):
+    '''
+    Random subset of numConfigs of the configs (all of them if fewer)
+    '''
+    if numConfigs is None or numConfigs >= len(configs):
+        return list(configs)
+    indices = np.random.RandomState(seed).choice(len(configs), numConfigs,
+                                                 replace=False)
+    return [configs[i] for i in sorted(indices)]
+
+
+def toSharedMemory(arrays):
+    '''
+    Copies the dict of numpy arrays into shared memory blocks
+    Returns (handles, blocks), handles are picklable and turned back into
+    the arrays (without copies) by fromSharedMemory in the workers. The
+    blocks are owned by the caller, see releaseSharedMemory
+    '''
+    handles = {}
+    blocks = []
+    for name, A in arrays.items():
+        A = np.ascontiguousarray(A)
+        block = shared_memory.SharedMemory(create=True,
+                                           size=max(A.nbytes, 1))
+        np.ndarray(A.shape, dtype=A.dtype, buffer=block.buf)[...] = A
+        handles[name] = (block.name, A.shape, A.dtype.str)
+        blocks.append(block)
+    return handles, blocks
+
+
+def fromSharedMemory(handles):
+    '''
+    Attaches to the blocks of toSharedMemory, returns (arrays, blocks),
+    keep the blocks alive as long as the arrays are used
+    '''
+    arrays = {}
+    blocks = []
+    for name, (blockName, shape, dtype) in handles.items():
+        block = shared_memory.SharedMemory(name=blockName)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype),
+                                  buffer=block.buf)
+        blocks.append(block)
+    return arrays, blocks
+
+
+def releaseSharedMemory(blocks):
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+# State of the sweep worker processes, set by _initWorker
+_worker = {}
+
+
+def _initWorker(threadsPerWorker, handles, curves, killMargin, minEpochs):
+    os.environ["OMP_NUM_THREADS"] = str(threadsPerWorker)
+    os.environ["MKL_NUM_THREADS"] = str(threadsPerWorker)
+    torch.set_num_threads(threadsPerWorker)
+    data, blocks = fromSharedMemory(handles)
+    _worker.update(data=data, blocks=blocks, curves=curves,
+                   killMargin=killMargin, minEpochs=minEpochs)
+
+
+def _isDominated(epoch, accuracy, modelSize):
+    '''
+    Returns True if a finished run reached an accuracy better by killMargin
+    at the same epoch with a model no larger. Only the runs finished so far
+    are compared, so the outcome depends on the completion order of the
+    workers
+    '''
+    killMargin = _worker["killMargin"]
+    if killMargin is None or epoch + 1 < _worker["minEpochs"]:
+        return False
+    for curve in _worker["curves"].values():
+        if epoch not in curve:
+            continue
+        otherAccuracy, otherSize = curve[epoch]
+        if otherSize <= modelSize and otherAccuracy >= accuracy + killMargin:
+            return True
+    return False
+
+
+def _runConfig(trainFn, runId, config):
+    status = {"killed": False}
+    curve = {}
+
+    def reporter(epoch, accuracy, modelSize):
+        curve[epoch] = (accuracy, modelSize)
+        # Killing a run at its last epoch saves nothing
+        if epoch + 1 >= config.get("epochs", float("inf")):
+            return True
+        if _isDominated(epoch, accuracy, modelSize):
+            status["killed"] = True
+            return False
+        return True
+
+    result = dict(config)
+    start = time.time()
+    try:
+        result.update(trainFn(config, _worker["data"], reporter))
+        result["status"] = "killed" if status["killed"] else "done"
+        if not status["killed"]:
+            # Published once finished, see _isDominated
+            _worker["curves"][runId] = curve
+    except Exception:
+        result["status"] = "failed"
+        result["error"] = traceback.format_exc().strip().splitlines()[-1]
+    result["time"] = time.time() - start
+    return result
+
+
+def writeResults(results, resultsFile):
+    '''
+    Writes the list of result dicts as a csv table
+    '''
+    columns = []
+    for result in results:
+        columns.extend([key for key in result if key not in columns])
+    with open(resultsFile, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def runSweep(trainFn, configs, data, numWorkers=None, threadsPerWorker=1,
+             resultsFile=None, killMargin=None, minEpochs=1,
+             outFile=sys.stdout):
+    '''
+    Runs trainFn for every config across a pool of processes
+
+    trainFn: Module level function trainFn(config, data, reporter) returning
+        a dict of metrics (eg. accuracy, nnZ, modelSize). It should call
+        reporter(epoch, accuracy, modelSize) after every evaluation (eg.
+        through the epochCallback of the trainers) and stop once it returns
+        False
+    configs: List of dicts, see gridConfigs
+    data: Dict of numpy arrays, copied once into shared memory and given to
+        trainFn as shared views (not to be modified) in every worker
+    numWorkers: # of processes (default: # of cpus / threadsPerWorker)
+    threadsPerWorker: torch/OpenMP threads of every worker
+    resultsFile: csv file the results table is written to
+    killMargin: If given, a run is stopped when a finished run reached an
+        accuracy higher by killMargin at the same epoch with a model of at
+        most the same size (after minEpochs epochs). Runs are only compared
+        with the runs finished when they report, so which runs are killed
+        depends on the completion order of the workers and can differ
+        between two sweeps of the same configs
+
+    Returns the list of results (config + metrics + status + time) in the
+    order of configs, status is one of done, killed, failed
+    '''
+    if numWorkers is None:
+        numWorkers = max(1, (os.cpu_count() or 1) // threadsPerWorker)
+    handles, blocks = toSharedMemory(data)
+    context = multiprocessing.get_context("spawn")
+    manager = context.Manager()
+    results = [None] * len(configs)
+    try:
+        initargs = (threadsPerWorker, handles, manager.dict(), killMargin,
+                    minEpochs)
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=numWorkers, mp_context=context,
+                initializer=_initWorker, initargs=initargs) as pool:
+            futures = {pool.submit(_runConfig, trainFn, runId, config): runId
+                       for runId, config in enumerate(configs)}
+            for future in concurrent.futures.as_completed(futures):
+                runId = futures[future]
+                results[runId] = future.result()
+                print("[%d/%d] %r" % (sum(r is not None for r in results),
+                                      len(configs), results[runId]),
+                      file=outFile)
+                outFile.flush()
+    finally:
+        manager.shutdown()
+        releaseSharedMemory(blocks)
+    if resultsFile is not None:
+        writeResults(results, resultsFile)
+    return results
+
+
+def _runDir(config):
+    runDir = config.get("outDir")
+    if runDir is None:
+        return tempfile.mkdtemp()
+    os.makedirs(runDir, exist_ok=True)
+    return tempfile.mkdtemp(dir=runDir)
+
+
+def _maxAccuracy(trainer):
+    '''
+    Best test accuracy of the compressed model of a Fast or Bonsai trainer,
+    the final test accuracy if training stopped before the IHT phase (the
+    trainers then leave maxTestAcc at its -10000 sentinel)
+    '''
+    if trainer.maxTestAcc < 0:
+        return trainer.testAcc
+    return trainer.maxTestAcc
+
+
+def trainFastCell(config, data, reporter=None):
+    '''
+    trainFn for FastTrainer. data has Xtrain, Ytrain, Xtest, Ytest (one hot),
+    X is [-1, timeSteps * inputDims]. config keys (with defaults): cell
+    (FastGRNN), inputDims (required), hiddenSize (16), wRank, uRank (None),
+    sW, sU (1.0), learningRate (0.01), batchSize (100), epochs (300),
+    decayStep (200), decayRate (0.1), gateNL (sigmoid), updateNL (tanh),
+    seed (42), outDir (temporary directory)
+    '''
+    from pytorch_edgeml.graph.rnn import FastGRNNCell, FastRNNCell
+    from pytorch_edgeml.trainer.fastTrainer import FastTrainer
+
+    torch.manual_seed(config.get("seed", 42))
+    np.random.seed(config.get("seed", 42))
+    inputDims = config["inputDims"]
+    hiddenSize = config.get("hiddenSize", 16)
+    kwargs = dict(update_non_linearity=config.get("updateNL", "tanh"),
+                  wRank=config.get("wRank"), uRank=config.get("uRank"))
+    if config.get("cell", "FastGRNN") == "FastGRNN":
+        cell = FastGRNNCell(inputDims, hiddenSize,
+                            gate_non_linearity=config.get("gateNL",
+                                                          "sigmoid"),
+                            **kwargs)
+    else:
+        cell = FastRNNCell(inputDims, hiddenSize, **kwargs)
+    runDir = _runDir(config)
+    trainer = FastTrainer(cell, data["Ytrain"].shape[1],
+                          sW=config.get("sW", 1.0), sU=config.get("sU", 1.0),
+                          learningRate=config.get("learningRate", 0.01),
+                          outFile=os.path.join(runDir, "output.txt"))
+
+    def epochCallback(epoch, accuracy):
+        if reporter is None:
+            return True
+        return reporter(epoch, accuracy, trainer.getModelSize()[1])
+
+    trainer.train(config.get("batchSize", 100), config.get("epochs", 300),
+                  data["Xtrain"], data["Xtest"], data["Ytrain"],
+                  data["Ytest"], config.get("decayStep", 200),
+                  config.get("decayRate", 0.1), runDir, runDir,
+                  epochCallback=epochCallback)
+    nnZ, modelSize, _ = trainer.getModelSize()
+    return {"accuracy": _maxAccuracy(trainer),
+            "finalAccuracy": trainer.testAcc, "nnZ": int(nnZ),
+            "modelSize": float(modelSize), "runDir": runDir}
+
+
+def trainBonsai(config, data, reporter=None):
+    '''
+    trainFn for BonsaiTrainer. data has Xtrain, Ytrain, Xtest, Ytest as
+    returned by the Bonsai helpermethods.preProcessData (Y is [-1, 1] for
+    binary problems). config keys (with defaults): depth (1),
+    projectionDimension (10), sigma (1.0), rW, rT, rV, rZ (0.0001),
+    sW, sT, sV (0.2), sZ (0.2), learningRate (0.01), batchSize (100),
+    epochs (42), seed (42), outDir (temporary directory)
+    '''
+    from pytorch_edgeml.graph.bonsai import Bonsai
+    from pytorch_edgeml.trainer.bonsaiTrainer import BonsaiTrainer
+
+    torch.manual_seed(config.get("seed", 42))
+    np.random.seed(config.get("seed", 42))
+    numClasses = data["Ytrain"].shape[1]
+    bonsaiObj = Bonsai(numClasses, data["Xtrain"].shape[1],
+                       config.get("projectionDimension", 10),
+                       config.get("depth", 1), config.get("sigma", 1.0))
+    runDir = _runDir(config)
+    reg = [config.get(name, 0.0001) for name in ["rW", "rT", "rV", "rZ"]]
+    spar = [config.get(name, 0.2) for name in ["sW", "sT", "sV", "sZ"]]
+    trainer = BonsaiTrainer(bonsaiObj, *(reg + spar),
+                            learningRate=config.get("learningRate", 0.01),
+                            useMCHLoss=True,
+                            outFile=os.path.join(runDir, "output.txt"))
+
+    def epochCallback(epoch, accuracy):
+        if reporter is None:
+            return True
+        return reporter(epoch, accuracy, trainer.getModelSize()[1])
+
+    trainer.train(config.get("batchSize", 100), config.get("epochs", 42),
+                  data["Xtrain"], data["Xtest"], data["Ytrain"],
+                  data["Ytest"], runDir, runDir, epochCallback=epochCallback)
+    nnZ, modelSize, _ = trainer.getModelSize()
+    return {"accuracy": _maxAccuracy(trainer),
+            "finalAccuracy": trainer.testAcc, "nnZ": int(nnZ),
+            "modelSize": float(modelSize), "runDir": runDir}
+
+
+def trainProtoNN(config, data, reporter=None):
+    '''
+    trainFn for ProtoNNTrainer. data has Xtrain, Ytrain, Xtest, Ytest (one
+    hot). config keys (with defaults): gamma (required), projectionDimension
+    (10), numPrototypes (20), rW, rB, rZ (0.0), sW, sB, sZ (1.0),
+    learningRate (0.01), batchSize (32), epochs (20), seed (42)
+    As for the other trainFns, accuracy is the best test accuracy over the
+    epochs and finalAccuracy the last one
+    '''
+    from pytorch_edgeml.graph.protoNN import ProtoNN
+    from pytorch_edgeml.trainer.protoNNTrainer import ProtoNNTrainer
+
+    torch.manual_seed(config.get("seed", 42))
+    np.random.seed(config.get("seed", 42))
+    numClasses = data["Ytrain"].shape[1]
+    protoNNObj = ProtoNN(data["Xtrain"].shape[1],
+                         config.get("projectionDimension", 10),
+                         config.get("numPrototypes", 20), numClasses,
+                         config["gamma"])
+    spar = [config.get(name, 1.0) for name in ["sW", "sB", "sZ"]]
+    trainer = ProtoNNTrainer(protoNNObj,
+                             *([config.get(name, 0.0) for name in
+                                ["rW", "rB", "rZ"]] + spar),
+                             learningRate=config.get("learningRate", 0.01),
+                             lossType='xentropy')
+
+    def getModelSize():
+        nnZ, modelSize = 0, 0
+        W, B, Z, _ = protoNNObj.getModelMatrices()
+        for A, s in zip([W, B, Z], spar):
+            matrixnnZ, matrixSize, _ = utils.countnnZ(A, s)
+            nnZ += matrixnnZ
+            modelSize += matrixSize
+        return nnZ, modelSize
+
+    accuracies = []
+
+    def epochCallback(epoch, accuracy):
+        accuracies.append(accuracy)
+        if reporter is None:
+            return True
+        return reporter(epoch, accuracy, getModelSize()[1])
+
+    trainer.train(config.get("batchSize", 32), config.get("epochs", 20),
+                  data["Xtrain"], data["Xtest"], data["Ytrain"],
+                  data["Ytest"], printStep=sys.maxsize,
+                  epochCallback=epochCallback)
+    nnZ, modelSize = getModelSize()
+    return {"accuracy": max(accuracies), "finalAccuracy": trainer.valAccuracy,
+            "nnZ": int(nnZ), "modelSize": float(modelSize)}
+
+
+def _isValidResult(result, accuracyKey, sizeKey):
+    return (result is not None and result.get("status", "done") == "done" and
+            result.get(accuracyKey) is not None and
+            result.get(sizeKey) is not None)
+
+
+def paretoLayers(results, accuracyKey="accuracy", sizeKey="modelSize"):
+    '''
+    Non dominated sorting of the results on (higher accuracy, smaller size).
+    Returns a list of layers (lists of results), the first one being the
+    Pareto front, every layer sorted by increasing size. Failed and killed
+    runs are left out
+    '''
+    remaining = [r for r in results
+                 if _isValidResult(r, accuracyKey, sizeKey)]
+    # Sorting by size (then accuracy, descending) lets a single scan find the
+    # non dominated results: those more accurate than all the smaller ones
+    remaining.sort(key=lambda r: (r[sizeKey], -r[accuracyKey]))
+    layers = []
+    while len(remaining) > 0:
+        front, rest = [], []
+        for result in remaining:
+            if (len(front) == 0 or
+                    result[accuracyKey] > front[-1][accuracyKey]):
+                front.append(result)
+            else:
+                rest.append(result)
+        layers.append(front)
+        remaining = rest
+    return layers
+
+
+def paretoFront(results, accuracyKey="accuracy", sizeKey="modelSize"):
+    '''
+    Results not dominated by a smaller (or same size) and at least as
+    accurate model, sorted by increasing size
+    '''
+    layers = paretoLayers(results, accuracyKey, sizeKey)
+    return layers[0] if len(layers) > 0 else []
+
+
+def smallestModel(front, targetAccuracy, accuracyKey="accuracy"):
+    '''
+    Smallest result of the Pareto front reaching targetAccuracy, None if no
+    model does
+    '''
+    for result in front:
+        if result[accuracyKey] >= targetAccuracy:
+            return result
+    return None
+
+
+def _selectPareto(results, numKeep, accuracyKey, sizeKey):
+    # Keeps whole Pareto layers while they fit, the last (partial) layer is
+    # spread evenly over the sizes it covers
+    selected = []
+    for layer in paretoLayers(results, accuracyKey, sizeKey):
+        if len(selected) + len(layer) <= numKeep:
+            selected.extend(layer)
+            continue
+        numLeft = numKeep - len(selected)
+        if numLeft > 0:
+            indices = np.unique(np.round(
+                np.linspace(0, len(layer) - 1, numLeft)).astype(int))
+            selected.extend([layer[i] for i in indices])
+        break
+    return selected
+
+
+def printParetoFront(front, accuracyKey="accuracy", sizeKey="modelSize",
+                     outFile=sys.stdout):
+    '''
+    Prints the accuracy / model size (KB) table of the front
+    '''
+    print("Pareto front (accuracy vs model size):", file=outFile)
+    for result in front:
+        config = ", ".join("%s=%s" % (key, value)
+                           for key, value in result["config"].items()
+                           if key != "outDir")
+        print("  accuracy: %.6f  size: %.3f KB  %s" %
+              (result[accuracyKey], result[sizeKey] / 1024., config),
+              file=outFile)
+    outFile.flush()
+
+
+def successiveHalving(trainFn, configs, data, minEpochs, maxEpochs, eta=3,
+                      numWorkers=None, threadsPerWorker=1, resultsFile=None,
+                      killMargin=None, targetAccuracy=None,
+                      accuracyKey="accuracy", sizeKey="modelSize",
+                      outFile=sys.stdout):
+    '''
+    Pareto search of model size vs accuracy by successive halving
+
+    Every rung trains the surviving configs (with runSweep) for the rung's
+    number of epochs, starting at minEpochs and multiplied by eta per rung
+    up to maxEpochs. Between rungs 1/eta of the configs are kept, picked
+    among the finished runs by Pareto layers on (accuracy, modelSize) so
+    small models are not dropped in favour of slightly more accurate large
+    ones. Failed configs are printed. The trainers do not resume, every
+    rung retrains from scratch.
+
+    trainFn, data, numWorkers, threadsPerWorker, killMargin: see runSweep,
+        configs should not set the epochs. minEpochs is also the warm-up
+        before runs can be killed, in every rung
+    resultsFile: csv file with the results of all the rungs (rung column)
+    targetAccuracy: If given, the smallest model of the final front
+        reaching it is reported
+
+    Returns (front, results): the Pareto front of the final rung and the
+    results of all the rungs. Every result has the config dict under
+    "config" in addition to the flattened config keys
+    '''
+    assert 1 <= minEpochs <= maxEpochs, \
+        "Expected 1 <= minEpochs <= maxEpochs"
+    assert eta >= 2, "eta should be an integer >= 2"
+    allResults = []
+    epochs, rung = minEpochs, 0
+    while True:
+        rungConfigs = [dict(config, epochs=epochs) for config in configs]
+        print("Rung %d: %d configs, %d epochs" % (rung, len(configs), epochs),
+              file=outFile)
+        results = runSweep(trainFn, rungConfigs, data, numWorkers=numWorkers,
+                           threadsPerWorker=threadsPerWorker,
+                           killMargin=killMargin, minEpochs=minEpochs,
+                           outFile=outFile)
+        for config, result in zip(configs, results):
+            result["rung"] = rung
+            result["config"] = config
+            if result["status"] == "failed":
+                print("Rung %d: failed config %r: %s" %
+                      (rung, config, result["error"]), file=outFile)
+        allResults.extend(results)
+        numKeep = len(configs) // eta
+        if epochs >= maxEpochs or numKeep < 1:
+            break
+        configs = [r["config"] for r in
+                   _selectPareto(results, numKeep, accuracyKey, sizeKey)]
+        if len(configs) == 0:
+            break
+        epochs, rung = min(epochs * eta, maxEpochs), rung + 1
+
+    front = paretoFront(results, accuracyKey, sizeKey)
+    printParetoFront(front, accuracyKey, sizeKey, outFile)
+    if targetAccuracy is not None:
+        best = smallestModel(front, targetAccuracy, accuracyKey)
+        if best is None:
+            print("No model reaches accuracy %f" % targetAccuracy,
+                  file=outFile)
+        else:
+            print("Smallest model reaching accuracy %f: %.3f KB %r" %
+                  (targetAccuracy, best[sizeKey] / 1024., best["config"]),
+                  file=outFile)
+    if resultsFile is not None:
+        frontIds = set(id(r) for r in front)
+        writeResults([dict({key: value for key, value in r.items()
+                            if key != "config"}, pareto=id(r) in frontIds)
+                      for r in allResults], resultsFile)
+    return front, allResults
+
+
+def sweepFromArgs(trainFn, args, data, base=None):
+    '''
+    Runs the grid sweep or, with --halving-epochs, the successive halving
+    Pareto search described by the getSweepArgs arguments
+    '''
+    configs = sampleConfigs(gridConfigs(parseGrid(args.grid), base),
+                            args.num_configs)
+    if args.halving_epochs is None:
+        if args.epochs is not None:
+            configs = [dict(config, epochs=args.epochs) for config in configs]
+        results = runSweep(trainFn, configs, data, numWorkers=args.workers,
+                           threadsPerWorker=args.threads,
+                           resultsFile=args.results_file,
+                           killMargin=args.kill_margin)
+        front = paretoFront([dict(r, config=config)
+                             for r, config in zip(results, configs)])
+        printParetoFront(front)
+        if args.target_accuracy is not None:
+            best = smallestModel(front, args.target_accuracy)
+            print("Smallest model reaching accuracy %f: %r" %
+                  (args.target_accuracy,
+                   None if best is None else best["config"]))
+    else:
+        assert args.epochs is not None, \
+            "--epochs is required by the successive halving search"
+        successiveHalving(trainFn, configs, data, args.halving_epochs,
+                          args.epochs, eta=args.eta, numWorkers=args.workers,
+                          threadsPerWorker=args.threads,
+                          resultsFile=args.results_file,
+                          killMargin=args.kill_margin,
+                          targetAccuracy=args.target_accuracy)
+    print("Results table: " + args.results_file)
@@ -6,6 +6,8 @@ import numpy as np
 import os
 import sys
 import pytorch_edgeml.utils as utils
+from pytorch_edgeml.data import BatchLoader, toTensor
+from pytorch_edgeml.packedModel import savePackedModel, PackedModel
 
 
 class BonsaiTrainer:
@@ -58,6 +60,9 @@ class BonsaiTrainer:
         else:
             self.isDenseTraining = False
 
+        self.__maskW = None
+        self.supportHooks = []
+
     def loss(self, logits, labels):
         '''
         Loss function for given Bonsai Obj
@@ -102,56 +107,83 @@ class BonsaiTrainer:
 
         return accuracy
 
+    def evaluate(self, testLoader):
+        '''
+        Chunked evaluation over the batches of testLoader (a BatchLoader)
+        with the current sigmaI, loss, accuracy and confusion are
+        accumulated per batch so that memory is bounded by the batch size
+        Returns loss, marginLoss, regLoss, accuracy and the confusion matrix
+        (rows are the true classes, [2, 2] for binary Bonsai)
+        '''
+        numClasses = max(self.bonsaiObj.numClasses, 2)
+        marginLoss = 0.0
+        numSamples = 0
+        confusion = torch.zeros(numClasses * numClasses, dtype=torch.long,
+                                device=self.device)
+        with torch.no_grad():
+            for batchX, batchY in testLoader:
+                logits, _ = self.bonsaiObj(batchX, self.sigmaI)
+                _, batchMarginLoss, regLoss = self.loss(logits, batchY)
+                marginLoss += batchMarginLoss.item() * len(batchY)
+                numSamples += len(batchY)
+                if (self.bonsaiObj.numClasses > 2):
+                    pred = logits.argmax(dim=1)
+                    target = batchY.argmax(dim=1)
+                else:
+                    pred = (logits.view(-1) > 0).long()
+                    target = batchY.view(-1).long()
+                confusion += torch.bincount(target * numClasses + pred,
+                                            minlength=numClasses * numClasses)
+        confusion = confusion.view(numClasses, numClasses).cpu()
+        accuracy = torch.trace(confusion).item() / float(numSamples)
+        marginLoss /= numSamples
+        regLoss = regLoss.item()
+        return (marginLoss + regLoss, marginLoss, regLoss, accuracy,
+                confusion)
+
     def runHardThrsd(self):
         '''
         Function to run the IHT routine on Bonsai Obj
         '''
-        currW = self.bonsaiObj.W.data
-        currV = self.bonsaiObj.V.data
-        currZ = self.bonsaiObj.Z.data
-        currT = self.bonsaiObj.T.data
-
-        __thrsdW = utils.hardThreshold(currW.cpu(), self.sW)
-        __thrsdV = utils.hardThreshold(currV.cpu(), self.sV)
-        __thrsdZ = utils.hardThreshold(currZ.cpu(), self.sZ)
-        __thrsdT = utils.hardThreshold(currT.cpu(), self.sT)
-
-        self.bonsaiObj.W.data = torch.FloatTensor(
-            __thrsdW).to(self.device)
-        self.bonsaiObj.V.data = torch.FloatTensor(
-            __thrsdV).to(self.device)
-        self.bonsaiObj.Z.data = torch.FloatTensor(
-            __thrsdZ).to(self.device)
-        self.bonsaiObj.T.data = torch.FloatTensor(
-            __thrsdT).to(self.device)
-
-        self.__thrsdW = torch.FloatTensor(
-            np.copy(__thrsdW)).to(self.device)
-        self.__thrsdV = torch.FloatTensor(
-            np.copy(__thrsdV)).to(self.device)
-        self.__thrsdZ = torch.FloatTensor(
-            np.copy(__thrsdZ)).to(self.device)
-        self.__thrsdT = torch.FloatTensor(
-            np.copy(__thrsdT)).to(self.device)
+        self.__maskW = utils.hardThresholdTensor(self.bonsaiObj.W.data,
+                                                 self.sW)
+        self.__maskV = utils.hardThresholdTensor(self.bonsaiObj.V.data,
+                                                 self.sV)
+        self.__maskZ = utils.hardThresholdTensor(self.bonsaiObj.Z.data,
+                                                 self.sZ)
+        self.__maskT = utils.hardThresholdTensor(self.bonsaiObj.T.data,
+                                                 self.sT)
 
     def runSparseTraining(self):
         '''
         Function to run the Sparse Retraining routine on Bonsai Obj
+        No-op once the support is frozen. Runs the IHT first if the IHT
+        phase was too short to reach it (short trainings)
         '''
-        currW = self.bonsaiObj.W.data
-        currV = self.bonsaiObj.V.data
-        currZ = self.bonsaiObj.Z.data
-        currT = self.bonsaiObj.T.data
-
-        newW = utils.copySupport(self.__thrsdW, currW)
-        newV = utils.copySupport(self.__thrsdV, currV)
-        newZ = utils.copySupport(self.__thrsdZ, currZ)
-        newT = utils.copySupport(self.__thrsdT, currT)
+        if self.supportHooks:
+            return
+        if self.__maskW is None:
+            self.runHardThrsd()
+        utils.applySupport(self.__maskW, self.bonsaiObj.W.data)
+        utils.applySupport(self.__maskV, self.bonsaiObj.V.data)
+        utils.applySupport(self.__maskZ, self.bonsaiObj.Z.data)
+        utils.applySupport(self.__maskT, self.bonsaiObj.T.data)
+
+    def freezeSupport(self):
+        '''
+        Makes the masks of the last IHT persistent for the Sparse Retraining
+        phase by masking the gradients instead of reapplying them per batch
+        '''
+        self.supportHooks = [
+            utils.freezeSupport(self.bonsaiObj.W, self.__maskW, self.optimizer),
+            utils.freezeSupport(self.bonsaiObj.V, self.__maskV, self.optimizer),
+            utils.freezeSupport(self.bonsaiObj.Z, self.__maskZ, self.optimizer),
+            utils.freezeSupport(self.bonsaiObj.T, self.__maskT, self.optimizer)]
 
-        self.bonsaiObj.W.data = newW
-        self.bonsaiObj.V.data = newV
-        self.bonsaiObj.Z.data = newZ
-        self.bonsaiObj.T.data = newT
+    def releaseSupport(self):
+        for hook in self.supportHooks:
+            hook.remove()
+        self.supportHooks = []
 
     def assertInit(self):
         err = "sparsity must be between 0 and 1"
@@ -160,22 +192,34 @@ class BonsaiTrainer:
         assert self.sZ >= 0 and self.sZ <= 1, "Z " + err
         assert self.sT >= 0 and self.sT <= 1, "T " + err
 
+    def getParams(self):
+        '''
+        Dict of the parameter matrices (numpy) W, V, T and Z
+        '''
+        return {"W": self.bonsaiObj.W.data.cpu().numpy(),
+                "V": self.bonsaiObj.V.data.cpu().numpy(),
+                "T": self.bonsaiObj.T.data.cpu().numpy(),
+                "Z": self.bonsaiObj.Z.data.cpu().numpy()}
+
+    def getHyperParams(self):
+        '''
+        Hyperparameters of the Bonsai tree, the header of the packed model
+        '''
+        return {'dataDim': self.bonsaiObj.dataDimension,
+                'projDim': self.bonsaiObj.projectionDimension,
+                'numClasses': self.bonsaiObj.numClasses,
+                'depth': self.bonsaiObj.treeDepth,
+                'sigma': self.bonsaiObj.sigma}
+
     def saveParams(self, currDir):
         '''
         Function to save Parameter matrices into a given folder
         '''
         paramDir = currDir + '/'
-        np.save(paramDir + "W.npy", self.bonsaiObj.W.data.cpu())
-        np.save(paramDir + "V.npy", self.bonsaiObj.V.data.cpu())
-        np.save(paramDir + "T.npy", self.bonsaiObj.T.data.cpu())
-        np.save(paramDir + "Z.npy", self.bonsaiObj.Z.data.cpu())
-        hyperParamDict = {'dataDim': self.bonsaiObj.dataDimension,
-                          'projDim': self.bonsaiObj.projectionDimension,
-                          'numClasses': self.bonsaiObj.numClasses,
-                          'depth': self.bonsaiObj.treeDepth,
-                          'sigma': self.bonsaiObj.sigma}
+        for name, param in self.getParams().items():
+            np.save(paramDir + name + ".npy", param)
         hyperParamFile = paramDir + 'hyperParam.npy'
-        np.save(hyperParamFile, hyperParamDict)
+        np.save(hyperParamFile, self.getHyperParams())
 
     def saveParamsForSeeDot(self, currDir):
         '''
@@ -205,6 +249,19 @@ class BonsaiTrainer:
         np.savetxt(seeDotDir + "Sigma",
                    np.array([self.bonsaiObj.sigma]), delimiter="\t")
 
+    def savePacked(self, path, quantize=None):
+        '''
+        Saves the parameters and hyperparameters as a single packed model
+        file (see packedModel.py), the matrices trained sparse are stored
+        in CSR. quantize can be 'int8' or 'int16'
+        '''
+        hyperParams = self.getHyperParams()
+        hyperParams.update(totalNodes=self.bonsaiObj.totalNodes,
+                           sW=self.sW, sV=self.sV, sT=self.sT, sZ=self.sZ)
+        savePackedModel(path, "Bonsai", self.getParams(), hyperParams,
+                        {"W": self.sW, "V": self.sV, "T": self.sT,
+                         "Z": self.sZ}, quantize)
+
     def loadModel(self, currDir):
         '''
         Load the Saved model and load it to the model using constructor
@@ -235,12 +292,30 @@ class BonsaiTrainer:
         return totalnnZ, totalSize, hasSparse
 
     def train(self, batchSize, totalEpochs,
-              Xtrain, Xtest, Ytrain, Ytest, dataDir, currDir):
+              Xtrain, Xtest, Ytrain, Ytest, dataDir, currDir, prefetch=2,
+              evalBatchSize=1000, evalStep=1, epochCallback=None):
         '''
         The Dense - IHT - Sparse Retrain Routine for Bonsai Training
+        prefetch is the # of batches prepared ahead by the BatchLoader
+        Xtrain and Ytrain can be memory mapped arrays
+        The test set is evaluated in batches of evalBatchSize every evalStep
+        epochs (and after the last epoch)
+        epochCallback(epoch, testAcc) is called after every evaluation,
+        training stops early if it returns False. The maximum and final
+        test accuracies are kept as self.maxTestAcc and self.testAcc
+        The best model is saved as the single file currDir/model.edgeml
+        (see packedModel.py) and unpacked to the .npy files of saveParams
+        and the SeeDot files of saveParamsForSeeDot once training ends
         '''
         resultFile = open(dataDir + '/PyTorchBonsaiResults.txt', 'a+')
+        packedPath = os.path.join(currDir, "model.edgeml")
         numIters = Xtrain.shape[0] / batchSize
+        Ytrain = Ytrain.reshape([-1, self.bonsaiObj.numClasses])
+        trainLoader = BatchLoader(Xtrain, Ytrain, batchSize, dropLast=True,
+                                  device=self.device, prefetch=prefetch)
+        Ytest = Ytest.reshape([-1, self.bonsaiObj.numClasses])
+        testLoader = BatchLoader(Xtest, Ytest, evalBatchSize,
+                                 device=self.device, prefetch=prefetch)
 
         totalBatches = numIters * totalEpochs
 
@@ -260,132 +335,143 @@ class BonsaiTrainer:
             itersInPhase = 0
 
         header = '*' * 20
-        for i in range(totalEpochs):
-            print("\nEpoch Number: " + str(i), file=self.outFile)
-
-            '''
-            trainAcc -> For Classification, it is 'Accuracy'.
-            '''
-            trainAcc = 0.0
-            trainLoss = 0.0
-
-            numIters = int(numIters)
-            for j in range(numIters):
-
-                if counter == 0:
-                    msg = " Dense Training Phase Started "
-                    print("\n%s%s%s\n" %
-                          (header, msg, header), file=self.outFile)
-
-                # Updating the indicator sigma
-                if ((counter == 0) or (counter == int(totalBatches / 3.0)) or
-                        (counter == int(2 * totalBatches / 3.0))) and (self.isDenseTraining is False):
-                    self.sigmaI = 1
-                    itersInPhase = 0
-
-                elif (itersInPhase % 100 == 0):
-                    indices = np.random.choice(Xtrain.shape[0], 100)
-                    batchX = Xtrain[indices, :]
-                    batchY = Ytrain[indices, :]
-                    batchY = np.reshape(
-                        batchY, [-1, self.bonsaiObj.numClasses])
-
-                    Teval = self.bonsaiObj.T.data
-                    Xcapeval = (torch.matmul(self.bonsaiObj.Z, torch.t(
-                        batchX.to(self.device))) / self.bonsaiObj.projectionDimension).data
-
-                    sum_tr = 0.0
-                    for k in range(0, self.bonsaiObj.internalNodes):
-                        sum_tr += (
-                            np.sum(np.abs(np.dot(Teval[k].cpu(), Xcapeval.cpu()))))
-
-                    if(self.bonsaiObj.internalNodes > 0):
-                        sum_tr /= (100 * self.bonsaiObj.internalNodes)
-                        sum_tr = 0.1 / sum_tr
-                    else:
-                        sum_tr = 0.1
-                    sum_tr = min(
-                        1000, sum_tr * (2**(float(itersInPhase) /
-                                            (float(totalBatches) / 30.0))))
-
-                    self.sigmaI = sum_tr
-
-                itersInPhase += 1
-                batchX = Xtrain[j * batchSize:(j + 1) * batchSize]
-                batchY = Ytrain[j * batchSize:(j + 1) * batchSize]
-                batchY = np.reshape(
-                    batchY, [-1, self.bonsaiObj.numClasses])
-
-                self.optimizer.zero_grad()
-                logits, _ = self.bonsaiObj(batchX.to(self.device), self.sigmaI)
-                batchLoss, _, _ = self.loss(logits, batchY.to(self.device))
-                batchAcc = self.accuracy(logits, batchY.to(self.device))
-
-                batchLoss.backward()
-                self.optimizer.step()
-
-                # Classification.
-
-                trainAcc += batchAcc.item()
-                trainLoss += batchLoss.item()
-
-                # Training routine involving IHT and sparse retraining
-                if (counter >= int(totalBatches / 3.0) and
-                    (counter < int(2 * totalBatches / 3.0)) and
-                    counter % trimlevel == 0 and
-                        self.isDenseTraining is False):
-                    self.runHardThrsd()
-                    if ihtDone == 0:
-                        msg = " IHT Phase Started "
+        # The support hooks are released even if training fails, they
+        # would otherwise keep masking the gradients of the next train()
+        try:
+            for i in range(totalEpochs):
+                print("\nEpoch Number: " + str(i), file=self.outFile)
+
+                '''
+                trainAcc -> For Classification, it is 'Accuracy'.
+                '''
+                trainAcc = 0.0
+                trainLoss = 0.0
+
+                numIters = int(numIters)
+                for batchX, batchY in trainLoader:
+
+                    if counter == 0:
+                        msg = " Dense Training Phase Started "
                         print("\n%s%s%s\n" %
                               (header, msg, header), file=self.outFile)
-                    ihtDone = 1
-                elif ((ihtDone == 1 and counter >= int(totalBatches / 3.0) and
-                       (counter < int(2 * totalBatches / 3.0)) and
-                       counter % trimlevel != 0 and
-                       self.isDenseTraining is False) or
-                        (counter >= int(2 * totalBatches / 3.0) and
-                            self.isDenseTraining is False)):
-                    self.runSparseTraining()
-                    if counter == int(2 * totalBatches / 3.0):
-                        msg = " Sparse Retraining Phase Started "
-                        print("\n%s%s%s\n" %
-                              (header, msg, header), file=self.outFile)
-                counter += 1
-
-            print("\nClassification Train Loss: " + str(trainLoss / numIters) +
-                  "\nTraining accuracy (Classification): " +
-                  str(trainAcc / numIters),
-                  file=self.outFile)
-
-            oldSigmaI = self.sigmaI
-            self.sigmaI = 1e9
-            logits, _ = self.bonsaiObj(Xtest.to(self.device), self.sigmaI)
-            testLoss, marginLoss, regLoss = self.loss(
-                logits, Ytest.to(self.device))
-            testAcc = self.accuracy(logits, Ytest.to(self.device)).item()
-
-            if ihtDone == 0:
-                maxTestAcc = -10000
-                maxTestAccEpoch = i
-            else:
-                if maxTestAcc <= testAcc:
+
+                    # Updating the indicator sigma
+                    if ((counter == 0) or (counter == int(totalBatches / 3.0)) or
+                            (counter == int(2 * totalBatches / 3.0))) and (self.isDenseTraining is False):
+                        self.sigmaI = 1
+                        itersInPhase = 0
+
+                    elif (itersInPhase % 100 == 0):
+                        indices = np.random.choice(Xtrain.shape[0], 100)
+                        sampleX = toTensor(Xtrain[np.sort(indices), :])
+
+                        Teval = self.bonsaiObj.T.data
+                        Xcapeval = (torch.matmul(self.bonsaiObj.Z, torch.t(
+                            sampleX.to(self.device))) / self.bonsaiObj.projectionDimension).data
+
+                        sum_tr = 0.0
+                        for k in range(0, self.bonsaiObj.internalNodes):
+                            sum_tr += (
+                                np.sum(np.abs(np.dot(Teval[k].cpu(), Xcapeval.cpu()))))
+
+                        if(self.bonsaiObj.internalNodes > 0):
+                            sum_tr /= (100 * self.bonsaiObj.internalNodes)
+                            sum_tr = 0.1 / sum_tr
+                        else:
+                            sum_tr = 0.1
+                        sum_tr = min(
+                            1000, sum_tr * (2**(float(itersInPhase) /
+                                                (float(totalBatches) / 30.0))))
+
+                        self.sigmaI = sum_tr
+
+                    itersInPhase += 1
+
+                    self.optimizer.zero_grad()
+                    logits, _ = self.bonsaiObj(batchX, self.sigmaI)
+                    batchLoss, _, _ = self.loss(logits, batchY)
+                    batchAcc = self.accuracy(logits, batchY)
+
+                    batchLoss.backward()
+                    self.optimizer.step()
+
+                    # Classification.
+
+                    trainAcc += batchAcc.item()
+                    trainLoss += batchLoss.item()
+
+                    # Training routine involving IHT and sparse retraining
+                    if (counter >= int(totalBatches / 3.0) and
+                        (counter < int(2 * totalBatches / 3.0)) and
+                        counter % trimlevel == 0 and
+                            self.isDenseTraining is False):
+                        self.runHardThrsd()
+                        if ihtDone == 0:
+                            msg = " IHT Phase Started "
+                            print("\n%s%s%s\n" %
+                                  (header, msg, header), file=self.outFile)
+                        ihtDone = 1
+                    elif ((ihtDone == 1 and counter >= int(totalBatches / 3.0) and
+                           (counter < int(2 * totalBatches / 3.0)) and
+                           counter % trimlevel != 0 and
+                           self.isDenseTraining is False) or
+                            (counter >= int(2 * totalBatches / 3.0) and
+                                self.isDenseTraining is False)):
+                        self.runSparseTraining()
+                        # runSparseTraining runs the IHT itself when the IHT
+                        # phase was too short to reach it
+                        ihtDone = 1
+                        if counter == int(2 * totalBatches / 3.0):
+                            self.freezeSupport()
+                            msg = " Sparse Retraining Phase Started "
+                            print("\n%s%s%s\n" %
+                                  (header, msg, header), file=self.outFile)
+                    counter += 1
+
+                print("\nClassification Train Loss: " + str(trainLoss / numIters) +
+                      "\nTraining accuracy (Classification): " +
+                      str(trainAcc / numIters),
+                      file=self.outFile)
+
+                if (i + 1) % evalStep != 0 and i != totalEpochs - 1:
+                    self.outFile.flush()
+                    continue
+
+                oldSigmaI = self.sigmaI
+                self.sigmaI = 1e9
+                (testLoss, marginLoss, regLoss, testAcc,
+                 self.testConfusion) = self.evaluate(testLoader)
+
+                if ihtDone == 0:
+                    maxTestAcc = -10000
                     maxTestAccEpoch = i
-                    maxTestAcc = testAcc
-                    self.saveParams(currDir)
-                    self.saveParamsForSeeDot(currDir)
+                else:
+                    if maxTestAcc <= testAcc:
+                        maxTestAccEpoch = i
+                        maxTestAcc = testAcc
+                        self.savePacked(packedPath)
+
+                print("Test accuracy %g" % testAcc, file=self.outFile)
+
+                testAcc = testAcc
+                maxTestAcc = maxTestAcc
 
-            print("Test accuracy %g" % testAcc, file=self.outFile)
+                print("MarginLoss + RegLoss: " + str(marginLoss) + " + " +
+                      str(regLoss) + " = " + str(testLoss) + "\n",
+                      file=self.outFile)
+                self.outFile.flush()
 
-            testAcc = testAcc
-            maxTestAcc = maxTestAcc
+                self.sigmaI = oldSigmaI
 
-            print("MarginLoss + RegLoss: " + str(marginLoss.item()) + " + " +
-                  str(regLoss.item()) + " = " + str(testLoss.item()) + "\n",
-                  file=self.outFile)
-            self.outFile.flush()
+                if epochCallback is not None and epochCallback(i, testAcc) is False:
+                    print("\nStopped by epochCallback at Epoch: " + str(i + 1),
+                          file=self.outFile)
+                    break
+        finally:
+            self.releaseSupport()
 
-            self.sigmaI = oldSigmaI
+        self.maxTestAcc = maxTestAcc
+        self.testAcc = testAcc
 
         # sigmaI has to be set to infinity to ensure
         # only a single path is used in inference
@@ -399,6 +485,8 @@ class BonsaiTrainer:
               str(maxTestAcc) + " at Epoch: " +
               str(maxTestAccEpoch + 1) + "\nFinal Test" +
               " Accuracy: " + str(testAcc), file=self.outFile)
+        print("Final Test Confusion Matrix (rows are the true classes):\n" +
+              str(self.testConfusion.numpy()), file=self.outFile)
 
         resultFile.write("MaxTestAcc: " + str(maxTestAcc) +
                          " at Epoch(totalEpochs): " +
@@ -408,6 +496,11 @@ class BonsaiTrainer:
                          " KB hasSparse: " + str(self.getModelSize()[2]) +
                          " Param Directory: " +
                          str(os.path.abspath(currDir)) + "\n")
+        if os.path.isfile(packedPath):
+            packedModel = PackedModel(packedPath)
+            packedModel.toNpy(currDir)
+            np.save(currDir + '/hyperParam.npy', self.getHyperParams())
+            packedModel.toSeeDot(currDir + '/SeeDot')
         print("The Model Directory: " + currDir + "\n")
 
         resultFile.close()
@@ -3,17 +3,21 @@
 
 import os
 import sys
+import time
 import torch
 import torch.nn as nn
 import pytorch_edgeml.utils as utils
 from pytorch_edgeml.graph.rnn import *
+from pytorch_edgeml.data import BatchLoader
+from pytorch_edgeml.packedModel import savePackedModel, PackedModel
 import numpy as np
 
 
 class FastTrainer:
 
     def __init__(self, FastObj, numClasses, sW=1.0, sU=1.0,
-                 learningRate=0.01, outFile=None, device=None):
+                 learningRate=0.01, outFile=None, device=None, fused=False,
+                 precision=None):
         '''
         FastObj - Can be either FastRNN or FastGRNN or any of the RNN cells 
         in graph.rnn with proper initialisations
@@ -21,6 +25,10 @@ class FastTrainer:
         sW and sU are the sparsity factors for Fast parameters
         batchSize is the batchSize
         learningRate is the initial learning rate
+        fused - Use the fused (precomputed input, compiled) unroll of
+        BaseRNN when FastObj supports it
+        precision - None (fp32), 'bf16' or 'fp16' autocast for the forward
+        pass, see utils.MixedPrecision (fp16 uses loss scaling)
         '''
         self.FastObj = FastObj
 
@@ -35,6 +43,7 @@ class FastTrainer:
             self.device = device
 
         self.learningRate = learningRate
+        self.mixedPrecision = utils.MixedPrecision(self.device, precision)
 
         if outFile is not None:
             self.outFile = open(outFile, 'w')
@@ -52,7 +61,7 @@ class FastTrainer:
 
         self.optimizer = self.optimizer()
 
-        self.RNN = BaseRNN(self.FastObj).to(self.device)
+        self.RNN = BaseRNN(self.FastObj, fused=fused).to(self.device)
 
         self.FC = nn.Parameter(torch.randn(
             [self.FastObj.output_size, self.numClasses])).to(self.device)
@@ -60,6 +69,8 @@ class FastTrainer:
             [self.numClasses])).to(self.device)
 
         self.FastParams = self.FastObj.getVars()
+        self.thrsdMasks = None
+        self.supportHooks = []
 
     def classifier(self, feats):
         '''
@@ -107,6 +118,33 @@ class FastTrainer:
 
         return accuracy
 
+    def evaluate(self, testLoader):
+        '''
+        Chunked evaluation over the batches of testLoader (a BatchLoader),
+        loss, accuracy and confusion are accumulated per batch so that
+        memory is bounded by the batch size
+        Returns loss, accuracy and the [numClasses, numClasses] confusion
+        matrix (rows are the true classes)
+        '''
+        numClasses = self.numClasses
+        totalLoss = 0.0
+        numSamples = 0
+        confusion = torch.zeros(numClasses * numClasses, dtype=torch.long,
+                                device=self.device)
+        with torch.no_grad():
+            for batchX, batchY in testLoader:
+                with self.mixedPrecision.autocast():
+                    logits, _ = self.computeLogits(batchX)
+                    batchLoss = self.loss(logits, batchY)
+                totalLoss += batchLoss.item() * len(batchY)
+                numSamples += len(batchY)
+                confusion += torch.bincount(
+                    batchY.argmax(dim=1) * numClasses + logits.argmax(dim=1),
+                    minlength=numClasses * numClasses)
+        confusion = confusion.view(numClasses, numClasses).cpu()
+        accuracy = torch.trace(confusion).item() / float(numSamples)
+        return totalLoss / numSamples, accuracy, confusion
+
     def assertInit(self):
         err = "sparsity must be between 0 and 1"
         assert self.sW >= 0 and self.sW <= 1, "W " + err
@@ -116,32 +154,42 @@ class FastTrainer:
         '''
         Function to run the IHT routine on FastObj
         '''
-        self.thrsdParams = []
-        thrsdParams = []
+        self.thrsdMasks = []
         for i in range(0, self.numMatrices[0]):
-            thrsdParams.append(
-                utils.hardThreshold(self.FastParams[i].data.cpu(), self.sW))
+            self.thrsdMasks.append(
+                utils.hardThresholdTensor(self.FastParams[i].data, self.sW))
         for i in range(self.numMatrices[0], self.totalMatrices):
-            thrsdParams.append(
-                utils.hardThreshold(self.FastParams[i].data.cpu(), self.sU))
-        for i in range(0, self.totalMatrices):
-            self.FastParams[i].data = torch.FloatTensor(
-                thrsdParams[i]).to(self.device)
-        for i in range(0, self.totalMatrices):
-            self.thrsdParams.append(torch.FloatTensor(
-                np.copy(thrsdParams[i])).to(self.device))
+            self.thrsdMasks.append(
+                utils.hardThresholdTensor(self.FastParams[i].data, self.sU))
 
     def runSparseTraining(self):
         '''
         Function to run the Sparse Retraining routine on FastObj
+        No-op once the support is frozen. Runs the IHT first if the IHT
+        phase was too short to reach it (short trainings)
         '''
-        self.reTrainParams = []
+        if self.supportHooks:
+            return
+        if self.thrsdMasks is None:
+            self.runHardThrsd()
         for i in range(0, self.totalMatrices):
-            self.reTrainParams.append(
-                utils.copySupport(self.thrsdParams[i],
-                                  self.FastParams[i].data))
+            utils.applySupport(self.thrsdMasks[i], self.FastParams[i].data)
+
+    def freezeSupport(self):
+        '''
+        Makes the masks of the last IHT persistent for the Sparse Retraining
+        phase by masking the gradients instead of reapplying them per batch
+        '''
+        self.supportHooks = []
         for i in range(0, self.totalMatrices):
-            self.FastParams[i].data = self.reTrainParams[i]
+            self.supportHooks.append(
+                utils.freezeSupport(self.FastParams[i], self.thrsdMasks[i],
+                                    self.optimizer))
+
+    def releaseSupport(self):
+        for hook in self.supportHooks:
+            hook.remove()
+        self.supportHooks = []
 
     def getModelSize(self):
         '''
@@ -180,176 +228,98 @@ class FastTrainer:
 
         return totalnnZ, totalSize, hasSparse
 
+    def getParams(self):
+        '''
+        Ordered dict of the parameter matrices (numpy) by their saved names
+        W/W1.., U/U1.., the biases and scalars of the cell, FC and FCbias
+        '''
+        def matrixNames(prefix, numMatrices, rank):
+            # Full rank cells with a single matrix save W, full rank cells
+            # with one matrix per gate and low rank FastGRNN/FastRNN save
+            # W1, W2.. and the other low rank cells save W, W1..
+            if numMatrices == 1:
+                return [prefix]
+            if rank is None or numMatrices == 2:
+                return [prefix + str(i + 1) for i in range(numMatrices)]
+            return [prefix] + [prefix + str(i + 1)
+                               for i in range(numMatrices - 1)]
+
+        biasNames = {"FastGRNN": ["Bg", "Bh", "zeta", "nu"],
+                     "FastRNN": ["B", "alpha", "beta"],
+                     "UGRNNLR": ["Bg", "Bh"],
+                     "GRULR": ["Br", "Bg", "Bh"],
+                     "LSTMLR": ["Bf", "Bi", "Bc", "Bo"]}
+        names = (matrixNames("W", self.numMatrices[0], self.FastObj.wRank) +
+                 matrixNames("U", self.numMatrices[1], self.FastObj.uRank) +
+                 biasNames[self.FastObj.cellType])
+        params = {}
+        for name, param in zip(names, self.FastParams):
+            params[name] = param.data.cpu().numpy()
+        params["FC"] = self.FC.data.cpu().numpy()
+        params["FCbias"] = self.FCbias.data.cpu().numpy()
+        return params
+
+    def getHyperParams(self):
+        '''
+        Hyperparameters of the cell and classifier, the header of the packed
+        model
+        '''
+        return {"cellType": self.FastObj.cellType,
+                "inputDims": self.inputDims,
+                "hiddenDims": self.FastObj.output_size,
+                "numClasses": self.numClasses,
+                "wRank": self.FastObj.wRank,
+                "uRank": self.FastObj.uRank,
+                "gateNonLinearity": getattr(self.FastObj,
+                                            "gate_non_linearity", None),
+                "updateNonLinearity": getattr(self.FastObj,
+                                              "update_non_linearity", None),
+                "sW": self.sW, "sU": self.sU}
+
     def saveParams(self, currDir):
         '''
         Function to save Parameter matrices
         '''
-        if self.numMatrices[0] == 1:
-            np.save(os.path.join(currDir, "W.npy"),
-                    self.FastParams[0].data.cpu())
-        elif self.FastObj.wRank is None:
-            if self.numMatrices[0] == 2:
-                np.save(os.path.join(currDir, "W1.npy"),
-                        self.FastParams[0].data.cpu())
-                np.save(os.path.join(currDir, "W2.npy"),
-                        self.FastParams[1].data.cpu())
-            if self.numMatrices[0] == 3:
-                np.save(os.path.join(currDir, "W1.npy"),
-                        self.FastParams[0].data.cpu())
-                np.save(os.path.join(currDir, "W2.npy"),
-                        self.FastParams[1].data.cpu())
-                np.save(os.path.join(currDir, "W3.npy"),
-                        self.FastParams[2].data.cpu())
-            if self.numMatrices[0] == 4:
-                np.save(os.path.join(currDir, "W1.npy"),
-                        self.FastParams[0].data.cpu())
-                np.save(os.path.join(currDir, "W2.npy"),
-                        self.FastParams[1].data.cpu())
-                np.save(os.path.join(currDir, "W3.npy"),
-                        self.FastParams[2].data.cpu())
-                np.save(os.path.join(currDir, "W4.npy"),
-                        self.FastParams[3].data.cpu())
-        elif self.FastObj.wRank is not None:
-            if self.numMatrices[0] == 2:
-                np.save(os.path.join(currDir, "W1.npy"),
-                        self.FastParams[0].data.cpu())
-                np.save(os.path.join(currDir, "W2.npy"),
-                        self.FastParams[1].data.cpu())
-            if self.numMatrices[0] == 3:
-                np.save(os.path.join(currDir, "W.npy"),
-                        self.FastParams[0].data.cpu())
-                np.save(os.path.join(currDir, "W1.npy"),
-                        self.FastParams[1].data.cpu())
-                np.save(os.path.join(currDir, "W2.npy"),
-                        self.FastParams[2].data.cpu())
-            if self.numMatrices[0] == 4:
-                np.save(os.path.join(currDir, "W.npy"),
-                        self.FastParams[0].data.cpu())
-                np.save(os.path.join(currDir, "W1.npy"),
-                        self.FastParams[1].data.cpu())
-                np.save(os.path.join(currDir, "W2.npy"),
-                        self.FastParams[2].data.cpu())
-                np.save(os.path.join(currDir, "W3.npy"),
-                        self.FastParams[3].data.cpu())
-            if self.numMatrices[0] == 5:
-                np.save(os.path.join(currDir, "W.npy"),
-                        self.FastParams[0].data.cpu())
-                np.save(os.path.join(currDir, "W1.npy"),
-                        self.FastParams[1].data.cpu())
-                np.save(os.path.join(currDir, "W2.npy"),
-                        self.FastParams[2].data.cpu())
-                np.save(os.path.join(currDir, "W3.npy"),
-                        self.FastParams[3].data.cpu())
-                np.save(os.path.join(currDir, "W4.npy"),
-                        self.FastParams[4].data.cpu())
-
-        idx = self.numMatrices[0]
-        if self.numMatrices[1] == 1:
-            np.save(os.path.join(currDir, "U.npy"),
-                    self.FastParams[idx + 0].data.cpu())
-        elif self.FastObj.uRank is None:
-            if self.numMatrices[1] == 2:
-                np.save(os.path.join(currDir, "U1.npy"),
-                        self.FastParams[idx + 0].data.cpu())
-                np.save(os.path.join(currDir, "U2.npy"),
-                        self.FastParams[idx + 1].data.cpu())
-            if self.numMatrices[1] == 3:
-                np.save(os.path.join(currDir, "U1.npy"),
-                        self.FastParams[idx + 0].data.cpu())
-                np.save(os.path.join(currDir, "U2.npy"),
-                        self.FastParams[idx + 1].data.cpu())
-                np.save(os.path.join(currDir, "U3.npy"),
-                        self.FastParams[idx + 2].data.cpu())
-            if self.numMatrices[1] == 4:
-                np.save(os.path.join(currDir, "U1.npy"),
-                        self.FastParams[idx + 0].data.cpu())
-                np.save(os.path.join(currDir, "U2.npy"),
-                        self.FastParams[idx + 1].data.cpu())
-                np.save(os.path.join(currDir, "U3.npy"),
-                        self.FastParams[idx + 2].data.cpu())
-                np.save(os.path.join(currDir, "U4.npy"),
-                        self.FastParams[idx + 3].data.cpu())
-        elif self.FastObj.uRank is not None:
-            if self.numMatrices[1] == 2:
-                np.save(os.path.join(currDir, "U1.npy"),
-                        self.FastParams[idx + 0].data.cpu())
-                np.save(os.path.join(currDir, "U2.npy"),
-                        self.FastParams[idx + 1].data.cpu())
-            if self.numMatrices[1] == 3:
-                np.save(os.path.join(currDir, "U.npy"),
-                        self.FastParams[idx + 0].data.cpu())
-                np.save(os.path.join(currDir, "U1.npy"),
-                        self.FastParams[idx + 1].data.cpu())
-                np.save(os.path.join(currDir, "U2.npy"),
-                        self.FastParams[idx + 2].data.cpu())
-            if self.numMatrices[1] == 4:
-                np.save(os.path.join(currDir, "U.npy"),
-                        self.FastParams[idx + 0].data.cpu())
-                np.save(os.path.join(currDir, "U1.npy"),
-                        self.FastParams[idx + 1].data.cpu())
-                np.save(os.path.join(currDir, "U2.npy"),
-                        self.FastParams[idx + 2].data.cpu())
-                np.save(os.path.join(currDir, "U3.npy"),
-                        self.FastParams[idx + 3].data.cpu())
-            if self.numMatrices[1] == 5:
-                np.save(os.path.join(currDir, "U.npy"),
-                        self.FastParams[idx + 0].data.cpu())
-                np.save(os.path.join(currDir, "U1.npy"),
-                        self.FastParams[idx + 1].data.cpu())
-                np.save(os.path.join(currDir, "U2.npy"),
-                        self.FastParams[idx + 2].data.cpu())
-                np.save(os.path.join(currDir, "U3.npy"),
-                        self.FastParams[idx + 3].data.cpu())
-                np.save(os.path.join(currDir, "U4.npy"),
-                        self.FastParams[idx + 4].data.cpu())
-
-        if self.FastObj.cellType == "FastGRNN":
-            np.save(os.path.join(currDir, "Bg.npy"),
-                    self.FastParams[self.totalMatrices].data.cpu())
-            np.save(os.path.join(currDir, "Bh.npy"),
-                    self.FastParams[self.totalMatrices + 1].data.cpu())
-            np.save(os.path.join(currDir, "zeta.npy"),
-                    self.FastParams[self.totalMatrices + 2].data.cpu())
-            np.save(os.path.join(currDir, "nu.npy"),
-                    self.FastParams[self.totalMatrices + 3].data.cpu())
-        elif self.FastObj.cellType == "FastRNN":
-            np.save(os.path.join(currDir, "B.npy"),
-                    self.FastParams[self.totalMatrices].data.cpu())
-            np.save(os.path.join(currDir, "alpha.npy"), self.FastParams[
-                    self.totalMatrices + 1].data.cpu())
-            np.save(os.path.join(currDir, "beta.npy"),
-                    self.FastParams[self.totalMatrices + 2].data.cpu())
-        elif self.FastObj.cellType == "UGRNNLR":
-            np.save(os.path.join(currDir, "Bg.npy"),
-                    self.FastParams[self.totalMatrices].data.cpu())
-            np.save(os.path.join(currDir, "Bh.npy"),
-                    self.FastParams[self.totalMatrices + 1].data.cpu())
-        elif self.FastObj.cellType == "GRULR":
-            np.save(os.path.join(currDir, "Br.npy"),
-                    self.FastParams[self.totalMatrices].data.cpu())
-            np.save(os.path.join(currDir, "Bg.npy"),
-                    self.FastParams[self.totalMatrices + 1].data.cpu())
-            np.save(os.path.join(currDir, "Bh.npy"),
-                    self.FastParams[self.totalMatrices + 2].data.cpu())
-        elif self.FastObj.cellType == "LSTMLR":
-            np.save(os.path.join(currDir, "Bf.npy"),
-                    self.FastParams[self.totalMatrices].data.cpu())
-            np.save(os.path.join(currDir, "Bi.npy"),
-                    self.FastParams[self.totalMatrices + 1].data.cpu())
-            np.save(os.path.join(currDir, "Bc.npy"),
-                    self.FastParams[self.totalMatrices + 2].data.cpu())
-            np.save(os.path.join(currDir, "Bo.npy"),
-                    self.FastParams[self.totalMatrices + 3].data.cpu())
-
-        np.save(os.path.join(currDir, "FC.npy"), self.FC.data.cpu())
-        np.save(os.path.join(currDir, "FCbias.npy"), self.FCbias.data.cpu())
+        for name, param in self.getParams().items():
+            np.save(os.path.join(currDir, name + ".npy"), param)
+
+    def savePacked(self, path, quantize=None):
+        '''
+        Saves the parameters and hyperparameters as a single packed model
+        file (see packedModel.py), the W and U matrices trained sparse are
+        stored in CSR. quantize can be 'int8' or 'int16'
+        '''
+        params = self.getParams()
+        sparsity = {}
+        for i, name in enumerate(params.keys()):
+            if i < self.numMatrices[0]:
+                sparsity[name] = self.sW
+            elif i < self.totalMatrices:
+                sparsity[name] = self.sU
+        savePackedModel(path, self.FastObj.cellType, params,
+                        self.getHyperParams(), sparsity, quantize)
 
     def train(self, batchSize, totalEpochs, Xtrain, Xtest, Ytrain, Ytest,
-              decayStep, decayRate, dataDir, currDir):
+              decayStep, decayRate, dataDir, currDir, prefetch=2,
+              shuffleChunkSize=None, evalBatchSize=1000, evalStep=1,
+              epochCallback=None):
         '''
         The Dense - IHT - Sparse Retrain Routine for FastCell Training
+        prefetch is the # of batches prepared ahead by the BatchLoader
+        Xtrain and Ytrain can be memory mapped arrays, shuffleChunkSize
+        shuffles chunks of that many samples and then within the chunks
+        (see data.chunkedShuffle) to keep the reads local
+        The test set is evaluated in batches of evalBatchSize every evalStep
+        epochs (and after the last epoch)
+        epochCallback(epoch, testAcc) is called after every evaluation,
+        training stops early if it returns False. The maximum and final
+        test accuracies are kept as self.maxTestAcc and self.testAcc
+        The best model is saved as the single file currDir/model.edgeml
+        (see packedModel.py) and unpacked to the .npy files of saveParams
+        once training ends
         '''
         fileName = str(self.FastObj.cellType) + 'Results_pytorch.txt'
+        packedPath = os.path.join(currDir, "model.edgeml")
         resultFile = open(os.path.join(dataDir, fileName), 'a+')
         numIters = int(np.ceil(float(Xtrain.shape[0]) / float(batchSize)))
         totalBatches = numIters * totalEpochs
@@ -364,95 +334,118 @@ class FastTrainer:
         header = '*' * 20
         self.timeSteps = int(Xtest.shape[1] / self.inputDims)
         Xtest = Xtest.reshape((-1, self.timeSteps, self.inputDims))
+        testLoader = BatchLoader(Xtest, Ytest, evalBatchSize,
+                                 device=self.device, prefetch=prefetch)
         Xtrain = Xtrain.reshape((-1, self.timeSteps, self.inputDims))
-
-        for i in range(0, totalEpochs):
-            print("\nEpoch Number: " + str(i), file=self.outFile)
-
-            if i % decayStep == 0 and i != 0:
-                self.learningRate = self.learningRate * decayRate
-                for param_group in self.optimizer.param_groups:
-                    param_group['lr'] = self.learningRate
-
-            shuffled = list(range(Xtrain.shape[0]))
-            np.random.shuffle(shuffled)
-            trainAcc = 0.0
-            trainLoss = 0.0
-            numIters = int(numIters)
-            for j in range(0, numIters):
-
-                if counter == 0:
-                    msg = " Dense Training Phase Started "
-                    print("\n%s%s%s\n" %
-                          (header, msg, header), file=self.outFile)
-
-                k = shuffled[j * batchSize:(j + 1) * batchSize]
-                batchX = Xtrain[k]
-                batchY = Ytrain[k]
-
-                self.optimizer.zero_grad()
-                logits, _ = self.computeLogits(batchX.to(self.device))
-                batchLoss = self.loss(logits, batchY.to(self.device))
-                batchAcc = self.accuracy(logits, batchY.to(self.device))
-                batchLoss.backward()
-                self.optimizer.step()
-
-                del batchX, batchY
-
-                trainAcc += batchAcc.item()
-                trainLoss += batchLoss.item()
-
-                if (counter >= int(totalBatches / 3.0) and
-                        (counter < int(2 * totalBatches / 3.0)) and
-                        counter % trimlevel == 0 and
-                        self.isDenseTraining is False):
-                    self.runHardThrsd()
-                    if ihtDone == 0:
-                        msg = " IHT Phase Started "
-                        print("\n%s%s%s\n" %
-                              (header, msg, header), file=self.outFile)
-                    ihtDone = 1
-                elif ((ihtDone == 1 and counter >= int(totalBatches / 3.0) and
-                       (counter < int(2 * totalBatches / 3.0)) and
-                       counter % trimlevel != 0 and
-                       self.isDenseTraining is False) or
-                        (counter >= int(2 * totalBatches / 3.0) and
-                            self.isDenseTraining is False)):
-                    self.runSparseTraining()
-                    if counter == int(2 * totalBatches / 3.0):
-                        msg = " Sprase Retraining Phase Started "
+        trainLoader = BatchLoader(Xtrain, Ytrain, batchSize, shuffle=True,
+                                  device=self.device, prefetch=prefetch,
+                                  chunkSize=shuffleChunkSize)
+
+        # The support hooks are released even if training fails, they
+        # would otherwise keep masking the gradients of the next train()
+        try:
+            for i in range(0, totalEpochs):
+                print("\nEpoch Number: " + str(i), file=self.outFile)
+
+                if i % decayStep == 0 and i != 0:
+                    self.learningRate = self.learningRate * decayRate
+                    for param_group in self.optimizer.param_groups:
+                        param_group['lr'] = self.learningRate
+
+                trainAcc = 0.0
+                trainLoss = 0.0
+                numIters = int(numIters)
+                epochStart = time.time()
+                for batchX, batchY in trainLoader:
+
+                    if counter == 0:
+                        msg = " Dense Training Phase Started "
                         print("\n%s%s%s\n" %
                               (header, msg, header), file=self.outFile)
-                counter += 1
-
-            trainLoss /= numIters
-            trainAcc /= numIters
-            print("Train Loss: " + str(trainLoss) +
-                  " Train Accuracy: " + str(trainAcc),
-                  file=self.outFile)
-
-            logits, _ = self.computeLogits(Xtest.to(self.device))
-            testLoss = self.loss(logits, Ytest.to(self.device)).item()
-            testAcc = self.accuracy(logits, Ytest.to(self.device)).item()
-
-            if ihtDone == 0:
-                maxTestAcc = -10000
-                maxTestAccEpoch = i
-            else:
-                if maxTestAcc <= testAcc:
-                    maxTestAccEpoch = i
-                    maxTestAcc = testAcc
-                    self.saveParams(currDir)
 
-            print("Test Loss: " + str(testLoss) +
-                  " Test Accuracy: " + str(testAcc), file=self.outFile)
-            self.outFile.flush()
+                    self.optimizer.zero_grad()
+                    with self.mixedPrecision.autocast():
+                        logits, _ = self.computeLogits(batchX)
+                        batchLoss = self.loss(logits, batchY)
+                    batchAcc = self.accuracy(logits, batchY)
+                    self.mixedPrecision.step(batchLoss, self.optimizer)
+
+                    del batchX, batchY
+
+                    trainAcc += batchAcc.item()
+                    trainLoss += batchLoss.item()
+
+                    if (counter >= int(totalBatches / 3.0) and
+                            (counter < int(2 * totalBatches / 3.0)) and
+                            counter % trimlevel == 0 and
+                            self.isDenseTraining is False):
+                        self.runHardThrsd()
+                        if ihtDone == 0:
+                            msg = " IHT Phase Started "
+                            print("\n%s%s%s\n" %
+                                  (header, msg, header), file=self.outFile)
+                        ihtDone = 1
+                    elif ((ihtDone == 1 and counter >= int(totalBatches / 3.0) and
+                           (counter < int(2 * totalBatches / 3.0)) and
+                           counter % trimlevel != 0 and
+                           self.isDenseTraining is False) or
+                            (counter >= int(2 * totalBatches / 3.0) and
+                                self.isDenseTraining is False)):
+                        self.runSparseTraining()
+                        # runSparseTraining runs the IHT itself when the IHT
+                        # phase was too short to reach it
+                        ihtDone = 1
+                        if counter == int(2 * totalBatches / 3.0):
+                            self.freezeSupport()
+                            msg = " Sprase Retraining Phase Started "
+                            print("\n%s%s%s\n" %
+                                  (header, msg, header), file=self.outFile)
+                    counter += 1
+
+                trainLoss /= numIters
+                trainAcc /= numIters
+                print("Train Loss: " + str(trainLoss) +
+                      " Train Accuracy: " + str(trainAcc) +
+                      " Throughput: %.1f samples/s" %
+                      (Xtrain.shape[0] / (time.time() - epochStart)),
+                      file=self.outFile)
+
+                if (i + 1) % evalStep != 0 and i != totalEpochs - 1:
+                    self.outFile.flush()
+                    continue
+
+                testLoss, testAcc, self.testConfusion = self.evaluate(testLoader)
+
+                if ihtDone == 0:
+                    maxTestAcc = -10000
+                    maxTestAccEpoch = i
+                else:
+                    if maxTestAcc <= testAcc:
+                        maxTestAccEpoch = i
+                        maxTestAcc = testAcc
+                        self.savePacked(packedPath)
+
+                print("Test Loss: " + str(testLoss) +
+                      " Test Accuracy: " + str(testAcc), file=self.outFile)
+                self.outFile.flush()
+
+                if epochCallback is not None and epochCallback(i, testAcc) is False:
+                    print("\nStopped by epochCallback at Epoch: " + str(i + 1),
+                          file=self.outFile)
+                    break
+        finally:
+            self.releaseSupport()
+
+        self.maxTestAcc = maxTestAcc
+        self.testAcc = testAcc
 
         print("\nMaximum Test accuracy at compressed" +
               " model size(including early stopping): " +
               str(maxTestAcc) + " at Epoch: " +
               str(maxTestAccEpoch + 1) + "\nFinal Test" +
               " Accuracy: " + str(testAcc), file=self.outFile)
+        print("Final Test Confusion Matrix (rows are the true classes):\n" +
+              str(self.testConfusion.numpy()), file=self.outFile)
         print("\n\nNon-Zeros: " + str(self.getModelSize()[0]) +
               " Model Size: " + str(float(self.getModelSize()[1]) / 1024.0) +
               " KB hasSparse: " + str(self.getModelSize()[2]) + "\n",
@@ -467,6 +460,8 @@ class FastTrainer:
                          " Param Directory: " +
                          str(os.path.abspath(currDir)) + "\n")
 
+        if os.path.isfile(packedPath):
+            PackedModel(packedPath).toNpy(currDir)
         print("The Model Directory: " + currDir + "\n")
 
         # output the tensorflow model
@@ -6,6 +6,7 @@ import numpy as np
 import os
 import sys
 import pytorch_edgeml.utils as utils
+from pytorch_edgeml.data import BatchLoader
 
 
 class ProtoNNTrainer:
@@ -109,16 +110,12 @@ class ProtoNNTrainer:
 
     def hardThreshold(self):
         prtn = self.protoNNObj
-        W, B, Z = prtn.W.data, prtn.B.data, prtn.Z.data
-        newW = utils.hardThreshold(W, self.__sW)
-        newB = utils.hardThreshold(B, self.__sB)
-        newZ = utils.hardThreshold(Z, self.__sZ)
-        prtn.W.data = torch.FloatTensor(newW).to(self.device)
-        prtn.B.data = torch.FloatTensor(newB).to(self.device)
-        prtn.Z.data = torch.FloatTensor(newZ).to(self.device)
+        utils.hardThresholdTensor(prtn.W.data, self.__sW)
+        utils.hardThresholdTensor(prtn.B.data, self.__sB)
+        utils.hardThresholdTensor(prtn.Z.data, self.__sZ)
 
     def train(self, batchSize, epochs, x_train, x_val, y_train, y_val,
-              printStep=10, valStep=1):
+              printStep=10, valStep=1, prefetch=2, epochCallback=None):
         '''
         Performs dense training of ProtoNN followed by iterative hard
         thresholding to enforce sparsity constraints.
@@ -127,10 +124,15 @@ class ProtoNNTrainer:
         epochs : The number of epochs to run training for. One epoch is
             defined as one pass over the entire training data.
         x_train, x_val, y_train, y_val: The numpy array containing train and
-            validation data. x data is assumed to in of shape [-1,
+            validation data, can be memory mapped (np.load(..., mmap_mode='r')).
+            x data is assumed to in of shape [-1,
             featureDimension] while y should have shape [-1, numberLabels].
         printStep: Number of batches between echoing of loss and train accuracy.
         valStep: Number of epochs between evaluations on validation set.
+        prefetch: Number of batches prepared ahead by the BatchLoader.
+        epochCallback: Called as epochCallback(epoch, valAccuracy) after
+            every validation, training stops early if it returns False. The
+            last validation accuracy is kept as self.valAccuracy.
         '''
         d, dcap, m, L, _ = self.protoNNObj.getHyperParams()
         assert batchSize >= 1, 'Batch size should be positive integer'
@@ -144,18 +146,13 @@ class ProtoNNTrainer:
         assert y_val.ndim == 2, 'Expected validation labels to be of rank 2'
         assert y_val.shape[1] == L, 'Expected y_val to be [-1, %d]' % L
 
-        trainNumBatches = int(np.ceil(len(x_train) / batchSize))
-        valNumBatches = int(np.ceil(len(x_val) / batchSize))
-        x_train_batches = np.array_split(x_train, trainNumBatches)
-        y_train_batches = np.array_split(y_train, trainNumBatches)
-        x_val_batches = np.array_split(x_val, valNumBatches)
-        y_val_batches = np.array_split(y_val, valNumBatches)
+        trainLoader = BatchLoader(x_train, y_train, batchSize, balanced=True,
+                                  device=self.device, prefetch=prefetch)
+        valLoader = BatchLoader(x_val, y_val, batchSize, balanced=True,
+                                device=self.device, prefetch=prefetch)
 
         for epoch in range(epochs):
-            for i in range(len(x_train_batches)):
-                x_batch, y_batch = x_train_batches[i], y_train_batches[i]
-                x_batch, y_batch = torch.Tensor(x_batch), torch.Tensor(y_batch)
-                x_batch, y_batch = x_batch.to(self.device), y_batch.to(self.device)
+            for i, (x_batch, y_batch) in enumerate(trainLoader):
                 self.optimizer.zero_grad()
                 logits = self.protoNNObj.forward(x_batch)
                 loss = self.loss(logits, y_batch)
@@ -173,14 +170,15 @@ class ProtoNNTrainer:
             # Perform validation set evaluation
             if (epoch + 1) % valStep == 0:
                 numCorrect = 0
-                for i in range(len(x_val_batches)):
-                    x_batch, y_batch = x_val_batches[i], y_val_batches[i]
-                    x_batch, y_batch = torch.Tensor(x_batch), torch.Tensor(y_batch)
-                    x_batch, y_batch = x_batch.to(self.device), y_batch.to(self.device)
+                for x_batch, y_batch in valLoader:
                     logits = self.protoNNObj.forward(x_batch)
                     _, predictions = torch.max(logits, dim=1)
                     _, target = torch.max(y_batch, dim=1)
                     _, count = self.accuracy(predictions, target)
                     numCorrect += count
-                print("Validation accuracy: %f" % (numCorrect / len(x_val)))
+                self.valAccuracy = float(numCorrect) / len(x_val)
+                print("Validation accuracy: %f" % self.valAccuracy)
+                if (epochCallback is not None and
+                        epochCallback(epoch, self.valAccuracy) is False):
+                    break
 
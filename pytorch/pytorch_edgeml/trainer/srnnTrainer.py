@@ -5,14 +5,19 @@ import torch
 import numpy as np
 import os
 import sys
+import time
 import pytorch_edgeml.utils as utils
+from pytorch_edgeml.data import BatchLoader
 
 
 class SRNNTrainer:
 
-    def __init__(self, srnnObj, learningRate, lossType='l2', device = None):
+    def __init__(self, srnnObj, learningRate, lossType='l2', device = None,
+                 precision=None):
         '''
         A simple trainer for SRNN
+        precision: None (fp32), 'bf16' or 'fp16' autocast for the forward
+            pass, see utils.MixedPrecision (fp16 uses loss scaling)
         '''
 
         self.srnnObj = srnnObj
@@ -32,6 +37,7 @@ class SRNNTrainer:
             self.device = "cpu"
         else:
             self.device = device
+        self.mixedPrecision = utils.MixedPrecision(self.device, precision)
 
     def __optimizer(self):
         optimizer = torch.optim.Adam(self.srnnObj.parameters(),
@@ -62,7 +68,7 @@ class SRNNTrainer:
         return acc, numCorrect
 
     def train(self, brickSize, batchSize, epochs, x_train, x_val, y_train, y_val,
-              printStep=10, valStep=1):
+              printStep=10, valStep=1, prefetch=2):
         '''
         Performs training of SRNN.
 
@@ -70,10 +76,12 @@ class SRNNTrainer:
         epochs : The number of epochs to run training for. One epoch is
             defined as one pass over the entire training data.
         x_train, x_val, y_train, y_val: The numpy array containing train and
-            validation data. x data is assumed to in of shape [timeSteps,
+            validation data, can be memory mapped (np.load(..., mmap_mode='r')).
+            x data is assumed to in of shape [timeSteps,
             -1, featureDimension] while y should have shape [-1, numberLabels].
         printStep: Number of batches between echoing of loss and train accuracy.
         valStep: Number of epochs between evaluations on validation set.
+        prefetch: Number of batches prepared ahead by the BatchLoader.
         '''
         L = self.srnnObj.outputDim
         assert batchSize >= 1, 'Batch size should be positive integer'
@@ -85,39 +93,34 @@ class SRNNTrainer:
         assert y_val.ndim == 2, 'Expected validation labels to be of rank 2'
         assert y_val.shape[1] == L, 'Expected y_val to be [-1, %d]' % L
 
-        trainNumBatches = int(np.ceil((x_train.shape[1]) / batchSize))
-        valNumBatches = int(np.ceil((x_val.shape[1]) / batchSize))
-        x_train_batches = np.array_split(x_train, trainNumBatches, axis=1)
-        y_train_batches = np.array_split(y_train, trainNumBatches)
-        x_val_batches = np.array_split(x_val, valNumBatches, axis=1)
-        y_val_batches = np.array_split(y_val, valNumBatches)
+        trainLoader = BatchLoader(x_train, y_train, batchSize, balanced=True,
+                                  axis=1, device=self.device,
+                                  prefetch=prefetch)
+        valLoader = BatchLoader(x_val, y_val, batchSize, balanced=True,
+                                axis=1, device=self.device, prefetch=prefetch)
 
         for epoch in range(epochs):
-            for i in range(len(x_train_batches)):
-                x_batch, y_batch = x_train_batches[i], y_train_batches[i]
-                x_batch = torch.Tensor(x_batch)
-                y_batch = torch.Tensor(y_batch)
-                x_batch, y_batch = x_batch.to(self.device), y_batch.to(self.device)
+            epochStart = time.time()
+            for i, (x_batch, y_batch) in enumerate(trainLoader):
                 self.optimizer.zero_grad()
-                logits = self.srnnObj.forward(x_batch, brickSize)
-                loss = self.loss(logits, y_batch)
-                loss.backward()
-                self.optimizer.step()
+                with self.mixedPrecision.autocast():
+                    logits = self.srnnObj.forward(x_batch, brickSize)
+                    loss = self.loss(logits, y_batch)
+                self.mixedPrecision.step(loss, self.optimizer)
                 _, predictions = torch.max(logits, dim=1)
                 _, target = torch.max(y_batch, dim=1)
                 acc, _ = self.accuracy(predictions, target)
                 if i % printStep == 0:
                     print("Epoch %d batch %d loss %f acc %f" % (epoch, i, loss,
                                                                acc))
+            print("Epoch %d throughput %f samples/s" %
+                  (epoch, x_train.shape[1] / (time.time() - epochStart)))
             # Perform validation set evaluation
             if (epoch + 1) % valStep == 0 or (epoch == epochs - 1):
                 numCorrect = 0
-                for i in range(len(x_val_batches)):
-                    x_batch, y_batch = x_val_batches[i], y_val_batches[i]
-                    x_batch = torch.Tensor(x_batch)
-                    y_batch = torch.Tensor(y_batch)
-                    x_batch, y_batch = x_batch.to(self.device), y_batch.to(self.device)
-                    logits = self.srnnObj.forward(x_batch, brickSize)
+                for x_batch, y_batch in valLoader:
+                    with torch.no_grad(), self.mixedPrecision.autocast():
+                        logits = self.srnnObj.forward(x_batch, brickSize)
                     _, predictions = torch.max(logits, dim=1)
                     _, target = torch.max(y_batch, dim=1)
                     _, count = self.accuracy(predictions, target)
@@ -1,8 +1,10 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT license.
 
+import contextlib
 import numpy as np
 import torch
+import warnings
 import torch.nn.functional as F
 
 
@@ -53,16 +55,54 @@ def hardThreshold(A, s):
     return A_
 
 
+def hardThresholdTensor(A, s):
+    '''
+    Hard thresholding of Tensor A with sparsity s done in place on the
+    device of A (same threshold as hardThreshold)
+    Returns the boolean support mask of the thresholded A
+    '''
+    A_ = A.view(-1)
+    if len(A_) > 0:
+        # np.percentile(interpolation='higher') is the k-th smallest value
+        k = int(np.ceil((1 - s) * (len(A_) - 1))) + 1
+        th = torch.kthvalue(torch.abs(A_), k)[0]
+        support = torch.abs(A) >= th
+        A.masked_fill_(~support, 0.0)
+    else:
+        support = torch.ones_like(A, dtype=torch.bool)
+    return support
+
+
+def applySupport(support, dest):
+    '''
+    Zeroes dest outside of the boolean support mask, in place (+0.0, a
+    product with the mask would leave -0.0 for negative values)
+    '''
+    return dest.masked_fill_(~support, 0.0)
+
+
+def freezeSupport(param, support, optimizer=None):
+    '''
+    Persistently restricts Parameter param to the boolean support mask.
+    param is zeroed outside support, a hook masks its gradient and the
+    per-parameter optimizer state (eg. Adam moments) is zeroed outside
+    support, so later optimizer steps keep the zeros without reapplying
+    the support every batch.
+    Returns the hook handle, call handle.remove() to release param
+    '''
+    applySupport(support, param.data)
+    if optimizer is not None:
+        for value in optimizer.state.get(param, {}).values():
+            if torch.is_tensor(value) and value.shape == param.shape:
+                applySupport(support, value)
+    return param.register_hook(lambda grad: grad * support)
+
+
 def copySupport(src, dest):
     '''
     copy support of src tensor to dest tensor
     '''
-    zeroSupport = (src.view(-1) == 0.0).nonzero()
-    dest = dest.reshape(-1)
-    dest[zeroSupport] = 0
-    dest = dest.reshape(src.shape)
-    del zeroSupport
-    return dest
+    return applySupport(src != 0.0, dest)
 
 
 def countnnZ(A, s, bytesPerVar=4):
@@ -84,6 +124,72 @@ def countnnZ(A, s, bytesPerVar=4):
         return nnZ, nnZ * bytesPerVar, hasSparse
 
 
+def toSparse(A):
+    '''
+    Converts the 2D dense tensor A to sparse storage, CSR when supported by
+    the installed torch else COO
+    '''
+    with warnings.catch_warnings():
+        # CSR support is flagged as beta by torch
+        warnings.simplefilter("ignore")
+        if hasattr(A, "to_sparse_csr"):
+            return A.detach().to_sparse_csr()
+        return A.detach().to_sparse().coalesce()
+
+
+def sparseSize(A, bytesPerVar=4):
+    '''
+    Returns # of non-zeros and the size of the sparse storage of the 2D
+    tensor A (values and column indices per non-zero + row pointers)
+    '''
+    nnZ = int(torch.sum(A != 0.0))
+    return nnZ, (2 * nnZ + A.shape[0] + 1) * bytesPerVar
+
+
+class MixedPrecision:
+    '''
+    Autocast and loss scaling for the trainers
+    precision: None (fp32), 'bf16' or 'fp16'
+    Parameters (including the zeta/nu like scalars), optimizer state and IHT
+    stay in fp32, only the autocast eligible ops (the GEMMs) run in the
+    lower precision. fp16 uses dynamic loss scaling, bf16 does not need it
+    '''
+
+    def __init__(self, device, precision=None):
+        precisions = {None: None, 'fp32': None,
+                      'bf16': torch.bfloat16, 'fp16': torch.float16}
+        assert precision in precisions, \
+            'Supported precisions: %r' % list(precisions.keys())
+        self.deviceType = torch.device(device).type
+        self.dtype = precisions[precision]
+        self.scaler = None
+        if self.dtype == torch.float16:
+            if hasattr(torch.amp, "GradScaler"):
+                self.scaler = torch.amp.GradScaler(self.deviceType)
+            else:
+                self.scaler = torch.cuda.amp.GradScaler()
+
+    def autocast(self):
+        '''
+        Context to run the forward pass (and loss) in
+        '''
+        if self.dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type=self.deviceType, dtype=self.dtype)
+
+    def step(self, loss, optimizer):
+        '''
+        Backward pass and optimizer step, with loss scaling for fp16
+        '''
+        if self.scaler is None:
+            loss.backward()
+            optimizer.step()
+        else:
+            self.scaler.scale(loss).backward()
+            self.scaler.step(optimizer)
+            self.scaler.update()
+
+
 def restructreMatrixBonsaiSeeDot(A, nClasses, nNodes):
     '''
     Restructures a matrix from [nNodes*nClasses, Proj] to
@@ -25,7 +25,8 @@ class Bonsai:
         sigma - tanh non-linearity
         sigmaI - Indicator function for node probabilities
         sigmaI - has to be set to infinity(1e9 for practicality)
-        while doing testing/inference
+        while doing testing/inference, getHardPathScore builds
+        this limit directly
         numClasses will be reset to 1 in binary case
         '''
         self.dataDimension = dataDimension
@@ -129,6 +130,45 @@ class Bonsai:
         self.X_ = X_
         return self.score, self.X_
 
+    def getHardPathScore(self, X):
+        '''
+        Function to build the hard routing inference graph, equivalent to
+        __call__ with sigmaI -> infinity
+        Every data point follows a single root to leaf path using
+        sign(T_i X_) (left child 2i + 1 if positive, else right child 2i + 2)
+        and only the depth + 1 node predictors on that path are evaluated,
+        by gathering the parameters of the current node at every level.
+
+        X is [_, self.dataDimension]
+        Returns the score [numClasses, _] and X_ like __call__
+        '''
+        errmsg = "Dimension Mismatch, X is [_, self.dataDimension]"
+        assert (len(X.shape) == 2 and int(
+            X.shape[1]) == self.dataDimension), errmsg
+
+        X_ = tf.divide(tf.matmul(self.Z, X, transpose_b=True),
+                       self.projectionDimension)
+        # [_, 1, projectionDimension]
+        Xt_ = tf.expand_dims(tf.transpose(X_), 1)
+
+        W_ = tf.reshape(self.W, [self.totalNodes, self.numClasses,
+                                 self.projectionDimension])
+        V_ = tf.reshape(self.V, [self.totalNodes, self.numClasses,
+                                 self.projectionDimension])
+
+        nodeIdx = tf.zeros([tf.shape(X)[0]], dtype=tf.int32)
+        score_ = 0
+        for level in range(self.treeDepth + 1):
+            WX = tf.reduce_sum(tf.gather(W_, nodeIdx) * Xt_, axis=2)
+            VX = tf.reduce_sum(tf.gather(V_, nodeIdx) * Xt_, axis=2)
+            score_ += tf.multiply(WX, tf.tanh(self.sigma * VX))
+            if level < self.treeDepth:
+                TX = tf.reduce_sum(tf.gather(self.T, nodeIdx) *
+                                   tf.squeeze(Xt_, 1), axis=1)
+                nodeIdx = 2 * nodeIdx + 2 - tf.cast(TX > 0, tf.int32)
+
+        return tf.transpose(score_), X_
+
     def getPrediction(self):
         '''
         Takes in a score tensor and outputs a integer class for each data point